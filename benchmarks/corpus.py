@@ -0,0 +1,184 @@
+# benchmarks/corpus.py
+
+"""
+Deterministic synthetic corpus generator.
+
+    python -m benchmarks.corpus ./bench_data --size-mb 50
+
+Produces a mix of .txt/.md prose, .csv tables, .json collections, .jsonl
+logs and .pdf reports. The same seed + size always yields the same bytes,
+so runs are comparable across commits.
+"""
+
+import argparse
+import json
+import os
+import random
+
+FILE_MIX = {        # Share of the total size per file type
+    "txt": 0.30,
+    "md": 0.10,
+    "csv": 0.25,
+    "json": 0.10,
+    "jsonl": 0.20,
+    "pdf": 0.05,
+}
+FILES_PER_TYPE = 8
+SMALL_FILES = 20    # Extra tiny notes that land in the RAM tier
+
+WORDS = (
+    "system revenue region customer invoice shipment latency cluster policy report quarterly "
+    "analysis forecast incident timeout database replica index retrieval embedding vector "
+    "warehouse inventory contract renewal compliance audit budget migration deployment release"
+).split()
+REGIONS = ["EU", "US", "APAC", "LATAM"]
+STATUSES = ["ok", "failed", "retry", "pending"]
+
+def _sentence(rng):
+    words = rng.choices(WORDS, k=rng.randint(8, 18))
+    if rng.random() < 0.2:
+        words.insert(rng.randrange(len(words)), f"ERR-{rng.randint(100, 999)}")
+    return " ".join(words).capitalize() + ". "
+
+def _prose(rng, target_bytes):
+    parts, size = [], 0
+    while size < target_bytes:
+        paragraph = "".join(_sentence(rng) for _ in range(rng.randint(3, 7))) + "\n\n"
+        parts.append(paragraph)
+        size += len(paragraph)
+    return "".join(parts)
+
+def _write_text(path, rng, target_bytes, markdown=False):
+    with open(path, "w", encoding="utf-8") as f:
+        written, section = 0, 1
+        while written < target_bytes:
+            block = (f"## Section {section}\n\n" if markdown else "") + _prose(rng, min(64_000, target_bytes - written))
+            f.write(block)
+            written += len(block)
+            section += 1
+
+def _record(rng, i):
+    return {
+        "id": f"ORD-{i:08d}",
+        "region": rng.choice(REGIONS),
+        "status": rng.choice(STATUSES),
+        "revenue": round(rng.uniform(5, 5000), 2),
+        "customer": f"customer-{rng.randint(1, 5000)}",
+        "details": {"items": rng.randint(1, 20), "priority": rng.choice(["low", "high"])},
+    }
+
+def _write_csv(path, rng, target_bytes):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("order_id,region,status,revenue,customer,items\n")
+        written, i = 0, 0
+        while written < target_bytes:
+            r = _record(rng, i)
+            line = f"{r['id']},{r['region']},{r['status']},{r['revenue']},{r['customer']},{r['details']['items']}\n"
+            f.write(line)
+            written += len(line)
+            i += 1
+
+def _write_jsonl(path, rng, target_bytes):
+    with open(path, "w", encoding="utf-8") as f:
+        written, i = 0, 0
+        while written < target_bytes:
+            line = json.dumps(_record(rng, i)) + "\n"
+            f.write(line)
+            written += len(line)
+            i += 1
+
+def _write_json(path, rng, target_bytes):
+    records, written, i = [], 0, 0
+    while written < target_bytes:
+        r = _record(rng, i)
+        records.append(r)
+        written += len(json.dumps(r)) + 2
+        i += 1
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(records, f)
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path, pages):
+    """
+    Minimal valid PDF writer (Helvetica text only, no dependencies).
+    pages: list of lists of text lines.
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        stream = "BT /F1 10 Tf 12 TL 50 780 Td " + " ".join(f"({_pdf_escape(l)}) '" for l in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+def _write_pdf(path, rng, target_bytes):
+    pages, written = [], 0
+    while written < target_bytes:
+        lines = [_sentence(rng)[:95] for _ in range(60)]
+        pages.append(lines)
+        written += sum(len(l) for l in lines)
+    write_pdf(path, pages)
+
+WRITERS = {
+    "txt": _write_text,
+    "md": lambda path, rng, size: _write_text(path, rng, size, markdown=True),
+    "csv": _write_csv,
+    "json": _write_json,
+    "jsonl": _write_jsonl,
+    "pdf": _write_pdf,
+}
+
+def generate_corpus(out_dir, size_mb=10, seed=42):
+    """
+    Writes the corpus into out_dir and returns {filename: bytes}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    total = int(size_mb * 1024 * 1024)
+    files = {}
+    for ext, share in FILE_MIX.items():
+        per_file = max(1, int(total * share / FILES_PER_TYPE))
+        for i in range(FILES_PER_TYPE):
+            name = f"{ext}_{i:03d}.{ext}"
+            path = os.path.join(out_dir, name)
+            WRITERS[ext](path, rng, per_file)
+            files[name] = os.path.getsize(path)
+    for i in range(SMALL_FILES):
+        name = f"note_{i:03d}.txt"
+        path = os.path.join(out_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(_prose(rng, 600))
+        files[name] = os.path.getsize(path)
+    return files
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic benchmark corpus")
+    parser.add_argument("out_dir")
+    parser.add_argument("--size-mb", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    files = generate_corpus(args.out_dir, args.size_mb, args.seed)
+    print(f"✅ Wrote {len(files)} files ({sum(files.values()) / 1e6:.1f} MB) to {args.out_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,543 @@
+# benchmarks/run_benchmarks.py
+
+"""
+Reproducible performance benchmarks for the ingestion / retrieval / answer path.
+
+    python -m benchmarks.run_benchmarks --size-mb 20 --out results.json
+    python -m benchmarks.run_benchmarks --embedder model      # real MiniLM instead of the hash embedder
+
+Everything runs inside a temporary working directory (the vector DB and the
+caches use relative paths), so your ./database_store is never touched.
+Results are printed and optionally written as JSON for comparison across runs.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.stub_ollama import StubOllamaServer
+
+QUERIES = [
+    "What is the total revenue by region?",
+    "Which incidents mention ERR-404 and a timeout?",
+    "Summarize the migration and deployment policy.",
+    "How many records have status=failed?",
+    "What does the quarterly compliance audit report say about budget?",
+    "Find shipment latency issues in the warehouse cluster.",
+]
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """
+    Deterministic bag-of-words hashing embedder: no model download, stable
+    across machines. Measures the pipeline around the model, not the model.
+    """
+    model_name = "hash-384"
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            v = np.zeros(self.dim, dtype=np.float32)
+            for word in text.lower().split():
+                v[int(hashlib.blake2b(word.encode(), digest_size=4).hexdigest(), 16) % self.dim] += 1.0
+            v /= (np.linalg.norm(v) or 1.0)
+            vectors.append(v)
+        return vectors
+
+    @staticmethod
+    def name():
+        return "hash-384"
+
+    def get_config(self):
+        return {"dim": self.dim}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashEmbeddingFunction(config.get("dim", 384))
+
+def summarize(samples):
+    """Latency summary in milliseconds."""
+    ordered = sorted(samples)
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(pct(50) * 1000, 3),
+        "p95_ms": round(pct(95) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+_engines = 0
+
+def make_engine(embedder, **engine_options):
+    """
+    Fresh VectorEngine in its own sub-directory: Chroma keeps one client per
+    path open for the life of the process, so a wiped path cannot be reused.
+    """
+    global _engines
+    from utils.vector_store import VectorEngine
+    _engines += 1
+    workdir = os.path.abspath(f"engine_{_engines}")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    return VectorEngine(reset_db=True, embedding_fn=embedder, **engine_options)
+
+def fill_engine(engine, size, rng, files=50):
+    """Adds `size` synthetic chunks spread over `files` files."""
+    from benchmarks.corpus import _sentence
+    per_file = max(1, size // files)
+    batch_ids, batch_docs, batch_meta = [], [], []
+    for f in range(files):
+        for i in range(per_file):
+            batch_ids.append(f"file_{f:02d}.txt_{i}")
+            batch_docs.append("".join(_sentence(rng) for _ in range(6)))
+            batch_meta.append({"source": f"file_{f:02d}.txt", "chunk_index": i})
+            if len(batch_ids) >= 1000:
+                engine.add_chunks(batch_ids, batch_docs, batch_meta)
+                batch_ids, batch_docs, batch_meta = [], [], []
+    engine.add_chunks(batch_ids, batch_docs, batch_meta)
+
+def dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, names in os.walk(path) for f in names)
+
+def rss_mb():
+    """Resident memory of this process (Linux only, else None)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+# --- Benchmarks ---
+
+def bench_loading(corpus_dir):
+    from utils.file_loader import read_file_content
+    by_type = {}
+    for name in sorted(os.listdir(corpus_dir)):
+        path = os.path.join(corpus_dir, name)
+        ext = name.rsplit(".", 1)[-1]
+        started = time.perf_counter()
+        content = read_file_content(path)
+        elapsed = time.perf_counter() - started
+        entry = by_type.setdefault(ext, {"files": 0, "bytes": 0, "chars": 0, "seconds": 0.0})
+        entry["files"] += 1
+        entry["bytes"] += os.path.getsize(path)
+        entry["chars"] += len(content)
+        entry["seconds"] += elapsed
+    for entry in by_type.values():
+        entry["seconds"] = round(entry["seconds"], 4)
+        entry["mb_per_sec"] = round(entry["bytes"] / 1e6 / entry["seconds"], 2) if entry["seconds"] else None
+    return by_type
+
+def bench_chunking(corpus_dir):
+    from utils.chunker import intelligent_chunking, intelligent_chunking_stream
+    from utils.file_loader import read_file_content, iter_file_segments
+    paths = [os.path.join(corpus_dir, n) for n in sorted(os.listdir(corpus_dir)) if n.startswith(("txt_", "md_"))]
+    texts = [read_file_content(p) for p in paths]
+    chars = sum(len(t) for t in texts)
+
+    started = time.perf_counter()
+    chunks = sum(len(intelligent_chunking(t)) for t in texts)
+    batch_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    stream_chunks = sum(sum(1 for _ in intelligent_chunking_stream(iter_file_segments(p))) for p in paths)
+    stream_s = time.perf_counter() - started
+    return {
+        "chars": chars,
+        "chunks": chunks,
+        "batch": {"seconds": round(batch_s, 4), "chars_per_sec": round(chars / batch_s)},
+        "streaming": {"seconds": round(stream_s, 4), "chars_per_sec": round(chars / stream_s), "chunks": stream_chunks},
+    }
+
+def bench_embedding(embedder, corpus_dir, limit=2000):
+    from utils.chunker import intelligent_chunking
+    from utils.file_loader import read_file_content
+    texts = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.startswith("txt_"):
+            texts += intelligent_chunking(read_file_content(os.path.join(corpus_dir, name)))
+        if len(texts) >= limit:
+            break
+    texts = texts[:limit]
+    engine = make_engine(embedder)
+
+    started = time.perf_counter()
+    engine.embed(texts)
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    engine.embed(texts)
+    warm = time.perf_counter() - started
+    return {
+        "chunks": len(texts),
+        "cold": {"seconds": round(cold, 4), "chunks_per_sec": round(len(texts) / cold, 1)},
+        "warm_cache": {"seconds": round(warm, 4), "chunks_per_sec": round(len(texts) / warm, 1)},
+        "cache": engine.embedding_cache.stats(),
+    }
+
+def bench_ingestion(embedder, corpus_dir, workers, batch_size):
+    from core.hybrid_manager import HybridContextManager
+    from core.ingestion import IngestionPipeline
+    manager = HybridContextManager(vector_engine=make_engine(embedder))
+    stats = IngestionPipeline(manager, workers=workers, batch_size=batch_size).run(corpus_dir)
+    return manager, stats
+
+def bench_search(embedder, sizes, repeat=5):
+    """
+    Search latency at several index sizes (synthetic chunks, 50 files), with
+    one collection vs SUGGESTED_PARTITIONS. focused_short_rate: share of
+    focused dense searches that returned fewer chunks than requested.
+    """
+    import random
+    from utils.vector_store import SUGGESTED_PARTITIONS
+    results = {}
+    for size in sizes:
+        results[str(size)] = {}
+        for partitions in (1, SUGGESTED_PARTITIONS):
+            engine = make_engine(embedder, partitions=partitions)
+            fill_engine(engine, size, random.Random(7))
+            query_vectors = engine.embed(QUERIES)  # Query embeddings are cached: measure the search itself
+
+            global_samples, focused_samples = [], []
+            for _ in range(repeat):
+                for q in QUERIES:
+                    started = time.perf_counter()
+                    engine.search(q, n_results=5)
+                    global_samples.append(time.perf_counter() - started)
+                    started = time.perf_counter()
+                    engine.search(q, n_results=15, file_filter="file_07.txt")
+                    focused_samples.append(time.perf_counter() - started)
+            expected = min(15, len(engine.get_document_chunks("file_07.txt")))
+            short = sum(1 for qv in query_vectors if len(engine.dense_search(qv, 15, "file_07.txt")) < expected)
+            results[str(size)][f"partitions_{partitions}"] = {
+                "global": summarize(global_samples),
+                "focused": summarize(focused_samples),
+                "focused_short_rate": round(short / len(QUERIES), 3),
+            }
+    return results
+
+def bench_backends(embedder, sizes, k=10, repeat=5):
+    """
+    Dense stores compared on the same chunks: recall@k against exact float32
+    search, query latency (global / one file), insert time, disk and RSS.
+    Lexical fusion is off so only the dense index is measured.
+    """
+    import random
+    backends = {
+        "chroma": {"backend": "chroma"},
+        "numpy-float16": {"backend": "numpy", "numpy_dtype": "float16"},
+        "numpy-int8": {"backend": "numpy", "numpy_dtype": "int8"},
+    }
+    results = {}
+    for size in sizes:
+        results[str(size)] = {}
+        for label, options in backends.items():
+            rss_before = rss_mb()
+            engine = make_engine(embedder, lexical_weight=0, **options)
+            started = time.perf_counter()
+            fill_engine(engine, size, random.Random(7))
+            insert_s = time.perf_counter() - started
+
+            # Ground truth: brute force over the float32 embeddings of everything stored
+            stored = {"ids": [], "documents": []}
+            for partition in engine.partitions:
+                part = partition.get(include=["documents"])
+                stored["ids"] += part["ids"]
+                stored["documents"] += part["documents"]
+            matrix = np.array(engine.embed(stored["documents"]), dtype=np.float32)
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+            query_vectors = engine.embed(QUERIES)
+            recalls, global_samples, focused_samples = [], [], []
+            for q, qv in zip(QUERIES, query_vectors):
+                qv = qv / (np.linalg.norm(qv) or 1.0)
+                truth = {stored["ids"][i] for i in np.argsort(-(matrix @ qv))[:k]}
+                found = [doc_id for doc_id, _, _ in engine.dense_search(qv, k)]
+                recalls.append(len(truth & set(found)) / k)
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    engine.search(q, n_results=k)
+                    global_samples.append(time.perf_counter() - started)
+                    started = time.perf_counter()
+                    engine.search(q, n_results=15, file_filter="file_07.txt")
+                    focused_samples.append(time.perf_counter() - started)
+            engine.save()
+            rss_after = rss_mb()
+            results[str(size)][label] = {
+                f"recall_at_{k}": round(statistics.mean(recalls), 4),
+                "global": summarize(global_samples),
+                "focused": summarize(focused_samples),
+                "insert_seconds": round(insert_s, 3),
+                "disk_mb": round(dir_bytes("database_store") / 1e6, 2),
+                "rss_delta_mb": round(rss_after - rss_before, 1) if rss_before is not None else None,
+            }
+    return results
+
+def fill_topic_engine(engine, files, rng, chunks_per_file=24, sections=3):
+    """
+    Adds `files` files whose sections each keep to their own topic (three
+    words from a shared pool, mixed into the common prose), finishing each
+    file like the ingestion pipeline does. Returns [(source, topic words)].
+    """
+    from benchmarks.corpus import _sentence
+    pool = [f"{a}{b}" for a in ("kor", "vel", "tam", "sur", "mip", "dax", "lun", "bre") for b in range(50)]
+    topics = []
+    for f in range(files):
+        source = f"report_{f:04d}.txt"
+        ids, docs, metas = [], [], []
+        for section in range(sections):
+            topic = rng.sample(pool, 3)
+            topics.append((source, topic))
+            for i in range(section * chunks_per_file // sections, (section + 1) * chunks_per_file // sections):
+                sentences = [_sentence(rng) + " ".join(rng.sample(topic, 2)) + ". " for _ in range(6)]
+                ids.append(f"{source}_{i}")
+                docs.append("".join(sentences))
+                metas.append({"source": source, "chunk_index": i})
+        engine.add_chunks(ids, docs, metas)
+        engine.finish_document(source)
+    return topics
+
+def bench_routing(embedder, file_counts, k=5, queries=60, repeat=3):
+    """
+    Two-stage global search (file routing, then chunks of the picked files)
+    against the flat search over every chunk, on the same engine, per backend.
+    recall_vs_flat: share of the flat top-k also returned by the routed search.
+    target_file_hit: share of queries whose top-k includes the file the
+    question was drawn from. on_topic: share of returned chunks containing
+    all the topic words the question was drawn from.
+    """
+    import random
+    from benchmarks.corpus import WORDS
+    from utils.vector_store import SUGGESTED_ROUTE_FILES
+    results = {}
+    for files in file_counts:
+        results[str(files)] = {}
+        for backend in ("chroma", "numpy"):
+            rng = random.Random(11)
+            engine = make_engine(embedder, backend=backend)
+            topics = fill_topic_engine(engine, files, rng)
+            asked = []
+            for source, topic in rng.sample(topics, min(queries, len(topics))):
+                asked.append((source, topic, " ".join(topic + rng.sample(WORDS, 3)) + "?"))
+            engine.embed([q for _, _, q in asked])  # Query embeddings are cached: measure the search itself
+
+            modes = {}
+            for mode, route_files in (("flat", 0), ("routed", SUGGESTED_ROUTE_FILES)):
+                engine.route_files = route_files
+                engine.search_chunks(asked[0][2], n_results=k)  # The router is built on first use
+                samples = []
+                for _ in range(repeat):
+                    for _, _, q in asked:
+                        started = time.perf_counter()
+                        engine.search_chunks(q, n_results=k)
+                        samples.append(time.perf_counter() - started)
+                modes[mode] = (summarize(samples), [engine.search_chunks(q, n_results=k) for _, _, q in asked])
+
+            overlap = [
+                len({c["id"] for c in routed} & {c["id"] for c in flat}) / max(len(flat), 1)
+                for flat, routed in zip(modes["flat"][1], modes["routed"][1])
+            ]
+            entry = {"chunks": engine.count(), "route_files": SUGGESTED_ROUTE_FILES,
+                     f"recall_vs_flat_at_{k}": round(statistics.mean(overlap), 4)}
+            for mode, (latency, all_hits) in modes.items():
+                target_hit, on_topic = [], []
+                for (source, topic, _), found in zip(asked, all_hits):
+                    target_hit.append(any(c["source"] == source for c in found))
+                    on_topic += [all(word in c["text"] for word in topic) for c in found]
+                entry[mode] = {"latency": latency,
+                               "target_file_hit": round(statistics.mean(target_hit), 4),
+                               "on_topic": round(statistics.mean(on_topic), 4)}
+            results[str(files)][backend] = entry
+    return results
+
+def bench_context(manager, repeat=3):
+    from utils.chunker import estimate_tokens
+    samples, tokens, saved = [], [], []
+    for _ in range(repeat):
+        for q in QUERIES:
+            started = time.perf_counter()
+            context = manager.build_smart_context(q)
+            samples.append(time.perf_counter() - started)
+            tokens.append(estimate_tokens(context))
+            report = manager.last_context_report
+            saved.append(report["compression"]["tokens_saved"] if report else 0)
+    return {"latency": summarize(samples), "mean_tokens": round(statistics.mean(tokens)),
+            "mean_tokens_saved": round(statistics.mean(saved))}
+
+def bench_prompt_cache(manager, repeat=2):
+    """
+    Prompt tokens the LLM has to evaluate per turn, when consecutive questions
+    share the stable part of the prompt (the stub reuses the common prefix like Ollama).
+    """
+    from core.agent import Agent
+    modes = {"global": None, "focus_small": min(manager.small_files, default=None),
+             "focus_large": min(manager.large_files, default=None)}
+    results = {}
+    with StubOllamaServer(latency=0.0, tokens_per_sec=5000) as stub:
+        agent = Agent(model="stub", host=stub.url)
+        for mode, focus in modes.items():
+            if mode != "global" and focus is None:
+                continue
+            first, follow_up, total = None, [], []
+            for turn, q in enumerate(QUERIES * repeat):
+                context, question_context = manager.build_prompt_context(q, focus_file=focus)
+                agent.query(q, context, verbose=False, question_context=question_context)
+                metrics = agent.last_metrics
+                total.append(metrics["prompt_tokens"])
+                if turn == 0:
+                    first = metrics["prompt_eval_count"]
+                else:
+                    follow_up.append(metrics["prompt_eval_count"])
+            results[mode] = {
+                "mean_prompt_tokens": round(statistics.mean(total)),
+                "first_turn_evaluated": first,
+                "follow_up_evaluated_mean": round(statistics.mean(follow_up)),
+            }
+    return results
+
+def bench_summarizer(manager, stub_latency, parallelism):
+    from core.agent import Agent
+    from core.summarizer import DeepSummarizer, SummaryCache
+    target = max(manager.large_files, key=lambda f: len(manager.get_document_text(f) or ""))
+    with StubOllamaServer(latency=stub_latency, tokens_per_sec=2000) as stub:
+        agent = Agent(model="stub", host=stub.url)
+        cache = SummaryCache(path=f"summary_cache_bench_{parallelism}.sqlite3")
+        summarizer = DeepSummarizer(agent, manager=manager, parallelism=parallelism, cache=cache)
+        started = time.perf_counter()
+        summarizer.summarize_file(".", target)
+        cold = time.perf_counter() - started
+        calls = stub.requests
+        started = time.perf_counter()
+        summarizer.summarize_file(".", target)
+        warm = time.perf_counter() - started
+    return {
+        "file": target,
+        "parallelism": parallelism,
+        "stub_latency_s": stub_latency,
+        "llm_calls": calls,
+        "cold_seconds": round(cold, 3),
+        "cached_rerun_seconds": round(warm, 3),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Local File Intelligence benchmarks")
+    parser.add_argument("--size-mb", type=float, default=5, help="Synthetic corpus size")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embedder", choices=["hash", "model"], default="hash")
+    parser.add_argument("--index-sizes", default="1000,10000", help="Comma-separated chunk counts for search")
+    parser.add_argument("--routing-files", default="200,1000", help="Comma-separated file counts for two-stage search")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="Seconds per stub LLM call")
+    parser.add_argument("--parallelism", type=int, default=4, help="DeepSummarizer map concurrency")
+    parser.add_argument("--only", default="", help="Comma-separated subset: loading,chunking,embedding,ingestion,search,backends,routing,context,prompt,summarizer")
+    parser.add_argument("--out", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    selected = set(filter(None, args.only.split(","))) or {
+        "loading", "chunking", "embedding", "ingestion", "search", "backends", "routing", "context", "prompt", "summarizer"
+    }
+    out_path = os.path.abspath(args.out) if args.out else None
+
+    if args.embedder == "model":
+        from chromadb.utils import embedding_functions
+        from utils.vector_store import EMBEDDING_MODEL
+        embedder = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL)
+    else:
+        embedder = HashEmbeddingFunction()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+    results = report["results"]
+
+    with tempfile.TemporaryDirectory(prefix="lfi_bench_") as workdir:
+        os.chdir(workdir)
+        corpus_dir = os.path.join(workdir, "corpus")
+        started = time.perf_counter()
+        files = generate_corpus(corpus_dir, args.size_mb, args.seed)
+        results["corpus"] = {"files": len(files), "bytes": sum(files.values()),
+                             "generate_seconds": round(time.perf_counter() - started, 3)}
+        print(f"📦 Corpus: {len(files)} files, {sum(files.values()) / 1e6:.1f} MB")
+
+        if "loading" in selected:
+            print("⏱️  File loading...")
+            results["loading"] = bench_loading(corpus_dir)
+        if "chunking" in selected:
+            print("⏱️  Chunking...")
+            results["chunking"] = bench_chunking(corpus_dir)
+        if "embedding" in selected:
+            print("⏱️  Embedding...")
+            results["embedding"] = bench_embedding(embedder, corpus_dir)
+        if "search" in selected:
+            print("⏱️  Search...")
+            sizes = [int(s) for s in args.index_sizes.split(",") if s]
+            results["search"] = bench_search(embedder, sizes)
+        if "backends" in selected:
+            print("⏱️  Vector backends (Chroma vs NumPy)...")
+            sizes = [int(s) for s in args.index_sizes.split(",") if s]
+            results["backends"] = bench_backends(embedder, sizes)
+        if "routing" in selected:
+            print("⏱️  Two-stage search (file routing vs flat)...")
+            counts = [int(c) for c in args.routing_files.split(",") if c]
+            results["routing"] = bench_routing(embedder, counts)
+
+        manager = None
+        if selected & {"ingestion", "context", "prompt", "summarizer"}:
+            print("⏱️  Ingestion pipeline...")
+            manager, stats = bench_ingestion(embedder, corpus_dir, args.workers, args.batch_size)
+            results["ingestion"] = stats
+        if "context" in selected:
+            print("⏱️  Context assembly...")
+            results["context"] = bench_context(manager)
+        if "prompt" in selected:
+            print("⏱️  Prompt prefix reuse (stub LLM)...")
+            results["prompt"] = bench_prompt_cache(manager)
+        if "summarizer" in selected and manager.large_files:
+            print("⏱️  Deep summarizer (stub LLM)...")
+            results["summarizer"] = bench_summarizer(manager, args.stub_latency, args.parallelism)
+
+        os.chdir(os.path.dirname(workdir))
+
+    text = json.dumps(report, indent=2)
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"✅ Results written to {out_path}")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# benchmarks/stub_ollama.py
+
+"""
+Local stand-in for the Ollama chat API (POST /api/chat), for benchmarks and
+tests that should not depend on a real model.
+
+    python -m benchmarks.stub_ollama --port 11435 --latency 0.5 --tokens-per-sec 40
+    OLLAMA_HOST=http://127.0.0.1:11435 python main.py --files ./data
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+NS_PER_SEC = 1_000_000_000
+
+class StubOllamaServer:
+    """
+    Answers every chat request with a canned reply after a configurable delay.
+
+    latency:        seconds before the first token (simulates prompt evaluation)
+    tokens_per_sec: generation speed of the streamed reply
+    reply_tokens:   length of each reply in tokens (words)
+
+    Like Ollama, it keeps the previous prompt and reports in prompt_eval_count
+    only the tokens after the prefix shared with it (prompt cache reuse).
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, tokens_per_sec=200.0, reply_tokens=40):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.reply_tokens = reply_tokens
+        self.requests = 0
+        self.keep_alive = None     # As sent with the last request
+        self._last_prompt = ""
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                # Ollama answers "Ollama is running" on / (used as a health check)
+                self._send_json({"status": "Ollama is running"})
+
+            def do_POST(self):
+                if self.path != "/api/chat":
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                server.respond(self, body)
+
+        return Handler
+
+    def _reply_words(self, body):
+        prompt = "".join(f"<{m.get('role')}>{m.get('content', '')}" for m in body.get("messages", []))
+        words = [f"stub-{len(prompt)}"] + ["lorem"] * (self.reply_tokens - 1)
+        with self._lock:
+            shared = len(os.path.commonprefix([prompt, self._last_prompt]))
+            self._last_prompt = prompt
+            self.keep_alive = body.get("keep_alive")
+        return [w + " " for w in words], (len(prompt) - shared) // 4 + 1
+
+    def respond(self, handler, body):
+        started = time.perf_counter()
+        words, prompt_tokens = self._reply_words(body)
+        time.sleep(self.latency)
+        prompt_eval_ns = int((time.perf_counter() - started) * NS_PER_SEC)
+        base = {"model": body.get("model", "stub"), "created_at": "2024-01-01T00:00:00Z"}
+        final = {
+            **base,
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": prompt_eval_ns,
+            "eval_count": len(words),
+            "eval_duration": int(len(words) / self.tokens_per_sec * NS_PER_SEC),
+            "load_duration": 0,
+        }
+
+        if body.get("stream", True):
+            handler.send_response(200)
+            handler.send_header("Content-Type", "application/x-ndjson")
+            handler.end_headers()
+            for word in words:
+                time.sleep(1.0 / self.tokens_per_sec)
+                chunk = {**base, "done": False, "message": {"role": "assistant", "content": word}}
+                handler.wfile.write((json.dumps(chunk) + "\n").encode())
+                handler.wfile.flush()
+            final["message"] = {"role": "assistant", "content": ""}
+            final["total_duration"] = int((time.perf_counter() - started) * NS_PER_SEC)
+            handler.wfile.write((json.dumps(final) + "\n").encode())
+        else:
+            time.sleep(len(words) / self.tokens_per_sec)
+            final["message"] = {"role": "assistant", "content": "".join(words).strip()}
+            final["total_duration"] = int((time.perf_counter() - started) * NS_PER_SEC)
+            handler._send_json(final)
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    args = parser.parse_args()
+
+    server = StubOllamaServer(args.host, args.port, args.latency, args.tokens_per_sec, args.reply_tokens)
+    print(f"🧪 Stub Ollama listening on {server.url} (Ctrl-C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,169 @@
 # core/agent.py
 
-import ollama
-from core.prompt_templates import RAG_SYSTEM_PROMPT
+import threading
+import time
+from core.prompt_templates import RAG_SYSTEM_PROMPT, RAG_QUESTION_PROMPT
+from utils.chunker import estimate_tokens
+from utils.tracing import span
+
+NS_PER_SEC = 1_000_000_000
+KEEP_ALIVE = "30m"   # Keeps the model (and its prompt cache) loaded between questions
+
+def _timing_metrics(response, started, first_token_at=None, prompt_tokens=None):
+    """
+    Turns Ollama's final-response counters (nanoseconds) into a metrics dict.
+    prompt_tokens: Estimated size of the whole prompt. Ollama only counts the
+                   tokens it had to evaluate in prompt_eval_count, so the gap is
+                   the prefix reused from the previous turn.
+    """
+    def seconds(key):
+        value = response.get(key)
+        return round(value / NS_PER_SEC, 3) if value else None
+
+    eval_count = response.get('eval_count') or 0
+    eval_duration = seconds('eval_duration')
+    return {
+        "time_to_first_token": round(first_token_at - started, 3) if first_token_at else None,
+        "total_time": round(time.perf_counter() - started, 3),
+        "prompt_tokens": prompt_tokens,
+        "prompt_eval_count": response.get('prompt_eval_count'),
+        "prompt_eval_duration": seconds('prompt_eval_duration'),
+        "eval_count": eval_count,
+        "eval_duration": eval_duration,
+        "load_duration": seconds('load_duration'),
+        "tokens_per_sec": round(eval_count / eval_duration, 1) if eval_duration else None,
+    }
+
+def _span_metrics(metrics):
+    """Numeric metrics worth aggregating in trace spans."""
+    if not metrics:
+        return {}
+    keys = ("time_to_first_token", "prompt_tokens", "prompt_eval_count", "prompt_eval_duration",
+            "eval_count", "eval_duration")
+    return {k: metrics[k] for k in keys if metrics.get(k) is not None}
+
+def format_metrics(metrics):
+    """One-line human summary of a metrics dict (for the REPL)."""
+    if not metrics:
+        return ""
+    parts = []
+    if metrics.get("time_to_first_token") is not None:
+        parts.append(f"first token {metrics['time_to_first_token']}s")
+    if metrics.get("tokens_per_sec") is not None:
+        parts.append(f"{metrics['tokens_per_sec']} tok/s")
+    if metrics.get("prompt_eval_count") is not None:
+        evaluated = metrics["prompt_eval_count"]
+        if metrics.get("prompt_tokens"):
+            evaluated = f"{evaluated}/~{metrics['prompt_tokens']}"
+        parts.append(f"prompt {evaluated} tok evaluated in {metrics['prompt_eval_duration']}s")
+    if metrics.get("eval_duration") is not None:
+        parts.append(f"generation {metrics['eval_count']} tok in {metrics['eval_duration']}s")
+    parts.append(f"total {metrics['total_time']}s")
+    return "⏱️  " + " · ".join(parts)
 
 class Agent:
-    def __init__(self, model="llama3"):
+    def __init__(self, model="llama3", host=None, keep_alive=KEEP_ALIVE):
+        """
+        host: Ollama server URL (defaults to $OLLAMA_HOST or http://localhost:11434).
+              Point it at a local stub server to test without a real model.
+        keep_alive: How long Ollama keeps the model loaded after a call
+                    (duration string, seconds, or -1 for forever).
+        """
         self.model = model
+        self.host = host
+        self.keep_alive = keep_alive
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._local = threading.local()
 
-    def query(self, user_question, context_text):
+    @property
+    def last_metrics(self):
+        """Timings of the most recent call made by the current thread."""
+        return getattr(self._local, "metrics", None)
+
+    @last_metrics.setter
+    def last_metrics(self, metrics):
+        self._local.metrics = metrics
+
+    @property
+    def client(self):
+        """
+        One shared HTTP client; safe to use from several threads at once.
+        Created on first use so importing ollama does not delay startup.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import ollama
+                    self._client = ollama.Client(host=self.host)
+        return self._client
+
+    def _messages(self, user_question, context_text, question_context=""):
+        """
+        Stable context (instructions, pinned files) in the system message, so
+        consecutive prompts share it as a prefix; per-question context goes
+        in the user message, after it.
+        """
+        full_prompt = RAG_SYSTEM_PROMPT.format(context_data=context_text)
+        if question_context:
+            user_question = RAG_QUESTION_PROMPT.format(question_context=question_context, question=user_question)
+        return [
+            {'role': 'system', 'content': full_prompt},
+            {'role': 'user', 'content': user_question},
+        ]
+
+    def query(self, user_question, context_text, verbose=True, question_context=""):
         """
         Pure RAG: Sends context + question to LLM and returns the text response.
+        question_context: Context specific to this question (see _messages).
         """
-        
+
         # 1. Build the prompt
-        full_prompt = RAG_SYSTEM_PROMPT.format(context_data=context_text)
-        
-        print("🤔 AI Thinking...")
-        
+        messages = self._messages(user_question, context_text, question_context)
+        prompt_tokens = sum(estimate_tokens(m['content']) for m in messages)
+        self.last_metrics = None
+
+        if verbose:
+            print("🤔 AI Thinking...")
+
         # 2. Call Ollama
-        try:
-            response = ollama.chat(model=self.model, messages=[
-                {'role': 'system', 'content': full_prompt},
-                {'role': 'user', 'content': user_question},
-            ])
-            
-            # 3. Return the text directly
-            return f"🤖 AI:\n{response['message']['content']}"
-            
-        except Exception as e:
-            return f"❌ Error communicating with Ollama: {e}"
\ No newline at end of file
+        with span("llm.query", prompt_chars=sum(len(m['content']) for m in messages)) as s:
+            try:
+                started = time.perf_counter()
+                response = self.client.chat(model=self.model, messages=messages, keep_alive=self.keep_alive)
+                self.last_metrics = _timing_metrics(response, started, prompt_tokens=prompt_tokens)
+                s.set(**_span_metrics(self.last_metrics))
+
+                # 3. Return the text directly
+                return f"🤖 AI:\n{response['message']['content']}"
+
+            except Exception as e:
+                s.set(failed=1)
+                return f"❌ Error communicating with Ollama: {e}"
+
+    def query_stream(self, user_question, context_text, question_context=""):
+        """
+        Streaming RAG: Same prompt as query(), but yields the answer piece by
+        piece as the model generates it. Timings land in self.last_metrics
+        once the generator is exhausted.
+        """
+        messages = self._messages(user_question, context_text, question_context)
+        prompt_tokens = sum(estimate_tokens(m['content']) for m in messages)
+        self.last_metrics = None
+        started = time.perf_counter()
+        first_token_at = None
+        with span("llm.query_stream", prompt_chars=sum(len(m['content']) for m in messages)) as s:
+            try:
+                for chunk in self.client.chat(model=self.model, messages=messages, stream=True,
+                                              keep_alive=self.keep_alive):
+                    piece = chunk['message']['content']
+                    if piece:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        yield piece
+                    if chunk.get('done'):
+                        self.last_metrics = _timing_metrics(chunk, started, first_token_at, prompt_tokens)
+                        s.set(**_span_metrics(self.last_metrics))
+            except Exception as e:
+                s.set(failed=1)
+                yield f"❌ Error communicating with Ollama: {e}"
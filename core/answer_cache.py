@@ -0,0 +1,93 @@
+# core/answer_cache.py
+
+import re
+import threading
+from collections import OrderedDict
+from utils.context_packer import cosine_scores
+
+ANSWER_CACHE_MAX_ENTRIES = 256
+ANSWER_SIMILARITY_THRESHOLD = 0.95   # Cosine similarity of question embeddings
+
+_WORD = re.compile(r"\w(?:[\w.\-/@]*\w)?")
+_QUOTED = re.compile(r'"([^"]+)"|`([^`]+)`')
+
+def question_keys(question):
+    """
+    The parts of a question that change what it asks while barely moving its
+    embedding ("revenue 2023" vs "revenue 2024", "invoice 1041" vs "1042"):
+    numbers, codes and file names, quoted text and capitalized names, lowercased.
+    """
+    keys = {a or b for a, b in _QUOTED.findall(question)}
+    sentence_start = True
+    for match in _WORD.finditer(question):
+        word = match.group()
+        if any(c.isdigit() or c in "._-/@" for c in word) or any(c.isupper() for c in word[1:]) \
+                or (word[0].isupper() and len(word) > 1 and not sentence_start):
+            keys.add(word)
+        sentence_start = question[match.end():match.end() + 1] in (".", "?", "!", ":")
+    return frozenset(key.lower() for key in keys)
+
+class AnswerCache:
+    """
+    Semantic cache for (context + LLM) answers.
+
+    An answer is reused when a new question is a near-duplicate of a cached one
+    (embedding similarity >= threshold) with the same numbers, codes and names
+    (question_keys), asked with the same focus file, and the corpus has not
+    changed since (same index generation).
+    """
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES, threshold=ANSWER_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.entries = OrderedDict()   # {entry_id: {focus, keys, vector, question, answer}} (LRU order)
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _check_generation(self, generation):
+        # Any corpus change invalidates every cached answer
+        if generation != self.generation:
+            self.entries.clear()
+            self.generation = generation
+
+    def lookup(self, question, question_vector, focus_file, generation):
+        """Returns (answer, cached_question) or None."""
+        keys = question_keys(question)
+        with self._lock:
+            self._check_generation(generation)
+            candidates = [(eid, e) for eid, e in self.entries.items() if e["focus"] == focus_file and e["keys"] == keys]
+            if candidates:
+                scores = cosine_scores(question_vector, [e["vector"] for _, e in candidates])
+                best = max(range(len(scores)), key=scores.__getitem__)
+                if scores[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self.entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry["answer"], entry["question"]
+            self.misses += 1
+            return None
+
+    def store(self, question, question_vector, focus_file, generation, answer):
+        with self._lock:
+            self._check_generation(generation)
+            self.entries[self._next_id] = {
+                "focus": focus_file,
+                "keys": question_keys(question),
+                "vector": question_vector,
+                "question": question,
+                "answer": answer,
+            }
+            self._next_id += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,206 @@
+# core/batch.py
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from utils.tracing import span
+
+DEFAULT_CONCURRENCY = 4    # LLM calls in flight (Ollama queues the rest anyway: see OLLAMA_NUM_PARALLEL)
+RETRIEVAL_GROUP = 32       # Questions embedded + searched together
+
+def read_questions(path):
+    """
+    Questions from a JSONL file, one object per line:
+        {"id": "q1", "question": "...", "focus": "report.pdf"}
+    "id" defaults to the line number and "focus" is optional.
+    A bare string line is a question with no focus.
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_no}: invalid JSON ({e})") from None
+            if isinstance(item, str):
+                item = {"question": item}
+            if not isinstance(item, dict) or not item.get("question"):
+                raise ValueError(f"{path}:{line_no}: expected an object with a \"question\"")
+            questions.append({
+                "id": str(item.get("id", line_no)),
+                "question": item["question"],
+                "focus": item.get("focus"),
+            })
+    return questions
+
+def completed_ids(output_path):
+    """
+    Ids already answered in an existing output file (resume). Failed records
+    do not count, so they are retried; a line cut off by a crash is ignored.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and "error" not in record:
+                done.add(str(record.get("id")))
+    return done
+
+class BatchRunner:
+    """
+    Answers a file of questions without the REPL.
+
+    Questions are handled in groups: each group is embedded in one batch and
+    searched with multi-query calls (HybridContextManager.retrieve_many),
+    then its LLM calls run in a thread pool with at most `concurrency` in
+    flight while the next group is retrieved. Each result is appended to the
+    output JSONL as soon as it finishes, so an interrupted run is resumed by
+    running the same command again (answered ids are skipped; for an id that
+    failed before, the last record wins).
+    """
+    def __init__(self, service, concurrency=DEFAULT_CONCURRENCY, group_size=RETRIEVAL_GROUP):
+        self.service = service
+        self.concurrency = max(1, concurrency)
+        self.group_size = max(1, group_size)
+
+    def run(self, questions_path, output_path, on_result=None):
+        """
+        on_result: Optional callable(record) for progress output.
+        Returns a stats dict (questions, skipped, answered, cached, failed, seconds).
+        """
+        on_result = on_result or (lambda record: None)
+        questions = read_questions(questions_path)
+        done = completed_ids(output_path)
+        todo = [q for q in questions if q["id"] not in done]
+        stats = {"questions": len(questions), "skipped": len(questions) - len(todo),
+                 "answered": 0, "cached": 0, "failed": 0}
+        start = time.perf_counter()
+
+        with open(output_path, "a", encoding="utf-8") as out, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            in_flight = set()
+
+            def write(futures):
+                for future in futures:
+                    record = future.result()
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    if "error" in record:
+                        stats["failed"] += 1
+                    else:
+                        stats["answered"] += 1
+                        stats["cached"] += record["cached"]
+                    on_result(record)
+
+            try:
+                for i in range(0, len(todo), self.group_size):
+                    for job in self._prepare(todo[i:i + self.group_size]):
+                        # Bounded: keep a few prepared prompts ahead of the LLM, not the whole file
+                        while len(in_flight) >= self.concurrency * 2:
+                            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                            write(finished)
+                        in_flight.add(pool.submit(self._answer, job))
+                    finished = {f for f in in_flight if f.done()}
+                    in_flight -= finished
+                    write(finished)
+                while in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    write(finished)
+            except KeyboardInterrupt:
+                # Results written so far are kept; the next run picks up the rest
+                for future in in_flight:
+                    future.cancel()
+                raise
+
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        return stats
+
+    def _prepare(self, group):
+        """Retrieval + context building for a group of questions (calling thread)."""
+        service = self.service
+        manager = service.manager
+        jobs = []
+        for item in group:
+            job = dict(item)
+            if item["focus"] and not service.is_loaded(item["focus"]):
+                # Same lookup as the REPL's :focus (a partial name is enough)
+                job["focus"] = service.resolve(item["focus"]) or item["focus"]
+                if not service.is_loaded(job["focus"]):
+                    job["error"] = f"File '{item['focus']}' is not loaded."
+            jobs.append(job)
+        ready = [job for job in jobs if "error" not in job]
+
+        started = time.perf_counter()
+        with span("batch.retrieve", questions=len(ready)):
+            vectors = manager.vector_engine.embed([job["question"] for job in ready]) if manager.vector_ready else None
+            generation = manager.generation
+            to_search = []
+            for i, job in enumerate(ready):
+                job["vector"] = vectors[i] if vectors is not None else None
+                cached = None
+                if job["vector"] is not None:
+                    cached = service.answer_cache.lookup(job["question"], job["vector"], job["focus"], generation)
+                if cached:
+                    job["answer"], job["cached_question"] = cached
+                else:
+                    to_search.append(job)
+            found = manager.retrieve_many([(job["question"], job["focus"]) for job in to_search])
+        # The shared searches are charged evenly to the questions that used them
+        retrieval_share = (time.perf_counter() - started) / max(len(ready), 1)
+
+        for job, chunks in zip(to_search, found):
+            context_started = time.perf_counter()
+            job["generation"] = generation
+            job["context"] = manager.build_prompt_context(job["question"], focus_file=job["focus"], retrieved=chunks)
+            report = manager.last_context_report
+            job["sources"] = [entry["label"] for entry in report["included"]] if report else [job["focus"]]
+            job["retrieval_s"] = retrieval_share + time.perf_counter() - context_started
+        for job in ready:
+            job.setdefault("retrieval_s", retrieval_share)
+            job["ready_at"] = time.perf_counter()
+        return jobs
+
+    def _answer(self, job):
+        """LLM call for one prepared question (worker thread). Returns its output record."""
+        record = {"id": job["id"], "question": job["question"], "focus": job["focus"]}
+        if "error" in job:
+            record["error"] = job["error"]
+            return record
+
+        llm_started = time.perf_counter()
+        metrics = None
+        if "answer" in job:
+            answer = job["answer"]
+        else:
+            agent = self.service.agent
+            context, question_context = job["context"]
+            answer = agent.query(job["question"], context, verbose=False, question_context=question_context)
+            metrics = agent.last_metrics
+            if metrics is None:  # Only set once the model answered
+                record["error"] = answer.removeprefix("❌ ")
+                return record
+            if job["vector"] is not None:
+                self.service.answer_cache.store(job["question"], job["vector"], job["focus"], job["generation"], answer)
+
+        record.update({
+            "answer": answer.removeprefix("🤖 AI:\n"),
+            "sources": job.get("sources", []),
+            "cached": "answer" in job,
+            "timings": {
+                "retrieval": round(job["retrieval_s"], 3),
+                "queued": round(llm_started - job["ready_at"], 3),   # Waiting for a free LLM slot
+                "llm": round(time.perf_counter() - llm_started, 3),
+            },
+            "metrics": metrics,
+        })
+        return record
@@ -0,0 +1,71 @@
+# core/client.py
+
+import json
+import urllib.error
+import urllib.request
+
+class RAGClient:
+    """
+    Thin client for the RAGServer API (used by the CLI).
+    Errors reported by the server are raised as RuntimeError.
+    """
+    def __init__(self, url, timeout=None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout   # None: a deep summary may take minutes
+
+    def _request(self, method, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(
+            self.url + path, data=data, method=method,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", str(e))
+            except ValueError:
+                message = str(e)
+            raise RuntimeError(message) from None
+
+    def _json(self, method, path, payload=None):
+        with self._request(method, path, payload) as response:
+            return json.loads(response.read())
+
+    def is_up(self):
+        try:
+            self.status()
+            return True
+        except (OSError, RuntimeError):
+            return False
+
+    def status(self):
+        return self._json("GET", "/status")
+
+    def files(self):
+        return self._json("GET", "/files")
+
+    def stats(self):
+        return self._json("GET", "/stats")
+
+    def resolve(self, name):
+        return self._json("POST", "/resolve", {"name": name})["file"]
+
+    def deep_summary(self, filename):
+        return self._json("POST", "/deep", {"file": filename})["summary"]
+
+    def reindex(self):
+        return self._json("POST", "/reindex", {})["started"]
+
+    def ask(self, question, focus=None):
+        """
+        Yields the server's answer events (see RAGService.ask) as they arrive.
+        Closing the generator drops the connection, which stops generation.
+        """
+        response = self._request("POST", "/query", {"question": question, "focus": focus})
+        try:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            response.close()
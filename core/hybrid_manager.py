@@ -1,94 +1,474 @@
 # core/hybrid_manager.py
 
-from utils.chunker import intelligent_chunking
-from utils.vector_store import VectorEngine
+import threading
+from utils.chunker import intelligent_chunking_spans, stitch_chunks, estimate_tokens, CHUNK_SIZE, CHUNK_OVERLAP
+from utils.context_packer import ContextPacker, cosine_scores, CONTEXT_TOKEN_BUDGET
+from utils.context_compressor import merge_adjacent_chunks, span_label, suppress_near_duplicates, compression_report
+from utils.index_manifest import IndexManifest
+from utils.tabular_store import TabularStore, load_table, is_tabular
+from utils.tracing import span
+from utils.vector_store import VectorEngine, EMBEDDING_MODEL, DB_PATH, VECTOR_BACKEND, NUMPY_DTYPE, VECTOR_PARTITIONS, ROUTE_FILES
 
 SIZE_THRESHOLD = 4000 
+STABLE_CONTEXT_SHARE = 0.5   # Max share of the budget pinned to small files in every global prompt
+EXCERPT_CONTEXT_SHARE = 0.25 # Max share of the budget one excerpt (run of merged chunks) may take
 
 class HybridContextManager:
-    def __init__(self):
-        self.vector_engine = VectorEngine(reset_db=True)
+    def __init__(self, persistent=False, context_token_budget=CONTEXT_TOKEN_BUDGET, vector_engine=None,
+                 vector_backend=VECTOR_BACKEND, numpy_dtype=NUMPY_DTYPE, partitions=VECTOR_PARTITIONS,
+                 route_files=ROUTE_FILES):
+        """
+        persistent=False: Wipes the vector DB and indexes everything from scratch.
+        persistent=True:  Keeps the vector DB + a manifest, and only re-embeds
+                          files that are new or changed since the last run.
+        context_token_budget: Max (estimated) tokens of file content per prompt.
+        vector_engine: Optional pre-built VectorEngine (benchmarks, tests).
+                       By default it is built on first use (see vector_engine).
+        vector_backend / numpy_dtype: Dense storage of the default engine
+                       ("chroma", or "numpy" with "float16"/"int8" vectors).
+        partitions: Collections the vector tier is split over, by file
+                       (see utils.vector_store.VECTOR_PARTITIONS).
+        route_files: Global questions search the chunks of this many best-matching
+                       files only (see utils.vector_store.ROUTE_FILES; 0 = all chunks).
+        """
+        self.persistent = persistent
+        self.context_token_budget = context_token_budget
+        self._local = threading.local()  # Per-thread state: requests may run concurrently
+        self._vector_engine = vector_engine
+        self.vector_backend = vector_backend
+        self.numpy_dtype = numpy_dtype
+        self.partitions = max(1, partitions)
+        self.route_files = route_files
+        self._engine_lock = threading.Lock()
         # CHANGED: Store small files individually instead of one big string
         self.small_files = {}   # {filename: full_content}
         self.large_files = []   # List of filenames in Vector DB
+        self.chunk_counts = {}  # {filename: chunks stored in the Vector DB}
+        # Columnar copies of CSV/JSON collections for exact aggregates
+        self.tabular = TabularStore()
+        # Bumped on every corpus change; caches keyed on it go stale automatically
+        self.generation = 0
+
+        self.manifest = None
+        if persistent:
+            self.manifest = IndexManifest(DB_PATH, {
+                "chunk_size": CHUNK_SIZE,
+                "chunk_overlap": CHUNK_OVERLAP,
+                "embedding_model": EMBEDDING_MODEL,
+                # Switching stores means re-adding every file to the new one
+                "vector_backend": vector_backend if vector_backend != "numpy" else f"numpy-{numpy_dtype}",
+                "vector_partitions": self.partitions,
+                # Chunks are spans of the stored file text, not copies of it
+                "chunk_storage": "spans",
+            })
+
+    @property
+    def vector_engine(self):
+        """
+        The VectorEngine, built on first access. Building it imports Chroma and
+        loads the embedding model (seconds), so the indexing thread does it
+        while the REPL already answers from RAM files.
+        """
+        if self._vector_engine is None:
+            with self._engine_lock:
+                if self._vector_engine is None:
+                    self._vector_engine = VectorEngine(
+                        reset_db=not self.persistent, backend=self.vector_backend, numpy_dtype=self.numpy_dtype,
+                        partitions=self.partitions, route_files=self.route_files,
+                    )
+        return self._vector_engine
+
+    @property
+    def last_context_report(self):
+        """Packing report of the last context built by the current thread."""
+        return getattr(self._local, "context_report", None)
+
+    @last_context_report.setter
+    def last_context_report(self, report):
+        self._local.context_report = report
+
+    @property
+    def vector_ready(self):
+        """True once the engine exists (using it will not block on model loading)."""
+        return self._vector_engine is not None
+
+    def restore_if_unchanged(self, filename, file_path):
+        """
+        Persistent mode only: If a vector-indexed file is unchanged on disk,
+        re-register it without parsing, chunking or embedding it again.
+        Returns a status string, or None if the file must be (re)processed.
+        """
+        if not self.manifest or not self.manifest.is_fresh(filename, file_path):
+            return None
+        entry = self.manifest.get(filename)
+        if entry["tier"] != "vector":
+            return None  # Small files are cheap and need their text in RAM anyway
+        if filename not in self.large_files:
+            self.large_files.append(filename)
+        self.chunk_counts[filename] = entry["chunk_count"]
+        self.load_table(filename, file_path)
+        self.generation += 1
+        return f"VECTOR (cached, {entry['chunk_count']} chunks)"
+
+    def _stored_chunk_count(self, filename):
+        """Chunks of this file in the vector DB (this session, else the previous run)."""
+        if filename in self.chunk_counts:
+            return self.chunk_counts[filename]
+        entry = self.manifest.get(filename) if self.manifest else None
+        if entry and entry.get("tier") == "vector":
+            return entry.get("chunk_count", 0)
+        return 0
+
+    def _drop_stale_chunks(self, filename):
+        """Deletes the chunks stored for this file, if any."""
+        chunk_count = self._stored_chunk_count(filename)
+        self.chunk_counts.pop(filename, None)
+        if chunk_count:
+            self.vector_engine.delete_document(filename, chunk_count)
+
+    def load_table(self, filename, file_path):
+        """Loads a CSV/JSON collection into the columnar store (no-op for other files)."""
+        if not file_path or not is_tabular(filename):
+            return
+        try:
+            df = load_table(file_path)
+        except Exception as e:
+            print(f"   ⚠️ Warning: No analytics for {filename} ({e}).")
+            return
+        if df is not None:
+            self.add_table(filename, df)
 
-    def process_and_index(self, filename, content):
+    def add_table(self, filename, df):
+        self.tabular.add(filename, df)
+
+    def process_and_index(self, filename, content, file_path=None):
+        self.load_table(filename, file_path)
         if len(content) < SIZE_THRESHOLD:
-            # Store in RAM dictionary
-            self.small_files[filename] = content
-            return "RAM (Small)"
+            return self.add_small_file(filename, content, file_path)
         else:
             # Index in Vector DB
-            chunks = intelligent_chunking(content)
-            self.vector_engine.add_document(filename, chunks)
+            spans = intelligent_chunking_spans(content)
+            revision = self.vector_engine.add_document(
+                filename, [chunk for _, _, chunk in spans], spans=[(a, b) for a, b, _ in spans], text=content,
+            )
+            return self.finish_vector_file(filename, len(spans), file_path, revision=revision)
+
+    def add_small_file(self, filename, content, file_path=None, state=None):
+        """state: The file's index_manifest.file_state from before it was read, if known."""
+        # Store in RAM dictionary
+        self.small_files[filename] = content
+        # May have shrunk below the threshold: the RAM copy is live before the chunks go
+        if filename in self.large_files:
+            self.large_files.remove(filename)
+        self._drop_stale_chunks(filename)
+        self.generation += 1
+        if self.manifest:
+            self.manifest.record(filename, file_path, "ram", state=state)
+        return "RAM (Small)"
+
+    def finish_vector_file(self, filename, chunk_count, file_path=None, revision=None, state=None):
+        """
+        Call once ALL chunks of the file are in the vector DB.
+        Chunk ids are deterministic, so a re-indexed file overwrote its old
+        chunks in place; only a tail left over from a longer version is deleted.
+        revision: The stored text revision the chunks point into (older ones go).
+        state: The file's index_manifest.file_state from before it was read, if known.
+        """
+        stale_count = self._stored_chunk_count(filename)
+        if stale_count > chunk_count:
+            self.vector_engine.delete_document(filename, stale_count, start=chunk_count)
+        self.vector_engine.finish_document(filename, revision)
+        self.chunk_counts[filename] = chunk_count
+        if filename not in self.large_files:
             self.large_files.append(filename)
-            return f"VECTOR ({len(chunks)} chunks)"
+        self.small_files.pop(filename, None)  # May have grown past the threshold
+        self.generation += 1
+        if self.manifest:
+            self.manifest.record(filename, file_path, "vector", chunk_count, state=state)
+        return f"VECTOR ({chunk_count} chunks)"
+
+    def remove_file(self, filename):
+        """Forgets a file everywhere (RAM, vector DB, tables, manifest). Returns False if unknown."""
+        known = (filename in self.small_files or filename in self.large_files
+                 or filename in self.chunk_counts or bool(self.manifest and self.manifest.get(filename)))
+        self.small_files.pop(filename, None)
+        if filename in self.large_files:
+            self.large_files.remove(filename)
+        self.tabular.remove(filename)
+        self._drop_stale_chunks(filename)
+        if self.manifest:
+            self.manifest.remove(filename)
+        if known:
+            self.generation += 1
+        return known
+
+    def prune_removed_files(self):
+        """
+        Persistent mode only: Forgets files that were indexed in a previous run
+        but are no longer loaded (deleted, renamed or now unreadable).
+        Returns the list of removed filenames.
+        """
+        if not self.manifest:
+            return []
+        loaded = set(self.small_files) | set(self.large_files)
+        removed = [f for f in self.manifest.entries if f not in loaded]
+        for filename in removed:
+            self._drop_stale_chunks(filename)
+            self.manifest.remove(filename)
+        if removed:
+            self.generation += 1
+        return removed
+
+    def save(self):
+        """Persists the manifest (persistent mode) and the lexical index."""
+        if self.manifest:
+            self.manifest.save()
+        self.vector_engine.save()
+
+    def get_document_text(self, filename):
+        """
+        Returns the full text of a loaded file without touching the disk:
+        RAM files directly, vector files from the document store. If the text
+        was not stored, it is stitched back from the chunks (close to the
+        original; see stitch_chunks).
+        Returns None if the file is not loaded.
+        """
+        if filename in self.small_files:
+            return self.small_files[filename]
+        if filename in self.large_files:
+            text = self.vector_engine.get_document_text(filename)
+            if text is not None:
+                return text
+            return stitch_chunks(self.vector_engine.get_document_chunks(filename)) or None
+        return None
 
     def list_files(self):
         """Returns a list of all loaded files and their status."""
         files = []
-        for f in self.small_files:
+        for f in list(self.small_files):
             files.append(f"{f} (RAM)")
-        for f in self.large_files:
+        for f in list(self.large_files):
             files.append(f"{f} (Vector DB)")
         return files
 
-    def build_smart_context(self, user_query, focus_file=None):
+    def _score_candidates(self, user_query, candidates):
+        """
+        Sets each candidate's relevance. Excerpts keep the fused dense + BM25
+        score of their search (so exact-id hits found by BM25 only rank as
+        high as the search put them). Files and tables are scored by cosine
+        similarity between the query and their text (embeddings come from the
+        cache after the first time); files named in the query get a bonus so
+        they are packed first. Before the embedding model is loaded, only the
+        bonuses apply to them.
+        """
+        others = [c for c in candidates if c["kind"] != "excerpt"]
+        if not others:
+            return
+        if self.vector_ready:
+            query_vector = self.vector_engine.embed([user_query])[0]
+            similarities = cosine_scores(query_vector, self.vector_engine.embed([c["text"] for c in others]))
+        else:
+            similarities = [0.0] * len(others)
+        for cand, score in zip(others, similarities):
+            if cand["kind"] == "file" and cand["label"].lower() in user_query.lower():
+                score += 1.0
+            cand["score"] = score + cand.get("boost", 0.0)
+
+    def _pack(self, user_query, candidates):
+        """
+        Scores candidates, drops excerpts repeating the text of a better one
+        (MMR) and keeps the most relevant candidates within the token budget.
+        Whole files and computed table results are never dropped as duplicates.
+        """
+        self._score_candidates(user_query, candidates)
+        kept, duplicates = suppress_near_duplicates([c for c in candidates if c["kind"] == "excerpt"])
+        kept_ids = {id(c) for c in kept}
+        kept = [c for c in candidates if c["kind"] != "excerpt" or id(c) in kept_ids]
+        included, report = ContextPacker(self.context_token_budget).pack(kept)
+        report["compression"] = compression_report(candidates, duplicates)
+        self.last_context_report = report
+        return included
+
+    def _excerpt_candidates(self, chunks):
+        """
+        Retrieved chunks as excerpt candidates; neighbours in a file become one
+        span, split up so no excerpt takes more than EXCERPT_CONTEXT_SHARE of the budget.
+        """
+        read_span = self.vector_engine.read_span if self.vector_ready else None
+        max_tokens = int(self.context_token_budget * EXCERPT_CONTEXT_SHARE)
+        return [
+            {"kind": "excerpt", "label": span_label(span), "text": span["text"], "score": span["score"],
+             "chunks": span["chunks"], "raw_tokens": span["raw_tokens"],
+             "protected": span["lexical_rank"] == 0}  # BM25's best hit: the exact id / code asked for
+            for span in merge_adjacent_chunks(chunks, read_span=read_span, max_tokens=max_tokens)
+        ]
+
+    def _search_request(self, user_query, focus_file):
+        """
+        (n_results, file_filter) of the vector search a question needs,
+        or None if its context comes from RAM files / tables only.
+        """
+        if focus_file:
+            if focus_file in self.tabular and self.tabular.is_analytic(focus_file, user_query):
+                return None
+            if focus_file in self.small_files or focus_file not in self.large_files:
+                return None
+            # Retrieve MORE chunks (top-15) since we are focused on this alone
+            return 15, focus_file
+        if not (self.large_files and self.vector_ready):
+            return None
+        # Detect intent for specific large file (implicit focus)
+        for fname in list(self.large_files):
+            if fname.lower() in user_query.lower():
+                return 10, fname
+        return 5, None
+
+    def _retrieve(self, user_query, request, retrieved):
+        if retrieved is not None:
+            return retrieved
+        if request is None:
+            return []  # The file changed tier since the request was made
+        n_results, file_filter = request
+        return self.vector_engine.search_chunks(user_query, n_results=n_results, file_filter=file_filter)
+
+    def retrieve_many(self, questions):
+        """
+        Runs the vector searches of many questions at once, grouped by search
+        (one embedding batch + one multi-query call per group).
+        questions: [(user_query, focus_file)].
+        Returns one chunk list per question, for build_smart_context(retrieved=...).
+        """
+        results = [[] for _ in questions]
+        groups = {}
+        for i, (user_query, focus_file) in enumerate(questions):
+            request = self._search_request(user_query, focus_file)
+            if request:
+                groups.setdefault(request, []).append(i)
+        for (n_results, file_filter), indexes in groups.items():
+            found = self.vector_engine.search_chunks_many(
+                [questions[i][0] for i in indexes], n_results=n_results, file_filter=file_filter,
+            )
+            for i, chunks in zip(indexes, found):
+                results[i] = chunks
+        return results
+
+    def build_smart_context(self, user_query, focus_file=None, retrieved=None):
         """
         Constructs context. 
         If focus_file is set, ONLY uses that file.
-        If focus_file is None, uses ALL small files + Vector Search on large files.
+        If focus_file is None, uses small files + Vector Search on large files,
+        packed by relevance into self.context_token_budget tokens.
+        retrieved: Chunks already found by retrieve_many (skips the search).
+        The packing decisions are kept in self.last_context_report.
+        """
+        stable, question_context = self.build_prompt_context(user_query, focus_file, retrieved)
+        return stable + question_context
+
+    def build_prompt_context(self, user_query, focus_file=None, retrieved=None):
+        """
+        Same context as build_smart_context, split in two for the prompt:
+        (stable, question_context). The stable part only changes when the
+        files do (focused file, pinned small files in name order), so it can
+        stay in the system prompt that Ollama reuses from the previous turn;
+        the question_context (excerpts, computed results) follows it.
         """
+        with span("context.build", focused=focus_file is not None) as s:
+            stable, question_context = self._build_context(user_query, focus_file, retrieved)
+            report = self.last_context_report
+            s.set(chars=len(stable) + len(question_context),
+                  tokens=estimate_tokens(stable + question_context), stable_tokens=estimate_tokens(stable),
+                  tokens_saved=report["compression"]["tokens_saved"] if report else 0)
+        return stable, question_context
+
+    def _pinned_files(self):
+        """
+        Small files sent with every global question, in name order, when they
+        all fit in STABLE_CONTEXT_SHARE of the budget. Otherwise [] and small
+        files compete with excerpts for the budget, question by question.
+        """
+        files = sorted(self.small_files.items())  # Snapshot: indexing may be adding files
+        tokens = sum(estimate_tokens(content) for _, content in files)
+        if tokens > self.context_token_budget * STABLE_CONTEXT_SHARE:
+            return []
+        return files
+
+    def _build_context(self, user_query, focus_file, retrieved=None):
         combined_context = ""
+        self.last_context_report = None
+        request = self._search_request(user_query, focus_file)
         
         # --- MODE A: FOCUSED ON ONE FILE ---
         if focus_file:
+            # Case 0: Aggregate question on a table -> Exact result (+ the rows if the file is small)
+            computed = self.tabular.answer(focus_file, user_query) if focus_file in self.tabular else None
+            if computed:
+                computed = f"=== 📊 COMPUTED FROM THE FULL TABLE ===\n{computed}"
+                return f"=== 🔒 FOCUSED MODE: {focus_file} ===\n{self.small_files.get(focus_file, '')}", computed
+
             # Case 1: It's a small file -> Return full content
             if focus_file in self.small_files:
                 content = self.small_files[focus_file]
-                return f"=== 🔒 FOCUSED MODE: {focus_file} ===\n{content}"
+                return f"=== 🔒 FOCUSED MODE: {focus_file} ===\n{content}", ""
             
             # Case 2: It's a large file -> Strict Vector Search
             elif focus_file in self.large_files:
-                # Retrieve MORE chunks (top-15) since we are focused on this alone
-                retrieved_chunks = self.vector_engine.search(
-                    user_query, 
-                    n_results=15, 
-                    file_filter=focus_file
-                )
-                if retrieved_chunks:
-                    combined_context = f"=== 🔒 FOCUSED MODE: {focus_file} (Top Excerpts) ===\n"
-                    for i, chunk in enumerate(retrieved_chunks):
-                        combined_context += f"\n--- Excerpt {i+1} ---\n{chunk}\n"
-                return combined_context
+                retrieved_chunks = self._retrieve(user_query, request, retrieved)
+                excerpts = self._pack(user_query, self._excerpt_candidates(retrieved_chunks))
+                if not excerpts:
+                    return "", ""
+                # Same header as the other focused cases: it is the stable part of the prompt
+                combined_context = "=== 🔍 TOP EXCERPTS ===\n"
+                for i, excerpt in enumerate(excerpts):
+                    combined_context += f"\n--- Excerpt {i+1} ---\n{excerpt['text']}\n"
+                return f"=== 🔒 FOCUSED MODE: {focus_file} ===\n", combined_context
             
             else:
-                return "❌ Error: Focused file not found in index."
+                return "❌ Error: Focused file not found in index.", ""
 
         # --- MODE B: GLOBAL (HYBRID) ---
         else:
-            # 1. Add ALL Small Files
-            for fname, content in self.small_files.items():
-                combined_context += f"\n{'='*20}\n📄 FILE: {fname}\n{'='*20}\n{content}\n"
+            # 0. Candidates: Exact results computed over relevant tables
+            candidates = []
+            for fname in self.tabular.relevant_tables(user_query):
+                computed = self.tabular.answer(fname, user_query)
+                if computed:
+                    candidates.append({"kind": "table", "label": fname, "text": computed, "boost": 2.0})
+
+            # 1. Candidates: Small Files (pinned ones always go in, in a fixed order)
+            pinned = self._pinned_files()
+            if pinned:
+                candidates += [
+                    {"kind": "file", "label": fname, "text": content, "pinned": True}
+                    for fname, content in pinned
+                ]
+            else:
+                candidates += [
+                    {"kind": "file", "label": fname, "text": content}
+                    for fname, content in list(self.small_files.items())
+                ]
             
-            # 2. Vector Search (Hybrid Router logic)
-            if self.large_files:
-                # Detect intent for specific large file (implicit focus)
-                target_file = None
-                for fname in self.large_files:
-                    if fname.lower() in user_query.lower():
-                        target_file = fname
-                        break
-                
-                # Search
-                if target_file:
-                    retrieved_chunks = self.vector_engine.search(user_query, n_results=10, file_filter=target_file)
-                else:
-                    retrieved_chunks = self.vector_engine.search(user_query, n_results=5)
-
-                if retrieved_chunks:
-                    combined_context += "\n\n=== 🔍 RELEVANT EXCERPTS FROM LARGE DOCUMENTS ===\n"
-                    for i, chunk in enumerate(retrieved_chunks):
-                        combined_context += f"\n--- Excerpt {i+1} ---\n{chunk}\n"
-
-        return combined_context
\ No newline at end of file
+            # 2. Candidates: Vector Search (Hybrid Router logic)
+            if request:
+                retrieved_chunks = self._retrieve(user_query, request, retrieved)
+                candidates += self._excerpt_candidates(retrieved_chunks)
+
+            # 3. Pack by relevance within the token budget
+            included = self._pack(user_query, candidates)
+            stable_context = ""
+            for cand in included:
+                if cand.get("pinned"):
+                    stable_context += f"\n{'='*20}\n📄 FILE: {cand['label']}\n{'='*20}\n{cand['text']}\n"
+            for cand in included:
+                if cand["kind"] == "table":
+                    combined_context += f"\n=== 📊 COMPUTED FROM FULL TABLE: {cand['label']} ===\n{cand['text']}\n"
+            for cand in included:
+                if cand["kind"] == "file" and not cand.get("pinned"):
+                    combined_context += f"\n{'='*20}\n📄 FILE: {cand['label']}\n{'='*20}\n{cand['text']}\n"
+
+            excerpts = [c for c in included if c["kind"] == "excerpt"]
+            if excerpts:
+                combined_context += "\n\n=== 🔍 RELEVANT EXCERPTS FROM LARGE DOCUMENTS ===\n"
+                for i, excerpt in enumerate(excerpts):
+                    combined_context += f"\n--- Excerpt {i+1} ---\n{excerpt['text']}\n"
+
+        return stable_context, combined_context
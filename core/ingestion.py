@@ -0,0 +1,407 @@
+# core/ingestion.py
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from core.hybrid_manager import SIZE_THRESHOLD
+from utils.chunker import intelligent_chunking_stream_spans
+from utils.file_loader import iter_file_segments, scan_directory
+from utils.index_manifest import file_state
+from utils.tabular_store import batch_frame, table_from_batches, is_tabular
+from utils.vector_store import chunk_records
+
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Leave one core for the embedder
+DEFAULT_BATCH_SIZE = 256    # Chunks per embedding call (across files)
+DEFAULT_QUEUE_DEPTH = 16    # Messages (small files / chunk batches) waiting for the embedder
+
+# Workers are spawned, not forked: indexing runs next to other threads (REPL,
+# model loading) and forking a multi-threaded process can deadlock the child
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+def parse_and_chunk(filename, file_path, out, batch_size):
+    """
+    Worker task (runs in a child process): stream one file into `out`.
+
+    Messages:
+        ("rows",   filename, dataframe or None)           (CSV/JSON collections, repeated)
+        ("small",  filename, file_path, content, state)
+        ("chunks", filename, start_index, [(start, end, chunk), ...], text)   (repeated)
+        ("done",   filename, file_path, chunk_count, state)
+        ("error",  filename, message)
+
+    Large files are read segment by segment and chunked on the fly, so a
+    worker never holds more than one segment + one chunk batch in memory.
+    `text` is the file text read since the previous "chunks" message: the
+    consumer stores it once, and each chunk as its (start, end) span in it.
+    Record collections also send their rows batch by batch, as they are
+    parsed for the text, and the consumer builds the analytics table.
+    `state` is the file's size / mtime / hash taken before reading it, for
+    the manifest (see index_manifest.file_state).
+    """
+    sent = 0
+    on_rows = None
+    if is_tabular(filename):
+        failed = []
+        def on_rows(batch):
+            if failed:
+                return
+            try:
+                df = batch_frame(batch)
+            except Exception:
+                # Analytics are optional: None tells the consumer to build no table
+                failed.append(True)
+                out.put(("rows", filename, None))
+                return
+            if df is not None:
+                out.put(("rows", filename, df))
+    try:
+        state = file_state(file_path)
+        segments = iter_file_segments(file_path, on_rows=on_rows)
+
+        # Read just enough to decide between RAM and vector tier
+        head, head_len = [], 0
+        for segment in segments:
+            head.append(segment)
+            head_len += len(segment)
+            if head_len >= SIZE_THRESHOLD:
+                break
+        else:
+            content = "".join(head)
+            if not content:
+                out.put(("error", filename, "Empty or unsupported file"))
+            else:
+                out.put(("small", filename, file_path, content, state))
+            return
+
+        batch, read = [], []
+        for chunk in intelligent_chunking_stream_spans(_chain(head, segments, read)):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                out.put(("chunks", filename, sent, batch, "".join(read)))
+                sent += len(batch)
+                batch = []
+                read.clear()
+        if batch or read:
+            out.put(("chunks", filename, sent, batch, "".join(read)))
+            sent += len(batch)
+        out.put(("done", filename, file_path, sent, state))
+    except Exception as e:
+        out.put(("error", filename, str(e)))
+
+def _chain(head, rest, read):
+    """The file's segments in order; each one is also added to `read` when consumed."""
+    for segment in head:
+        read.append(segment)
+        yield segment
+    for segment in rest:
+        read.append(segment)
+        yield segment
+
+class IngestionPipeline:
+    """
+    Parallel, pipelined ingestion:
+
+        [process pool: stream-parse + chunk] --> bounded queue --> [embedder: cross-file batches]
+
+    Parsing and embedding overlap. Workers push chunk batches as they go and
+    the queue is bounded, so peak memory scales with batch size x queue depth,
+    not with the size of the files.
+    """
+    def __init__(self, manager, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE,
+                 queue_depth=DEFAULT_QUEUE_DEPTH, scan_options=None):
+        """scan_options: include, exclude, max_size, recursive (see utils.file_loader.iter_directory)."""
+        self.manager = manager
+        self.scan_options = scan_options or {}
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.queue_depth = max(1, queue_depth)
+        # {filename: {"state": queued|indexing|done|skipped, "chunks": embedded so far}}
+        self.progress = {}
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """Stops submitting files; files already being parsed are drained and dropped."""
+        self.cancelled.set()
+
+    def run(self, directory_path, on_file=None, files=None):
+        """
+        Ingests every file in directory_path into the manager.
+        on_file: Optional callable(filename, status) for progress output.
+        files: Optional (filename, file_path) pairs to ingest instead of the
+               whole directory (e.g. only the files a watcher saw change).
+        Returns a stats dict (files, chunks, seconds, files/sec, chunks/sec).
+        Errors while storing (e.g. a failing embedder) are raised once the
+        workers have stopped.
+        """
+        on_file = on_file or (lambda filename, status: None)
+        start = time.perf_counter()
+        stats = {"files": 0, "reused": 0, "skipped": 0, "chunks": 0, "batches": 0}
+
+        todo = []
+        if files is None:
+            files = scan_directory(directory_path, **self.scan_options)
+        for filename, file_path in files:
+            try:
+                status = self.manager.restore_if_unchanged(filename, file_path)
+                size = None if status else os.path.getsize(file_path)
+            except OSError:
+                # Deleted since the scan (routine in watch mode): forget it, keep indexing the rest
+                self.progress.pop(filename, None)
+                if self.manager.remove_file(filename):
+                    on_file(filename, "🗑️ Removed from index")
+                continue
+            if status:
+                stats["reused"] += 1
+                self.progress[filename] = {"state": "done", "chunks": 0}
+                on_file(filename, f"♻️ {status}")
+            else:
+                self.progress[filename] = {"state": "queued", "chunks": 0}
+                todo.append((size, filename, file_path))
+
+        # Smallest first: RAM-tier files become answerable within the first moments
+        todo.sort(key=lambda item: item[0])
+        todo = [(filename, file_path) for _, filename, file_path in todo]
+
+        # A single worker would only add process start-up cost: use a thread
+        if self.workers > 1:
+            mp_manager = _MP_CONTEXT.Manager()
+            results = mp_manager.Queue(maxsize=self.queue_depth)
+        else:
+            mp_manager = None
+            results = queue.Queue(maxsize=self.queue_depth)
+
+        producer = threading.Thread(target=self._produce, args=(todo, results), daemon=True)
+        producer.start()
+        try:
+            self._consume(results, stats, on_file)
+        except BaseException:
+            # Workers block on the full queue (and the producer on them)
+            # until it is drained: stop submitting, drain, then re-raise
+            self.cancel()
+            self._drain(results, producer)
+            raise
+        finally:
+            producer.join()
+            if mp_manager:
+                mp_manager.shutdown()
+
+        elapsed = time.perf_counter() - start
+        stats["seconds"] = round(elapsed, 3)
+        stats["files_per_sec"] = round(stats["files"] / elapsed, 2) if elapsed else 0.0
+        stats["chunks_per_sec"] = round(stats["chunks"] / elapsed, 2) if elapsed else 0.0
+        return stats
+
+    def _produce(self, todo, results):
+        """Keeps the pool busy with at most workers + queue_depth files in flight."""
+        try:
+            if self.workers > 1:
+                pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_MP_CONTEXT)
+            else:
+                pool = ThreadPoolExecutor(max_workers=1)
+            max_in_flight = self.workers + self.queue_depth
+            with pool:
+                todo_iter = iter(todo)
+                in_flight = set()
+                while True:
+                    for filename, file_path in todo_iter:
+                        if self.cancelled.is_set():
+                            break
+                        in_flight.add(pool.submit(parse_and_chunk, filename, file_path, results, self.batch_size))
+                        if len(in_flight) >= max_in_flight:
+                            break
+                    if not in_flight:
+                        break
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if not future.cancelled():
+                            future.result()  # Surface worker crashes (not per-file errors)
+                    if self.cancelled.is_set():
+                        for future in in_flight:
+                            future.cancel()  # Not started yet
+            results.put(("all_done",))
+        except BaseException as e:
+            results.put(("crash", repr(e)))
+
+    @staticmethod
+    def _drain(results, producer):
+        """Discards messages until the producer has finished (it ends with all_done / crash)."""
+        while producer.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def _consume(self, results, stats, on_file):
+        """Routes small files to RAM, embeds chunks of large files in batches."""
+        pending = {"ids": [], "chunks": [], "metadatas": []}
+        waiting = []        # [(filename, file_path, chunk_count, revision, state)] complete but not yet flushed
+        received = {}       # {filename: chunks received so far} for files in progress
+        revisions = {}      # {filename: revision of its text being stored} for files in progress
+        tables = {}         # {filename: [row batches]} of record collections in progress
+        while True:
+            message = results.get()
+            kind = message[0]
+
+            if kind == "all_done":
+                break
+            if kind == "crash":
+                raise RuntimeError(f"Ingestion worker crashed: {message[1]}")
+            if self.cancelled.is_set():
+                continue  # Drain so blocked workers can finish, but store nothing
+
+            if kind == "rows":
+                _, filename, df = message
+                tables.setdefault(filename, []).append(df)
+
+            elif kind == "small":
+                _, filename, file_path, content, state = message
+                self._add_table(filename, tables.pop(filename, None))
+                stats["files"] += 1
+                self.progress[filename]["state"] = "done"
+                on_file(filename, self.manager.add_small_file(filename, content, file_path, state=state))
+
+            elif kind == "chunks":
+                _, filename, start_index, spans, text = message
+                documents = self.manager.vector_engine.documents
+                if filename not in revisions:
+                    self.progress[filename]["state"] = "indexing"
+                    revisions[filename] = documents.begin(filename)
+                documents.append(filename, revisions[filename], text)
+                ids, metadatas = chunk_records(filename, len(spans), start=start_index,
+                                               spans=[(a, b) for a, b, _ in spans], revision=revisions[filename])
+                chunks = [chunk for _, _, chunk in spans]
+                pending["ids"] += ids
+                pending["chunks"] += chunks
+                pending["metadatas"] += metadatas
+                received[filename] = start_index + len(chunks)
+                stats["chunks"] += len(chunks)
+                if len(pending["ids"]) >= self.batch_size:
+                    self._flush(pending, waiting, stats, on_file)
+
+            elif kind == "done":
+                _, filename, file_path, chunk_count, state = message
+                self._add_table(filename, tables.pop(filename, None))
+                received.pop(filename, None)
+                stats["files"] += 1
+                waiting.append((filename, file_path, chunk_count, revisions.pop(filename, None), state))
+
+            elif kind == "error":
+                _, filename, error = message
+                tables.pop(filename, None)
+                stats["skipped"] += 1
+                self.progress[filename] = {"state": "skipped", "chunks": 0}
+                if revisions.pop(filename, None) is not None:
+                    self.manager.vector_engine.documents.delete(filename)  # Text stored so far
+                self._discard(filename, received.pop(filename, 0), pending, stats)
+                self.manager.remove_file(filename)  # Its previous version, if any, is gone too
+                on_file(filename, f"❌ Skipped ({error})")
+
+        if not self.cancelled.is_set():
+            self._flush(pending, waiting, stats, on_file)
+
+    def _add_table(self, filename, frames):
+        if not frames or any(df is None for df in frames):
+            return  # Not a record collection, or a batch could not be read
+        try:
+            df = table_from_batches(frames)
+        except Exception as e:
+            print(f"   ⚠️ Warning: No analytics for {filename} ({e}).")
+            return
+        if df is not None:
+            self.manager.add_table(filename, df)
+
+    def _discard(self, filename, chunk_count, pending, stats):
+        """Drops the chunks of a file that failed halfway through parsing."""
+        if not chunk_count:
+            return
+        keep = [i for i, meta in enumerate(pending["metadatas"]) if meta["source"] != filename]
+        for key in pending:
+            pending[key] = [pending[key][i] for i in keep]
+        self.manager.vector_engine.delete_document(filename, chunk_count)
+        stats["chunks"] -= chunk_count
+
+    def _flush(self, pending, waiting, stats, on_file):
+        """Embeds + stores the pending batch, then finalizes files it completed."""
+        ids = pending["ids"]
+        for i in range(0, len(ids), self.batch_size):
+            self.manager.vector_engine.add_chunks(
+                ids[i:i + self.batch_size],
+                pending["chunks"][i:i + self.batch_size],
+                pending["metadatas"][i:i + self.batch_size],
+            )
+            stats["batches"] += 1
+        for meta in pending["metadatas"]:
+            self.progress[meta["source"]]["chunks"] += 1
+        for key in pending:
+            pending[key] = []
+
+        for filename, file_path, chunk_count, revision, state in waiting:
+            self.progress[filename]["state"] = "done"
+            on_file(filename, self.manager.finish_vector_file(filename, chunk_count, file_path,
+                                                              revision=revision, state=state))
+        waiting.clear()
+
+class BackgroundIndexer:
+    """
+    Runs an IngestionPipeline in a daemon thread, so the REPL can take
+    questions while files are still being parsed and embedded.
+
+    RAM-tier files become answerable as soon as they are parsed; vector files
+    once all their chunks are stored. `progress` mirrors the pipeline's
+    per-file state, `done` is set when indexing (and saving) has finished.
+    """
+    def __init__(self, pipeline, directory_path, on_file=None):
+        self.pipeline = pipeline
+        self.directory_path = directory_path
+        self.on_file = on_file
+        self.done = threading.Event()
+        self.stats = None
+        self.removed = []
+        self.error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def progress(self):
+        return self.pipeline.progress
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def stop(self, timeout=None):
+        """Cancels indexing and waits for the files being parsed to drain."""
+        self.pipeline.cancel()
+        self._thread.join(timeout)
+
+    def _run(self):
+        manager = self.pipeline.manager
+        # Load the embedding model while the workers parse, not after the first batch
+        warm_up = threading.Thread(target=lambda: manager.vector_engine, daemon=True)
+        warm_up.start()
+        try:
+            self.stats = self.pipeline.run(self.directory_path, on_file=self.on_file)
+            warm_up.join()
+            if self.pipeline.cancelled.is_set():
+                manager.save()  # Keep what finished; do not prune files never reached
+                return
+            self.removed = manager.prune_removed_files()
+            manager.save()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def summary(self):
+        """'12/40 files indexed, 3,456 chunks embedded' while running."""
+        states = list(self.progress.values())
+        finished = sum(1 for p in states if p["state"] in ("done", "skipped"))
+        chunks = sum(p["chunks"] for p in states)
+        return f"{finished}/{len(states)} files indexed, {chunks:,} chunks embedded"
+
@@ -19,4 +19,37 @@ Your job is to analyze the provided file contents and answer user questions with
 
 ### 📂 CONTEXT FROM FILES:
 {context_data}
-"""
\ No newline at end of file
+"""
+
+# Per-question context goes in the user message, after the system prompt above,
+# so the system prompt stays byte-identical across turns and Ollama can reuse
+# its evaluated prefix instead of re-reading every file on each question.
+RAG_QUESTION_PROMPT = """### 🔍 CONTEXT FOR THIS QUESTION:
+{question_context}
+
+### ❓ QUESTION:
+{question}"""
+
+# --- Deep Summarizer (Map-Reduce) ---
+# Bump when any prompt below changes: cached summaries are keyed on it.
+SUMMARY_PROMPT_VERSION = 1
+
+MAP_SUMMARY_PROMPT = (
+    "Summarize the following text section concisely. "
+    "Capture key dates, facts, and definitions. Ignore filler text.\n\n"
+    "TEXT:\n{text}"
+)
+
+MERGE_SUMMARY_PROMPT = (
+    "You are provided with summaries of consecutive sections of a large document. "
+    "Merge them into one concise summary that keeps every key date, fact, and definition. "
+    "Do not add an introduction or conclusion.\n\n"
+    "SECTION SUMMARIES:\n{summaries}"
+)
+
+FINAL_SUMMARY_PROMPT = (
+    "You are provided with summaries of every section of a large document. "
+    "Synthesize these into a coherent, structured Executive Summary. "
+    "Use headers and bullet points.\n\n"
+    "SECTION SUMMARIES:\n{summaries}"
+)
@@ -0,0 +1,328 @@
+# core/server.py
+
+import json
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from core.agent import Agent, KEEP_ALIVE
+from core.answer_cache import AnswerCache
+from core.hybrid_manager import HybridContextManager
+from core.ingestion import IngestionPipeline, BackgroundIndexer, DEFAULT_WORKERS, DEFAULT_BATCH_SIZE, DEFAULT_QUEUE_DEPTH
+from core.summarizer import DeepSummarizer
+from core.watcher import DirectoryWatcher, POLL_INTERVAL
+from utils.tracing import TRACER
+from utils.vector_store import VECTOR_BACKEND, NUMPY_DTYPE, VECTOR_PARTITIONS, ROUTE_FILES
+
+DEFAULT_HOST = "127.0.0.1"   # Local only: the API has no authentication
+DEFAULT_PORT = 8765
+MAX_CHANGES = 200            # Watch-mode log lines kept for /status
+
+class RAGService:
+    """
+    The resident part of the app: manager (RAM files + vector index),
+    agent, summarizer and caches, loaded once and shared by every request.
+
+    All operations are safe to call from several threads at once. There is
+    no per-connection state: the focus file is passed with each question.
+    """
+    def __init__(self, directory, persistent=False, model="llama3", ollama_host=None,
+                 workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, queue_depth=DEFAULT_QUEUE_DEPTH,
+                 scan_options=None, vector_backend=VECTOR_BACKEND, numpy_dtype=NUMPY_DTYPE,
+                 partitions=VECTOR_PARTITIONS, route_files=ROUTE_FILES,
+                 keep_alive=KEEP_ALIVE):
+        """
+        scan_options: include, exclude, max_size, recursive (see utils.file_loader.iter_directory).
+        vector_backend / numpy_dtype: Dense storage (see utils.vector_store.VECTOR_BACKENDS).
+        partitions: Collections the vector tier is split over (1 = one collection).
+        route_files: Files a global question's chunk search is narrowed to (0 = all).
+        keep_alive: How long Ollama keeps the model loaded between questions.
+        """
+        self.directory = directory
+        self.scan_options = scan_options or {}
+        self.manager = HybridContextManager(persistent=persistent, vector_backend=vector_backend, numpy_dtype=numpy_dtype,
+                                            partitions=partitions, route_files=route_files)
+        self.agent = Agent(model=model, host=ollama_host, keep_alive=keep_alive)
+        self.summarizer = DeepSummarizer(self.agent, manager=self.manager)
+        self.answer_cache = AnswerCache()
+        self.pipeline_options = {
+            "workers": workers, "batch_size": batch_size, "queue_depth": queue_depth,
+            "scan_options": self.scan_options,
+        }
+        self.indexer = None
+        self.watcher = None
+        self.changes = deque(maxlen=MAX_CHANGES)   # [(seq, line)] applied by the watcher
+        self._change_seq = 0
+        self._on_change = None
+        self._index_lock = threading.Lock()
+
+    # --- Indexing ---
+
+    def reindex(self, on_file=None):
+        """
+        Starts (re)indexing the directory in the background. Unchanged files
+        are reused in persistent mode; other files are parsed again and hit
+        the embedding cache. Returns False if indexing is already running.
+        """
+        with self._index_lock:
+            if self.indexer and not self.indexer.done.is_set():
+                return False
+            pipeline = IngestionPipeline(self.manager, **self.pipeline_options)
+            self.indexer = BackgroundIndexer(pipeline, self.directory, on_file=on_file).start()
+            return True
+
+    def stop(self):
+        if self.watcher:
+            self.watcher.stop()
+        if self.indexer and not self.indexer.done.is_set():
+            self.indexer.stop()
+
+    def start_watching(self, interval=POLL_INTERVAL, on_change=None):
+        """
+        Keeps the index in sync with the directory: added/modified files are
+        re-parsed and their chunks replaced, deleted files are dropped.
+        on_change: Optional callable(line) for each applied change.
+        """
+        self._on_change = on_change
+        self.watcher = DirectoryWatcher(self.directory, self._apply_changes, interval, self.scan_options).start()
+        return self.watcher
+
+    def _apply_changes(self, changed, deleted):
+        """Watcher callback. Queries keep running meanwhile; each file switches over once indexed."""
+        with self._index_lock:
+            if self.indexer and not self.indexer.done.is_set():
+                return False  # The full run sees the same files; retry once it is done
+            if changed:
+                pipeline = IngestionPipeline(self.manager, **{**self.pipeline_options, "workers": 1})
+                try:
+                    pipeline.run(self.directory, on_file=self._log_change, files=changed)
+                except Exception as e:
+                    # Reported, not retried on every poll: the next edit (or :reindex) tries again
+                    for filename, _ in changed:
+                        self._log_change(filename, f"❌ Re-indexing failed ({e})")
+            for filename in deleted:
+                if self.manager.remove_file(filename):
+                    self._log_change(filename, "🗑️ Removed from index")
+            if self.manager.persistent:
+                self.manager.save()
+            return True
+
+    def _log_change(self, filename, status):
+        line = f"   🔄 {filename:<30} → {status}"
+        self._change_seq += 1
+        self.changes.append((self._change_seq, line))
+        if self._on_change:
+            self._on_change(line)
+
+    def status(self):
+        indexer = self.indexer
+        indexing = bool(indexer) and not indexer.done.is_set()
+        return {
+            "indexing": indexing,
+            "progress": indexer.summary() if indexer else None,
+            "report": self.indexing_report() if indexer and not indexing else None,
+            "watching": self.watcher.backend if self.watcher else None,
+            "changes": list(self.changes),
+        }
+
+    def indexing_report(self):
+        """Outcome of the last indexing run, as display lines."""
+        indexer = self.indexer
+        if indexer.error:
+            return [f"❌ Indexing failed: {indexer.error}"]
+        lines = [f"   🗑️  {filename:<30} → Removed from index" for filename in indexer.removed]
+        lines += [f"   ❌ Skipped {f}" for f, p in indexer.progress.items() if p["state"] == "skipped"]
+        stats = indexer.stats
+        lines.append(
+            f"✅ Indexing complete: {stats['files']} files, {stats['chunks']} chunks in {stats['seconds']}s "
+            f"({stats['files_per_sec']} files/s, {stats['chunks_per_sec']} chunks/s)"
+        )
+        if self.manager.vector_ready:
+            cache = self.manager.vector_engine.embedding_cache.stats()
+            lines.append(f"   🧮 Embedding cache: {cache['hits']} hits, {cache['misses']} misses ({cache['entries']} stored)")
+        if not self.manager.list_files():
+            lines.append("❌ No valid files found.")
+        return lines
+
+    def files(self):
+        progress = {}
+        if self.indexer and not self.indexer.done.is_set():
+            progress = {f: dict(p) for f, p in list(self.indexer.progress.items()) if p["state"] in ("queued", "indexing")}
+        return {"files": self.manager.list_files(), "pending": progress}
+
+    def is_loaded(self, filename):
+        return filename in self.manager.small_files or filename in self.manager.large_files
+
+    def resolve(self, name):
+        """First loaded file whose name contains `name` (case-insensitive), or None."""
+        all_files = list(self.manager.small_files) + list(self.manager.large_files)
+        return next((f for f in all_files if name.lower() in f.lower()), None)
+
+    # --- Questions ---
+
+    def ask(self, question, focus=None):
+        """
+        Answers a question, yielding events as they happen:
+            {"event": "cached",  "answer": ..., "question": similar cached question}
+            {"event": "context", "report": packing report or None}
+            {"event": "token",   "text": ...}                      (repeated)
+            {"event": "done",    "metrics": ..., "completed": bool}
+            {"event": "error",   "message": ...}
+        Closing the generator early stops the LLM call.
+        """
+        if focus and not self.is_loaded(focus):
+            yield {"event": "error", "message": f"File '{focus}' is not loaded."}
+            return
+
+        # Answer cache: skipped until the embedding model is loaded, so early questions never wait on it
+        manager = self.manager
+        question_vector = manager.vector_engine.embed([question])[0] if manager.vector_ready else None
+        if question_vector is not None:
+            cached = self.answer_cache.lookup(question, question_vector, focus, manager.generation)
+            if cached:
+                answer, cached_question = cached
+                yield {"event": "cached", "answer": answer, "question": cached_question}
+                return
+
+        generation = manager.generation
+        context, question_context = manager.build_prompt_context(question, focus_file=focus)
+        yield {"event": "context", "report": manager.last_context_report}
+
+        pieces = []
+        tokens = self.agent.query_stream(question, context, question_context)
+        try:
+            for piece in tokens:
+                pieces.append(piece)
+                yield {"event": "token", "text": piece}
+        finally:
+            tokens.close()
+
+        metrics = self.agent.last_metrics
+        completed = metrics is not None  # Only set once the model finished
+        if completed and question_vector is not None:
+            self.answer_cache.store(question, question_vector, focus, generation, "🤖 AI:\n" + "".join(pieces))
+        yield {"event": "done", "metrics": metrics, "completed": completed}
+
+    def deep_summary(self, filename):
+        return self.summarizer.summarize_file(self.directory, filename)
+
+    def stats(self):
+        result = {"answer_cache": self.answer_cache.stats(), "tracing": TRACER.enabled}
+        if self.manager.vector_ready:
+            result["embedding_cache"] = self.manager.vector_engine.embedding_cache.stats()
+        if TRACER.enabled:
+            result["trace"] = TRACER.stats()
+        return result
+
+class RAGServer:
+    """
+    Local HTTP/JSON API over a RAGService (one thread per request).
+
+        GET  /status    indexing state (+ final report once done, watch-mode changes)
+        GET  /files     loaded files + files still being indexed
+        GET  /stats     cache hit rates (+ stage timings with --trace)
+        POST /resolve   {"name"}               -> {"file"}
+        POST /query     {"question", "focus"}  -> NDJSON event stream (see RAGService.ask)
+        POST /deep      {"file"}               -> {"summary"}
+        POST /reindex                          -> {"started"}
+    """
+    def __init__(self, service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.service = service
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serves from a background thread (embedded in the CLI, tests)."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler_class(self):
+        service = self.service
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                try:
+                    if self.path == "/status":
+                        self._send_json(service.status())
+                    elif self.path == "/files":
+                        self._send_json(service.files())
+                    elif self.path == "/stats":
+                        self._send_json(service.stats())
+                    else:
+                        self._send_json({"error": f"Unknown endpoint {self.path}"}, 404)
+                except Exception as e:
+                    self._send_json({"error": str(e)}, 500)
+
+            def do_POST(self):
+                try:
+                    body = self._body()
+                except ValueError:
+                    self._send_json({"error": "Request body must be JSON."}, 400)
+                    return
+                try:
+                    if self.path == "/query":
+                        if not body.get("question"):
+                            self._send_json({"error": "Missing 'question'."}, 400)
+                        else:
+                            self._stream(service.ask(body["question"], body.get("focus")))
+                    elif self.path == "/resolve":
+                        self._send_json({"file": service.resolve(body.get("name", ""))})
+                    elif self.path == "/deep":
+                        filename = body.get("file")
+                        if not filename or not service.is_loaded(filename):
+                            self._send_json({"error": f"File '{filename}' is not loaded."}, 404)
+                        else:
+                            self._send_json({"summary": service.deep_summary(filename)})
+                    elif self.path == "/reindex":
+                        self._send_json({"started": service.reindex()})
+                    else:
+                        self._send_json({"error": f"Unknown endpoint {self.path}"}, 404)
+                except Exception as e:
+                    self._send_json({"error": str(e)}, 500)
+
+            def _stream(self, events):
+                """NDJSON, one event per line, flushed as produced (HTTP/1.0: ends on close)."""
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                try:
+                    for event in events:
+                        self.wfile.write((json.dumps(event) + "\n").encode())
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client stopped reading (Ctrl-C): drop the rest of the answer
+                except Exception as e:
+                    self.wfile.write((json.dumps({"event": "error", "message": str(e)}) + "\n").encode())
+                finally:
+                    events.close()
+
+        return Handler
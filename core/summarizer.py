@@ -1,63 +1,207 @@
 # core/summarizer.py
 
+import hashlib
 import os
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from core.prompt_templates import (
+    MAP_SUMMARY_PROMPT, MERGE_SUMMARY_PROMPT, FINAL_SUMMARY_PROMPT, SUMMARY_PROMPT_VERSION
+)
+from utils.chunker import estimate_tokens
 from utils.file_loader import read_file_content
 
+MAP_PARALLELISM = 4          # Concurrent LLM calls (match OLLAMA_NUM_PARALLEL on the server)
+REDUCE_TOKEN_BUDGET = 6000   # Max tokens of summaries fed into a single reduce prompt
+SUMMARY_CACHE_PATH = "./summary_cache.sqlite3"
+
+class SummaryCache:
+    """
+    Persists every LLM summary as soon as it is generated.
+
+    Key: (sha256(prompt), model, SUMMARY_PROMPT_VERSION). The prompt embeds the
+    section text, so an unchanged section is never summarized twice, and an
+    interrupted :deep run resumes from the sections it already finished.
+    """
+    def __init__(self, path=SUMMARY_CACHE_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " key TEXT NOT NULL, model TEXT NOT NULL, prompt_version INTEGER NOT NULL,"
+            " summary TEXT NOT NULL, PRIMARY KEY (key, model, prompt_version))"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def key(prompt):
+        return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+    def get(self, prompt, model):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT summary FROM summaries WHERE key = ? AND model = ? AND prompt_version = ?",
+                (self.key(prompt), model, SUMMARY_PROMPT_VERSION),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, prompt, model, summary):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+                (self.key(prompt), model, SUMMARY_PROMPT_VERSION, summary),
+            )
+            self._db.commit()  # Commit per section: this is what makes runs resumable
+
 class DeepSummarizer:
-    def __init__(self, agent):
+    def __init__(self, agent, manager=None, parallelism=MAP_PARALLELISM,
+                 reduce_token_budget=REDUCE_TOKEN_BUDGET, cache=None):
+        """
+        manager: Optional HybridContextManager. When given, the document text is
+                 taken from its RAM/vector copy instead of re-parsing the file.
+        """
         self.agent = agent
+        self.manager = manager
+        self.parallelism = max(1, parallelism)
+        self.reduce_token_budget = reduce_token_budget
+        self.cache = cache or SummaryCache()
+
+    def _load_text(self, directory, filename):
+        text = self.manager.get_document_text(filename) if self.manager else None
+        if text:
+            print(f"\n📖 Using already-loaded content of {filename}...")
+            return text
 
-    def summarize_file(self, directory, filename):
         file_path = os.path.join(directory, filename)
-        
         if not os.path.exists(file_path):
+            return None
+        print(f"\n📖 Reading full content of {filename}...")
+        return read_file_content(file_path)
+
+    def summarize_file(self, directory, filename):
+        text = self._load_text(directory, filename)
+        if text is None:
             return "❌ File not found on disk."
 
-        print(f"\n📖 Reading full content of {filename}...")
-        text = read_file_content(file_path)
-        
         # 1. Chunking (Map Phase Setup)
         # We use LARGE chunks (approx 2000-3000 tokens) for summarization
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
         splitter = RecursiveCharacterTextSplitter(
-            chunk_size=10000, 
+            chunk_size=10000,
             chunk_overlap=500
         )
         chunks = splitter.split_text(text)
         total_chunks = len(chunks)
-        
-        print(f"🧩 Split into {total_chunks} sections. Starting Map-Reduce...")
-
-        # 2. Map Phase (Summarize each chunk)
-        chunk_summaries = []
-        for i, chunk in enumerate(chunks):
-            print(f"   👉 Summarizing section {i+1}/{total_chunks}...", end="\r")
-            
-            prompt = (
-                f"Summarize the following text section concisely. "
-                f"Capture key dates, facts, and definitions. Ignore filler text.\n\n"
-                f"TEXT:\n{chunk}"
-            )
-            # We bypass the standard query method to avoid re-formatting
-            # Using the agent's internal model directly if possible, or query method
-            response = self.agent.query(prompt, "") # Empty context, strict prompt
-            
-            # Clean response (remove "AI:" prefix)
-            clean_summary = response.replace("🤖 AI:", "").strip()
-            chunk_summaries.append(clean_summary)
 
-        print(f"   ✅ Map phase complete. ({total_chunks} summaries generated).")
+        print(f"🧩 Split into {total_chunks} sections. Starting Map-Reduce (x{self.parallelism} parallel)...")
+
+        try:
+            return self._map_reduce(chunks)
+        except RuntimeError as e:
+            # Error text is never merged as if it were a summary
+            return f"❌ Deep summary stopped: {e}. Finished sections are saved, run :deep again to resume."
+
+    def _map_reduce(self, chunks):
+        total_chunks = len(chunks)
+
+        # 2. Map Phase (Summarize each chunk, several at a time)
+        started = time.perf_counter()
+        prompts = [MAP_SUMMARY_PROMPT.format(text=chunk) for chunk in chunks]
+        cached = sum(1 for p in prompts if self.cache.get(p, self.agent.model) is not None)
+        if cached:
+            print(f"   ♻️  {cached}/{total_chunks} sections already summarized (resuming from cache).")
+        chunk_summaries = self._run_parallel(prompts, label="Summarizing section")
+        print(f"   ✅ Map phase complete. ({total_chunks} summaries in {time.perf_counter() - started:.1f}s)")
+
+        # 3. Reduce Phase (Tree: merge in groups until everything fits one prompt)
+        summaries = chunk_summaries
+        level = 1
+        while len(summaries) > 1 and self._joined_tokens(summaries) > self.reduce_token_budget:
+            started = time.perf_counter()
+            groups = self._group_by_budget(summaries)
+            print(f"🌲 Reduce level {level}: merging {len(summaries)} summaries into {len(groups)}...")
+            prompts = [MERGE_SUMMARY_PROMPT.format(summaries=self._join(group)) for group in groups]
+            summaries = self._run_parallel(prompts, label=f"Merging group (level {level})")
+            print(f"   ✅ Level {level} complete in {time.perf_counter() - started:.1f}s")
+            level += 1
 
-        # 3. Reduce Phase (Combine summaries)
         print("🔥 Reducing to final Master Summary...")
-        combined_summaries = "\n\n".join([f"--- Section {i+1} ---\n{s}" for i, s in enumerate(chunk_summaries)])
-        
-        final_prompt = (
-            f"You are provided with summaries of every section of a large document. "
-            f"Synthesize these into a coherent, structured Executive Summary. "
-            f"Use headers and bullet points.\n\n"
-            f"SECTION SUMMARIES:\n{combined_summaries}"
-        )
-        
-        final_response = self.agent.query(final_prompt, "")
-        return final_response
\ No newline at end of file
+        started = time.perf_counter()
+        final_prompt = FINAL_SUMMARY_PROMPT.format(summaries=self._join(summaries))
+        final_summary = self._summarize(final_prompt)
+        print(f"   ✅ Final reduce complete in {time.perf_counter() - started:.1f}s")
+        return f"🤖 AI:\n{final_summary}"
+
+    def _summarize(self, prompt):
+        """
+        Summary of one prompt, from the cache or the LLM. A failed call is
+        retried once, then raises RuntimeError (failures are never cached).
+        """
+        cached = self.cache.get(prompt, self.agent.model)
+        if cached is not None:
+            return cached
+
+        for _ in range(2):
+            response = self.agent.query(prompt, "", verbose=False) # Empty context, strict prompt
+            if not response.startswith("❌"):
+                break
+        else:
+            raise RuntimeError(response.lstrip("❌ "))
+        # Clean response (remove "AI:" prefix)
+        summary = response.replace("🤖 AI:", "").strip()
+        self.cache.put(prompt, self.agent.model, summary)
+        return summary
+
+    def _run_parallel(self, prompts, label):
+        """
+        Runs prompts through the LLM with bounded concurrency.
+        Results keep the input order, progress is printed as calls finish.
+        If one prompt fails for good, the queued ones are cancelled and its
+        error is raised.
+        """
+        results = [None] * len(prompts)
+        pool = ThreadPoolExecutor(max_workers=self.parallelism)
+        try:
+            futures = {pool.submit(self._summarize, p): i for i, p in enumerate(prompts)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = future.result()
+                print(f"   👉 {label} {done}/{len(prompts)}...", end="\r")
+        except KeyboardInterrupt:
+            # Drop queued sections; the ones already finished are in the cache
+            pool.shutdown(wait=False, cancel_futures=True)
+            print("\n   ⏸️  Interrupted. Finished sections are saved, run :deep again to resume.")
+            raise
+        except RuntimeError:
+            pool.shutdown(wait=False, cancel_futures=True)
+            print()
+            raise
+        pool.shutdown()
+        print()
+        return results
+
+    def _join(self, summaries):
+        return "\n\n".join([f"--- Section {i+1} ---\n{s}" for i, s in enumerate(summaries)])
+
+    def _joined_tokens(self, summaries):
+        return estimate_tokens(self._join(summaries))
+
+    def _group_by_budget(self, summaries):
+        """
+        Splits consecutive summaries into groups that each fit the reduce budget.
+        Every group holds at least 2 summaries so each level strictly shrinks.
+        """
+        groups, current, current_tokens = [], [], 0
+        for summary in summaries:
+            tokens = estimate_tokens(summary) + 10  # + section header
+            if len(current) >= 2 and current_tokens + tokens > self.reduce_token_budget:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(summary)
+            current_tokens += tokens
+        if current:
+            if len(current) == 1 and groups:
+                groups[-1].append(current[0])
+            else:
+                groups.append(current)
+        return groups
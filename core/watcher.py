@@ -0,0 +1,123 @@
+# core/watcher.py
+
+import os
+import threading
+
+from utils.file_loader import iter_directory
+
+POLL_INTERVAL = 2.0     # Seconds between directory scans when nothing is happening
+SETTLE_DELAY = 0.5      # Re-check delay while a change is waiting to settle
+
+def snapshot(directory_path, **scan_options):
+    """{file_id: (file_path, size, mtime_ns)} for the candidate files of a directory tree."""
+    return {
+        file_id: (file_path, st.st_size, st.st_mtime_ns)
+        for file_id, file_path, st in iter_directory(directory_path, **scan_options)
+    }
+
+def _make_inotify(directory_path, recursive=True):
+    """
+    Linux only, optional (pip install inotify_simple): an inotify handle that
+    wakes the watcher as soon as the tree changes. None when unavailable.
+    Folders created later are not watched, but the regular polls still see them.
+    """
+    try:
+        from inotify_simple import INotify, flags
+    except ImportError:
+        return None
+    mask = flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO
+    try:
+        inotify = INotify()
+        inotify.add_watch(directory_path, mask)
+        if recursive:
+            for root, dirs, _ in os.walk(directory_path):
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
+                for d in dirs:
+                    inotify.add_watch(os.path.join(root, d), mask)
+        return inotify
+    except OSError:
+        return None  # Not Linux, or out of watches: polling still works
+
+class DirectoryWatcher:
+    """
+    Watches a directory for added, modified and deleted files.
+
+    Detection is a size/mtime snapshot diff, so it works on every platform;
+    with inotify available it only decides *when* to look (immediately
+    instead of every POLL_INTERVAL seconds). A change is reported once its
+    size/mtime is the same on two consecutive looks, so files still being
+    written (or replaced by an editor's save) are not indexed half-way.
+
+    on_change(changed, deleted) is called from the watcher thread with
+    changed = [(filename, file_path)] and deleted = [filename]. It returns
+    False to have the same changes reported again later (e.g. while a full
+    reindex is running).
+    """
+    def __init__(self, directory_path, on_change, interval=POLL_INTERVAL, scan_options=None):
+        self.directory_path = directory_path
+        self.on_change = on_change
+        self.interval = interval
+        self.scan_options = scan_options or {}
+        self.known = snapshot(directory_path, **self.scan_options)   # State the index reflects
+        self.settling = {}                      # {filename: signature seen last time}
+        self.error = None
+        self._inotify = _make_inotify(directory_path, self.scan_options.get("recursive", True))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def backend(self):
+        return "inotify" if self._inotify else "polling"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._inotify:
+            self._inotify.close()
+
+    def _wait(self, timeout):
+        if self._inotify:
+            self._inotify.read(timeout=int(timeout * 1000))  # Returns early on any event
+        else:
+            self._stop.wait(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wait(SETTLE_DELAY if self.settling else self.interval)
+            if self._stop.is_set():
+                break
+            try:
+                self.check()
+            except Exception as e:
+                self.error = e  # Keep watching: the next change may index fine
+
+    def check(self):
+        """One look at the directory. Reports the changes that have settled."""
+        current = snapshot(self.directory_path, **self.scan_options)
+        names = set(current) | set(self.known)
+        stable = {}
+        for filename in names:
+            signature = current.get(filename)   # None: deleted
+            if signature == self.known.get(filename):
+                self.settling.pop(filename, None)
+            elif filename in self.settling and self.settling[filename] == signature:
+                stable[filename] = signature
+            else:
+                self.settling[filename] = signature
+        if not stable:
+            return
+
+        changed = [(f, sig[0]) for f, sig in sorted(stable.items()) if sig is not None]
+        deleted = [f for f, sig in sorted(stable.items()) if sig is None]
+        if self.on_change(changed, deleted) is False:
+            return  # Still settled: reported again on the next look
+        for filename, signature in stable.items():
+            self.settling.pop(filename, None)
+            if signature is None:
+                self.known.pop(filename, None)
+            else:
+                self.known[filename] = signature
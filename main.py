@@ -6,10 +6,15 @@ import time
 import threading
 import os
 from datetime import datetime
-from core.agent import Agent
-from core.hybrid_manager import HybridContextManager
-from core.summarizer import DeepSummarizer
-from utils.file_loader import load_files_raw
+from core.agent import format_metrics, KEEP_ALIVE
+from core.batch import BatchRunner, DEFAULT_CONCURRENCY
+from core.client import RAGClient
+from core.ingestion import DEFAULT_WORKERS, DEFAULT_BATCH_SIZE, DEFAULT_QUEUE_DEPTH
+from core.server import RAGService, RAGServer, DEFAULT_HOST, DEFAULT_PORT
+from utils.context_packer import format_context_report
+from utils.tracing import TRACER, format_stats
+from utils.vector_store import VECTOR_BACKENDS, VECTOR_BACKEND, NUMPY_DTYPE, VECTOR_PARTITIONS, SUGGESTED_PARTITIONS, ROUTE_FILES, SUGGESTED_ROUTE_FILES, ROUTE_MIN_FILES
+from utils.file_loader import iter_directory, DEFAULT_EXCLUDE
 
 # Spinner for UI
 def spinner(stop_event):
@@ -38,46 +43,246 @@ def save_session(history, filename="session_report.txt"):
     except Exception as e:
         return f"❌ Error saving file: {e}"
 
+def print_file_report(filename, status):
+    print(f"   📄 {filename:<30} → {status}")
+
+def announce_when_indexed(service):
+    """Daemon mode: prints the indexing outcome once the background run ends."""
+    def watch():
+        service.indexer.wait()
+        print("\n".join(service.indexing_report()))
+    threading.Thread(target=watch, daemon=True).start()
+
+def scan_options(args):
+    """Which files of the --files tree get indexed (see utils.file_loader.iter_directory)."""
+    return {
+        "include": args.include,
+        "exclude": DEFAULT_EXCLUDE + tuple(args.exclude or ()),
+        "max_size": int(args.max_file_mb * (1 << 20)) if args.max_file_mb else None,
+        "recursive": not args.no_recursive,
+    }
+
+def keep_alive(value):
+    """--keep-alive: Ollama takes durations as '30m' strings or as plain (negative = forever) seconds."""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+def serve(args):
+    """Daemon mode: keeps the index, model and agent warm and serves the local API."""
+    service = RAGService(
+        args.files, persistent=args.persist,
+        workers=args.workers, batch_size=args.batch_size, queue_depth=args.queue_depth,
+        scan_options=scan_options(args), vector_backend=args.vector_backend, numpy_dtype=args.vector_dtype,
+        partitions=args.partitions, route_files=args.route_files, keep_alive=args.keep_alive,
+    )
+    server = RAGServer(service, args.host, args.port)
+    print(f"🛰️  Serving {args.files} on {server.url} (Ctrl-C to stop)")
+    print(f"   Connect with: python main.py --connect {server.url}")
+    print("\n🧠 Routing & Indexing Files:")
+    service.reindex(on_file=print_file_report)
+    announce_when_indexed(service)
+    if args.watch:
+        watcher = service.start_watching(on_change=print)
+        print(f"👀 Watching {args.files} for changes ({watcher.backend}).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Shutting down...")
+    finally:
+        service.stop()
+        server.stop()
+
+def run_batch(args):
+    """Batch mode: indexes --files, answers every question of --batch, then exits."""
+    out_path = args.out or os.path.splitext(args.batch)[0] + ".answers.jsonl"
+    service = RAGService(
+        args.files, persistent=args.persist,
+        workers=args.workers, batch_size=args.batch_size, queue_depth=args.queue_depth,
+        scan_options=scan_options(args), vector_backend=args.vector_backend, numpy_dtype=args.vector_dtype,
+        partitions=args.partitions, route_files=args.route_files, keep_alive=args.keep_alive,
+    )
+    print("\n🧠 Routing & Indexing Files:")
+    service.reindex(on_file=print_file_report)
+    service.indexer.wait()
+    print("\n".join(service.indexing_report()))
+    if service.indexer.error:
+        sys.exit(1)
+
+    def report(record):
+        if "error" in record:
+            print(f"   ❌ {record['id']:<12} {record['error']}")
+        else:
+            origin = "cached" if record["cached"] else f"{record['timings']['llm']}s"
+            print(f"   ✅ {record['id']:<12} {origin:>8}  {record['question'][:60]}")
+
+    print(f"\n📋 Answering {args.batch} → {out_path} ({args.concurrency} at a time)")
+    try:
+        stats = BatchRunner(service, concurrency=args.concurrency).run(args.batch, out_path, on_result=report)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\n⏸️  Interrupted. Run the same command again to resume.")
+        sys.exit(130)
+    finally:
+        service.stop()
+        TRACER.disable()
+    if stats["skipped"]:
+        print(f"♻️  {stats['skipped']} questions already answered in {out_path} (skipped)")
+    print(
+        f"✅ Batch complete: {stats['answered']} answered ({stats['cached']} from cache), "
+        f"{stats['failed']} failed in {stats['seconds']}s"
+    )
+    if stats["failed"]:
+        print("   Failed questions are retried when the same command is run again.")
+
 def main():
     parser = argparse.ArgumentParser(description="Local Hybrid RAG System")
-    parser.add_argument("--files", type=str, help="Path to documents", required=True)
+    parser.add_argument("--files", type=str, help="Path to documents (required unless --connect)")
+    parser.add_argument("--include", action="append", metavar="GLOB",
+                        help="Only index matching files, e.g. '*.pdf' or 'reports/*' (repeatable)")
+    parser.add_argument("--exclude", action="append", metavar="GLOB",
+                        help="Skip matching files and folders (repeatable; hidden folders are always skipped)")
+    parser.add_argument("--max-file-mb", type=float, default=None,
+                        help="Skip files larger than this")
+    parser.add_argument("--no-recursive", action="store_true",
+                        help="Only index the top level of --files")
+    parser.add_argument("--persist", action="store_true",
+                        help="Keep the vector index between runs and only re-embed new/changed files")
+    parser.add_argument("--vector-backend", choices=VECTOR_BACKENDS, default=VECTOR_BACKEND,
+                        help="Dense index: Chroma (HNSW) or a compact exact-search NumPy store")
+    parser.add_argument("--vector-dtype", choices=["float16", "int8"], default=NUMPY_DTYPE,
+                        help="Vector precision of the NumPy store (float16: slightly higher recall, 2x the size, slower scans)")
+    parser.add_argument("--partitions", type=int, default=VECTOR_PARTITIONS, metavar="N",
+                        help=f"Split the vector index into N collections by file: @file questions scan less, every global "
+                             f"question pays a small fan-out cost (default: 1; try {SUGGESTED_PARTITIONS} on large indexes)")
+    parser.add_argument("--route-files", type=int, default=ROUTE_FILES, metavar="N",
+                        help=f"Global questions search the chunks of the N best-matching files only, once more than {ROUTE_MIN_FILES} files "
+                             f"are indexed. Faster on large folders, but can miss chunks a full search finds (default: 0 = search every chunk; try {SUGGESTED_ROUTE_FILES})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Parallel parser processes")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Chunks per embedding batch")
+    parser.add_argument("--queue-depth", type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help="Parsed files buffered ahead of the embedder")
+    parser.add_argument("--wait", action="store_true",
+                        help="Finish indexing before showing the prompt (default: index in the background)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep the index in sync with the folder: re-index added/modified files, drop deleted ones")
+    parser.add_argument("--keep-alive", type=keep_alive, default=KEEP_ALIVE, metavar="DURATION",
+                        help="How long Ollama keeps the model and its prompt cache loaded between questions (e.g. 30m, -1 = forever)")
+    parser.add_argument("--trace", nargs="?", const="", default=None, metavar="FILE.jsonl",
+                        help="Record per-stage timings for :stats (optionally also append them to a JSONL file)")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run as a daemon: keep everything loaded and serve the local API (no REPL)")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Daemon address (with --serve)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Daemon port (with --serve)")
+    parser.add_argument("--batch", metavar="QUESTIONS.jsonl",
+                        help="Answer every question in a JSONL file ({\"id\", \"question\", \"focus\"} per line) and exit")
+    parser.add_argument("--out", metavar="ANSWERS.jsonl",
+                        help="Output of --batch (default: <questions>.answers.jsonl; an existing file is resumed)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="LLM calls in flight with --batch")
+    parser.add_argument("--connect", metavar="URL",
+                        help="Chat with a running daemon instead of loading files here (e.g. http://127.0.0.1:8765)")
     args = parser.parse_args()
 
-    print("\n🚀 Initializing Hybrid RAG Engine...")
-    print("-" * 50)
+    if args.batch and (args.connect or args.serve):
+        parser.error("--batch runs in-process: use it with --files, not --connect/--serve")
+    if args.trace is not None:
+        TRACER.enable(args.trace or None)
 
-    # 1. Initialize Managers
-    manager = HybridContextManager()
-    agent = Agent(model="llama3")
-    deep_summarizer = DeepSummarizer(agent)
+    service = server = None
+    if args.connect:
+        client = RAGClient(args.connect)
+        if not client.is_up():
+            print(f"❌ No server reachable at {args.connect}. Start one with: python main.py --serve --files <dir>")
+            sys.exit(1)
+        print(f"\n🛰️  Connected to {args.connect}")
+    else:
+        if not args.files:
+            parser.error("--files is required unless --connect is given")
+        if next(iter_directory(args.files, **scan_options(args)), None) is None:
+            print("❌ No valid files found.")
+            sys.exit(1)
+        if args.serve:
+            serve(args)
+            return
+        if args.batch:
+            run_batch(args)
+            return
 
-    # 2. Load and Route Files
-    raw_files = load_files_raw(args.files)
-    if not raw_files:
-        print("❌ No valid files found.")
-        sys.exit(1)
+        print("\n🚀 Initializing Hybrid RAG Engine...")
+        print("-" * 50)
+        print(f"📂 Scanning {args.files}...")
+        # Same API as the daemon, on a private port: the REPL below is just another client
+        service = RAGService(
+            args.files, persistent=args.persist,
+            workers=args.workers, batch_size=args.batch_size, queue_depth=args.queue_depth,
+            scan_options=scan_options(args), vector_backend=args.vector_backend, numpy_dtype=args.vector_dtype,
+            partitions=args.partitions, route_files=args.route_files, keep_alive=args.keep_alive,
+        )
+        server = RAGServer(service, port=0).start()
+        client = RAGClient(server.url)
+        if args.wait:
+            print("\n🧠 Routing & Indexing Files:")
+        # Per-file lines only when waiting: in the background they would garble the prompt
+        service.reindex(on_file=print_file_report if args.wait else None)
+        if args.watch:
+            watcher = service.start_watching()
+            print(f"👀 Watching {args.files} for changes ({watcher.backend}).")
 
-    print("\n🧠 Routing & Indexing Files:")
-    for filename, content in raw_files:
-        status = manager.process_and_index(filename, content)
-        print(f"   📄 {filename:<30} → {status}")
+    if args.wait:
+        while client.status()["indexing"]:
+            time.sleep(0.2)
+    else:
+        print("🧠 Indexing in the background. Small files are answerable right away (:files shows progress).")
+
+    try:
+        chat(client)
+    finally:
+        if service:
+            if service.indexer and not service.indexer.done.is_set():
+                print("⏳ Stopping background indexing...")
+            service.stop()
+            server.stop()
+        TRACER.disable()  # Closes the trace file
 
+def chat(client):
+    """The interactive REPL. All work happens behind `client` (embedded or remote server)."""
     print("-" * 50)
     print("ℹ️  Commands:")
-    print("   :files        → List all loaded files")
+    print("   :files        → List all loaded files (and indexing progress)")
     print("   :focus [name] → Lock chat to a specific file")
     print("   :deep [name]  → 🧠 Deep Map-Reduce Summary")
     print("   :save [name]  → 💾 Save chat history to .txt file")
+    print("   :cache        → ⚡ Answer/embedding cache hit rates")
+    print("   :stats        → 📊 Per-stage timings (needs --trace)")
+    print("   :reindex      → 🔄 Re-scan the folder for new/changed files")
     print("   :all          → Return to global mode")
     print("   exit          → Quit")
     print("-" * 50)
     
     current_focus = None 
     chat_history = [] # <--- Stores the session
+    indexing_reported = False
+    last_change = 0
 
     # 4. Chat Loop
     while True:
         try:
+            status = client.status()
+            if not indexing_reported and status["report"]:
+                print("\n".join(status["report"]))
+                indexing_reported = True
+            # Watch mode: files re-indexed or removed since the last prompt
+            for seq, line in status.get("changes", []):
+                if seq > last_change:
+                    print(line)
+                    last_change = seq
+
             if current_focus:
                 prompt_context = f"[{current_focus}]"
                 prompt_text = f"\n🔒 {prompt_context} You: "
@@ -95,9 +300,46 @@ def main():
                 break
             
             if user_input.lower() == ":files":
+                listing = client.files()
                 print("\n📂 Loaded Files:")
-                for f in manager.list_files():
+                for f in listing["files"]:
                     print(f" - {f}")
+                if listing["pending"]:
+                    print(f"\n⏳ Indexing: {client.status()['progress']}")
+                    for filename, p in listing["pending"].items():
+                        if p["state"] == "indexing":
+                            print(f" - {filename} (embedding, {p['chunks']:,} chunks so far)")
+                        else:
+                            print(f" - {filename} (queued)")
+                continue
+
+            if user_input.lower() == ":cache":
+                stats = client.stats()
+                answers = stats["answer_cache"]
+                print(f"⚡ Answer cache: {answers['hits']} hits / {answers['misses']} misses "
+                      f"(hit rate {answers['hit_rate']:.0%}, {answers['entries']} stored)")
+                embeddings = stats.get("embedding_cache")
+                if not embeddings:
+                    print("⏳ The embedding model is still loading.")
+                    continue
+                print(f"🧮 Embedding cache: {embeddings['hits']} hits / {embeddings['misses']} misses "
+                      f"(hit rate {embeddings['hit_rate']:.0%}, {embeddings['entries']} stored)")
+                continue
+
+            if user_input.lower() == ":stats":
+                stats = client.stats()
+                if not stats["tracing"]:
+                    print("📊 Tracing is off. Restart with --trace to record stage timings.")
+                else:
+                    print(format_stats(stats["trace"]))
+                continue
+
+            if user_input.lower() == ":reindex":
+                if client.reindex():
+                    indexing_reported = False
+                    print("🔄 Re-indexing in the background (:files shows progress).")
+                else:
+                    print("⏳ Indexing is already running.")
                 continue
 
             if user_input.lower() == ":all":
@@ -119,8 +361,7 @@ def main():
             # --- FOCUS LOGIC ---
             if user_input.lower().startswith(":focus"):
                 target = user_input.replace(":focus", "").strip()
-                all_files = list(manager.small_files.keys()) + manager.large_files
-                match = next((f for f in all_files if target.lower() in f.lower()), None)
+                match = client.resolve(target)
                 
                 if match:
                     current_focus = match
@@ -132,12 +373,16 @@ def main():
             # --- DEEP SUMMARY ---
             if user_input.lower().startswith(":deep"):
                 target = user_input.replace(":deep", "").strip()
-                all_files = list(manager.small_files.keys()) + manager.large_files
-                match = next((f for f in all_files if target.lower() in f.lower()), None)
+                match = client.resolve(target)
                 
                 if match:
                     print(f"🧠 Starting Deep Summary for: {match}")
-                    result = deep_summarizer.summarize_file(args.files, match)
+                    try:
+                        result = client.deep_summary(match)
+                    except KeyboardInterrupt:
+                        # The server finishes in the background; its sections are cached for a re-run
+                        print("\n⏹️  Stopped waiting for the summary.")
+                        continue
                     print(f"\n{result}")
                     # Log Deep Summary
                     chat_history.append({
@@ -149,18 +394,53 @@ def main():
                     print(f"❌ File matching '{target}' not found.")
                 continue
 
-            # --- NORMAL AI QUERY ---
+            # --- AI QUERY (answer cache hit, or streamed from the model) ---
             stop_spinner = threading.Event()
             t = threading.Thread(target=spinner, args=(stop_spinner,))
             t.start()
             
-            dynamic_context = manager.build_smart_context(user_input, focus_file=current_focus)
-            response = agent.query(user_input, dynamic_context)
-            
-            stop_spinner.set()
-            t.join()
-            
-            print(f"{response}")
+            events = client.ask(user_input, focus=current_focus)
+            pieces = []
+            response = None
+            context_report = None
+            try:
+                for event in events:
+                    kind = event["event"]
+                    if kind == "token":
+                        if not pieces:
+                            # Keep the spinner until the model produces its first token
+                            stop_spinner.set()
+                            t.join()
+                            if context_report:
+                                print(format_context_report(context_report))
+                            print("🤖 AI:")
+                        print(event["text"], end="", flush=True)
+                        pieces.append(event["text"])
+                    elif kind == "context":
+                        context_report = event["report"]
+                    elif kind == "cached":
+                        stop_spinner.set()
+                        t.join()
+                        print(f"⚡ Cached answer (similar to: \"{event['question']}\")")
+                        print(event["answer"])
+                        response = event["answer"]
+                    elif kind == "done":
+                        stop_spinner.set()
+                        t.join()
+                        print()
+                        print(format_metrics(event["metrics"]))
+                    elif kind == "error":
+                        stop_spinner.set()
+                        t.join()
+                        print(f"❌ {event['message']}")
+            except KeyboardInterrupt:
+                events.close()  # Drops the connection: the server stops generating
+                print("\n⏹️  Generation stopped.")
+            finally:
+                stop_spinner.set()
+                t.join()
+            if response is None:
+                response = "🤖 AI:\n" + "".join(pieces)
             
             # Log the turn
             chat_history.append({
@@ -172,6 +452,8 @@ def main():
         except KeyboardInterrupt:
             print("\n👋 Goodbye!")
             break
+        except (OSError, RuntimeError) as e:
+            print(f"❌ Server error: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
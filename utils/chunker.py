@@ -1,8 +1,29 @@
 # utils/chunker.py
 
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from utils.tracing import span
 
-def intelligent_chunking(text, chunk_size=800, chunk_overlap=150):
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 150
+CHARS_PER_TOKEN = 4   # Rough average for English text with Llama/MiniLM tokenizers
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate (no tokenizer call). Good enough for budgeting prompts.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _splitter(chunk_size, chunk_overlap):
+    # Imported on first use: langchain is slow to import and not needed to start the REPL
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", ". ", " ", ""],
+        length_function=len,
+    )
+
+def intelligent_chunking(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
     """
     Splits text recursively using semantic separators to preserve meaning.
     
@@ -20,10 +41,124 @@ def intelligent_chunking(text, chunk_size=800, chunk_overlap=150):
     Returns:
         List[str]: A list of text chunks.
     """
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", ". ", " ", ""],
-        length_function=len,
-    )
-    return splitter.split_text(text)
+    return [chunk for _, _, chunk in intelligent_chunking_spans(text, chunk_size, chunk_overlap)]
+
+def intelligent_chunking_spans(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Same chunks as intelligent_chunking, as (start, end, chunk) with
+    text[start:end] == chunk, so a chunk can be stored as a span of the text.
+    start/end are None in the (rare) case the chunk is not found verbatim.
+    """
+    splitter = _splitter(chunk_size, chunk_overlap)
+    with span("chunk.split", chars=len(text)) as s:
+        chunks = splitter.split_text(text)
+        s.set(chunks=len(chunks))
+    return _locate(text, chunks, chunk_overlap)
+
+def _locate(text, chunks, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Finds each chunk in the text it was split from -> [(start, end, chunk)].
+    Consecutive chunks share at most chunk_overlap chars, which bounds where
+    the next one can start (repeated boilerplate is not matched too early).
+    """
+    spans = []
+    prev_start, prev_end = -1, 0
+    for chunk in chunks:
+        start = text.find(chunk, max(prev_start + 1, prev_end - chunk_overlap))
+        if start < 0:
+            start = text.find(chunk, prev_start + 1)
+        if start < 0:
+            spans.append((None, None, chunk))
+            continue
+        prev_start, prev_end = start, start + len(chunk)
+        spans.append((start, prev_end, chunk))
+    return spans
+
+def intelligent_chunking_stream(segments, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                                window_chunks=64):
+    """
+    Streaming version of intelligent_chunking for huge inputs.
+
+    Consumes an iterable of text segments (pages, row batches, ...) and yields
+    chunks as soon as they are final. Only a window of ~window_chunks chunks
+    is held in memory; the last (possibly incomplete) chunk of each window is
+    carried over and re-split together with the next segment. Each window is
+    split on its own, so chunk boundaries (and the chunk count) can differ
+    slightly from intelligent_chunking on the same text.
+    """
+    for _, _, chunk in intelligent_chunking_stream_spans(segments, chunk_size, chunk_overlap, window_chunks):
+        yield chunk
+
+def intelligent_chunking_stream_spans(segments, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                                      window_chunks=64):
+    """
+    intelligent_chunking_stream yielding (start, end, chunk), where start/end
+    are offsets in the concatenated segments (None if the chunk is not found
+    verbatim; every later chunk of the input then has None as well).
+    """
+    splitter = _splitter(chunk_size, chunk_overlap)
+    window = window_chunks * chunk_size
+    buffer = ""
+    offset = 0   # Position of buffer[0] in the whole text; None once they no longer line up
+    for segment in segments:
+        buffer += segment
+        while len(buffer) >= window:
+            with span("chunk.split", chars=window) as s:
+                chunks = splitter.split_text(buffer[:window])
+                s.set(chunks=len(chunks))
+            if len(chunks) < 2:
+                break  # No usable separator in the window; wait for more text
+            spans = _locate(buffer[:window], chunks, chunk_overlap)
+            yield from _shift(spans[:-1], offset)
+            # Restart the buffer where the last chunk starts
+            start = spans[-1][0]
+            if start is not None:
+                buffer = buffer[start:]
+                if offset is not None:
+                    offset += start
+            else:
+                buffer = chunks[-1] + "\n" + buffer[window:]
+                offset = None
+    if buffer:
+        yield from _shift(_locate(buffer, splitter.split_text(buffer), chunk_overlap), offset)
+
+def _shift(spans, offset):
+    for start, end, chunk in spans:
+        if offset is None or start is None:
+            yield None, None, chunk
+        else:
+            yield offset + start, offset + end, chunk
+
+def stitch_chunks(chunks, max_overlap=CHUNK_OVERLAP):
+    """
+    Best-effort rebuild of the text consecutive chunks were split from (used
+    when the text itself is not stored). For each pair, drops the longest
+    prefix of the next chunk that repeats the end of the previous one (at
+    most max_overlap chars, starting and ending on word boundaries).
+
+    Where chunks overlap the result is exact. Elsewhere the separator the
+    splitter removed is inferred from the chunks, so whitespace between
+    paragraphs / lines may differ from the original.
+    """
+    if not chunks:
+        return ""
+    parts = [chunks[0]]
+    for prev, nxt in zip(chunks, chunks[1:]):
+        overlap = 0
+        for k in range(min(max_overlap, len(prev), len(nxt)), 0, -1):
+            # A 1-char match like "...the" / "e..." is not an overlap: the splitter overlaps whole words
+            if prev.endswith(nxt[:k]) and _word_boundary(prev, len(prev) - k) and _word_boundary(nxt, k):
+                overlap = k
+                break
+        if overlap:
+            parts.append(nxt[overlap:])
+        elif nxt.startswith("."):
+            parts.append(nxt)   # Split at ". ": the splitter keeps the period with the next chunk
+        elif "\n" in prev + nxt and "\n\n" not in prev + nxt:
+            parts.append("\n" + nxt)   # Line-structured text (tables, logs)
+        else:
+            parts.append("\n\n" + nxt)   # The splitter strips whitespace at chunk edges
+    return "".join(parts)
+
+def _word_boundary(text, i):
+    return i <= 0 or i >= len(text) or not (text[i - 1].isalnum() and text[i].isalnum())
@@ -0,0 +1,143 @@
+# utils/context_compressor.py
+
+import re
+import numpy as np
+from utils.chunker import stitch_chunks, estimate_tokens
+
+SHINGLE_WORDS = 5             # Texts are compared as sets of 5-word sequences
+DUPLICATE_OVERLAP = 0.8       # Share of a candidate's sequences already picked at which it is the same text
+REDUNDANCY_PENALTY = 0.15     # Score lost per unit of overlap with an already picked excerpt
+
+def merge_adjacent_chunks(chunks, read_span=None, max_tokens=None):
+    """
+    Merges retrieved chunks that are neighbours in the same file (consecutive
+    chunk_index) into one span, so their shared overlap is sent only once.
+
+    chunks: Hits from VectorEngine.search_chunks, best first.
+    read_span: Optional VectorEngine.read_span; a run of chunks stored as
+               spans of the same text is then read back as one exact slice
+               instead of being stitched from the chunk texts (which can
+               differ from the file in whitespace; see stitch_chunks).
+    max_tokens: Longer runs are split into consecutive spans of at most this
+               many chunk tokens (at least one chunk each), so a long run
+               never becomes one excerpt too big for the context budget.
+    Returns spans, ordered by their best-ranked chunk:
+    {"source", "first", "last", "chunks", "raw_tokens", "text", "score", "lexical_rank"}
+    (score: best fused score of its chunks; lexical_rank: best BM25 rank of
+    its chunks, None if BM25 found none).
+    """
+    by_source = {}
+    for rank, chunk in enumerate(chunks):
+        by_source.setdefault(chunk["source"], []).append((chunk["chunk_index"], rank, chunk))
+
+    spans = []
+    for source, hits in by_source.items():
+        hits.sort()
+        run, run_tokens = [], 0
+        for hit in hits:
+            tokens = estimate_tokens(hit[2]["text"])
+            if run and (hit[0] != run[-1][0] + 1 or (max_tokens and run_tokens + tokens > max_tokens)):
+                spans.append(_span(source, run, read_span))
+                run, run_tokens = [], 0
+            run.append(hit)
+            run_tokens += tokens
+        spans.append(_span(source, run, read_span))
+    spans.sort(key=lambda s: s["rank"])
+    return spans
+
+def _span(source, run, read_span):
+    texts = [chunk["text"] for _, _, chunk in run]
+    text = None
+    revisions = {chunk.get("rev") for _, _, chunk in run}
+    lexical_ranks = [chunk["lexical_rank"] for _, _, chunk in run if chunk.get("lexical_rank") is not None]
+    if read_span and len(run) > 1 and len(revisions) == 1 and None not in revisions:
+        text = read_span(source, revisions.pop(), run[0][2]["start"], run[-1][2]["end"])
+    return {
+        "source": source,
+        "first": run[0][0],
+        "last": run[-1][0],
+        "rank": min(rank for _, rank, _ in run),
+        "chunks": len(run),
+        "raw_tokens": sum(estimate_tokens(t) for t in texts),
+        "text": text if text is not None else stitch_chunks(texts),
+        "score": max(chunk.get("score", 0.0) for _, _, chunk in run),
+        "lexical_rank": min(lexical_ranks) if lexical_ranks else None,
+    }
+
+def span_label(span):
+    """'report.pdf #3' or 'report.pdf #3-5' (1-based chunk numbers)."""
+    if span["first"] == span["last"]:
+        return f"{span['source']} #{span['first'] + 1}"
+    return f"{span['source']} #{span['first'] + 1}-{span['last'] + 1}"
+
+def _shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+
+def _identifiers(text):
+    """Numbers, ids and codes: what tells templated parts apart (invoices, log lines, rows)."""
+    return {word for word in re.findall(r"\w+", text.lower()) if any(c.isdigit() for c in word)}
+
+def _text_overlap(candidates):
+    """
+    overlap[i, j]: share of candidate i's 5-word sequences that also occur in j,
+    or 0 if i holds a number / id that j does not (same layout, other record).
+    """
+    shingles = [_shingles(c["text"]) for c in candidates]
+    identifiers = [_identifiers(c["text"]) for c in candidates]
+    overlap = np.zeros((len(candidates), len(candidates)), dtype=np.float32)
+    for i, own in enumerate(shingles):
+        for j, other in enumerate(shingles):
+            if i != j and own and identifiers[i] <= identifiers[j]:
+                overlap[i, j] = len(own & other) / len(own)
+    return overlap
+
+def suppress_near_duplicates(candidates, threshold=DUPLICATE_OVERLAP, penalty=REDUNDANCY_PENALTY):
+    """
+    Maximal Marginal Relevance over scored candidates.
+
+    Greedily picks the candidate with the best
+    score - penalty * (max overlap with those already picked),
+    and stores that value as its score, so the packer prefers parts that add
+    something new (scores stay comparable with candidates not passed here).
+    Candidates whose text is at least `threshold` contained in a picked one
+    (see _text_overlap) are near-duplicates and dropped, unless "protected"
+    (e.g. BM25's best hit: an exact id match is never dropped).
+
+    Returns (kept, dropped); kept keeps the input order.
+    """
+    if len(candidates) < 2:
+        return candidates, []
+
+    overlap = _text_overlap(candidates)
+    relevance = np.array([c["score"] for c in candidates], dtype=np.float32)
+    redundancy = np.zeros(len(candidates), dtype=np.float32)  # Max overlap with a picked candidate
+    remaining = set(range(len(candidates)))
+    kept, dropped = set(), []
+    while remaining:
+        order = sorted(remaining)
+        mmr = relevance[order] - penalty * redundancy[order]
+        best = order[int(np.argmax(mmr))]
+        remaining.discard(best)
+        if redundancy[best] >= threshold and not candidates[best].get("protected"):
+            dropped.append(candidates[best])
+            continue
+        candidates[best]["score"] = float(relevance[best] - penalty * redundancy[best])
+        kept.add(best)
+        redundancy = np.maximum(redundancy, overlap[:, best])
+    return [c for i, c in enumerate(candidates) if i in kept], dropped
+
+def compression_report(candidates, dropped):
+    """
+    What merging and de-duplication saved, before packing:
+    tokens of the raw retrieved chunks (+ other candidates) minus tokens still in play.
+    """
+    before = sum(c.get("raw_tokens") or estimate_tokens(c["text"]) for c in candidates)
+    after = sum(estimate_tokens(c["text"]) for c in candidates) - sum(estimate_tokens(c["text"]) for c in dropped)
+    merged = [c for c in candidates if c.get("chunks", 1) > 1]
+    return {
+        "merged_chunks": sum(c["chunks"] for c in merged),
+        "merged_spans": len(merged),
+        "duplicates": [c["label"] for c in dropped],
+        "tokens_saved": max(before - after, 0),
+    }
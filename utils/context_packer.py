@@ -0,0 +1,74 @@
+# utils/context_packer.py
+
+import numpy as np
+from utils.chunker import estimate_tokens
+
+CONTEXT_TOKEN_BUDGET = 6000   # Leaves room for the system prompt + answer in an 8k context
+
+def cosine_scores(query_vector, vectors):
+    """
+    Cosine similarity of one query vector against a list of vectors.
+    """
+    if not vectors:
+        return []
+    matrix = np.vstack(vectors).astype(np.float32)
+    query = np.asarray(query_vector, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+    norms[norms == 0] = 1.0
+    return (matrix @ query / norms).tolist()
+
+class ContextPacker:
+    """
+    Greedy knapsack over context candidates.
+
+    Each candidate is a dict: {"label", "text", "score"} (any extra keys are kept).
+    Candidates with "pinned": True are always included, first. Then highest
+    score first; a candidate that does not fit is dropped and the next
+    (possibly smaller) one is tried, so the budget is filled as much as possible.
+    """
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+
+    def pack(self, candidates):
+        """
+        Returns (included, report). included keeps the input order of the
+        selected candidates so the prompt layout stays predictable.
+        """
+        used = 0
+        chosen = set()
+        report = {"budget": self.token_budget, "used": 0, "included": [], "dropped": []}
+
+        ranked = sorted(range(len(candidates)),
+                        key=lambda i: (bool(candidates[i].get("pinned")), candidates[i]["score"]), reverse=True)
+        for i in ranked:
+            cand = candidates[i]
+            tokens = cand.get("tokens") or estimate_tokens(cand["text"])
+            entry = {"label": cand["label"], "tokens": tokens, "score": round(cand["score"], 3)}
+            if cand.get("pinned") or used + tokens <= self.token_budget:
+                used += tokens
+                chosen.add(i)
+                report["included"].append(entry)
+            else:
+                report["dropped"].append(entry)
+
+        report["used"] = used
+        return [c for i, c in enumerate(candidates) if i in chosen], report
+
+def format_context_report(report):
+    """One-line summary for the REPL."""
+    if not report:
+        return ""
+    line = f"📦 Context: {report['used']}/{report['budget']} tokens, {len(report['included'])} parts included"
+    if report["dropped"]:
+        line += f", {len(report['dropped'])} dropped (lowest relevance)"
+    compression = report.get("compression")
+    if compression and compression["tokens_saved"]:
+        parts = []
+        if compression["merged_spans"]:
+            parts.append(f"{compression['merged_chunks']} neighbouring chunks merged into {compression['merged_spans']}")
+        if compression["duplicates"]:
+            parts.append(f"{len(compression['duplicates'])} near-duplicates dropped")
+        line += f"\n✂️  Compression: saved ~{compression['tokens_saved']} tokens"
+        if parts:
+            line += f" ({', '.join(parts)})"
+    return line
@@ -0,0 +1,160 @@
+# utils/document_store.py
+
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+
+BLOCK_CHARS = 16384        # Text per compressed block: a chunk span touches 1-2 blocks
+BLOCK_CACHE_SIZE = 256     # Decompressed blocks kept in memory (~4 MB of text)
+COMPRESSION_LEVEL = 6
+
+class DocumentStore:
+    """
+    The one stored copy of each vector-tier file's text.
+
+    Chunks only keep (rev, start, end) into it, so the overlap between
+    neighbouring chunks is stored once and adjacent chunks can be read back
+    as one exact span. Text is split into blocks of BLOCK_CHARS characters,
+    zlib-compressed in SQLite; reading a span decompresses one or two blocks
+    (recently used blocks are cached).
+
+    Each (re-)indexing of a file writes a new revision and every chunk points
+    at the revision it was cut from. While a changed file is re-indexed, its
+    '{file}_{i}' chunks are replaced batch by batch, so for a moment the file
+    mixes new chunks with old ones. Each chunk still reads the exact text it
+    was embedded from: finish() drops the older revisions only once all the
+    new chunks are stored.
+    """
+    def __init__(self, path):
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS blocks ("
+            " source TEXT NOT NULL, rev INTEGER NOT NULL, block INTEGER NOT NULL,"
+            " data BLOB NOT NULL, PRIMARY KEY (source, rev, block))"
+        )
+        # Latest finished revision of each file
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " source TEXT PRIMARY KEY, rev INTEGER NOT NULL, length INTEGER NOT NULL)"
+        )
+        self._db.commit()
+        self._writing = {}               # {(source, rev): [blocks written, unwritten tail text]}
+        self._cache = OrderedDict()      # {(source, rev, block): text}
+
+    def begin(self, source):
+        """Starts a new revision of a file's text; returns its number."""
+        with self._lock:
+            (last,) = self._db.execute("SELECT MAX(rev) FROM blocks WHERE source = ?", (source,)).fetchone()
+            (done,) = self._db.execute("SELECT MAX(rev) FROM documents WHERE source = ?", (source,)).fetchone()
+            open_revs = [rev for s, rev in self._writing if s == source]
+            rev = max([last or 0, done or 0, *open_revs]) + 1
+            self._writing[(source, rev)] = [0, ""]
+        return rev
+
+    def append(self, source, rev, text):
+        """Adds the next part of the text; full blocks are written right away."""
+        with self._lock:
+            state = self._writing[(source, rev)]
+            state[1] += text
+            rows = []
+            while len(state[1]) >= BLOCK_CHARS:
+                rows.append((source, rev, state[0], self._pack(state[1][:BLOCK_CHARS])))
+                state[0] += 1
+                state[1] = state[1][BLOCK_CHARS:]
+            if rows:
+                self._db.executemany("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)", rows)
+                self._db.commit()
+
+    def finish(self, source, rev):
+        """Writes the last block and makes rev the file's only revision."""
+        with self._lock:
+            state = self._writing.pop((source, rev), None)
+            if state is None:
+                return
+            blocks, tail = state
+            if tail:
+                self._db.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)",
+                                 (source, rev, blocks, self._pack(tail)))
+            self._db.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?)",
+                             (source, rev, blocks * BLOCK_CHARS + len(tail)))
+            self._db.execute("DELETE FROM blocks WHERE source = ? AND rev < ?", (source, rev))
+            self._db.commit()
+            self._forget(source, lambda r: r < rev)
+
+    def delete(self, source):
+        """Removes every revision of a file (revisions still being written too)."""
+        with self._lock:
+            self._db.execute("DELETE FROM blocks WHERE source = ?", (source,))
+            self._db.execute("DELETE FROM documents WHERE source = ?", (source,))
+            self._db.commit()
+            for key in [key for key in self._writing if key[0] == source]:
+                del self._writing[key]
+            self._forget(source, lambda r: True)
+
+    def read(self, source, rev, start, end):
+        """text[start:end] of a revision, or None if that revision is gone."""
+        first, last = start // BLOCK_CHARS, (end - 1) // BLOCK_CHARS
+        parts = []
+        with self._lock:
+            for block in range(first, max(last, first) + 1):
+                text = self._block(source, rev, block)
+                if text is None:
+                    return None
+                parts.append(text)
+        offset = first * BLOCK_CHARS
+        return "".join(parts)[start - offset:end - offset]
+
+    def read_document(self, source):
+        """Full text of the file's latest finished revision, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT rev, length FROM documents WHERE source = ?", (source,)).fetchone()
+            if row is None:
+                return None
+            return self.read(source, row[0], 0, row[1])
+
+    def read_head(self, source, chars):
+        """First `chars` characters of the latest finished revision, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT rev, length FROM documents WHERE source = ?", (source,)).fetchone()
+            if row is None:
+                return None
+            return self.read(source, row[0], 0, min(chars, row[1]))
+
+    def stats(self):
+        with self._lock:
+            files, chars = self._db.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents").fetchone()
+            (stored,) = self._db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM blocks").fetchone()
+        return {"files": files, "chars": chars, "stored_bytes": stored}
+
+    # --- Blocks ---
+
+    @staticmethod
+    def _pack(text):
+        return zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)
+
+    def _block(self, source, rev, block):
+        state = self._writing.get((source, rev))
+        if state is not None and block == state[0]:
+            return state[1]   # Tail of a revision being written: not stored yet
+        key = (source, rev, block)
+        text = self._cache.get(key)
+        if text is not None:
+            self._cache.move_to_end(key)
+            return text
+        row = self._db.execute(
+            "SELECT data FROM blocks WHERE source = ? AND rev = ? AND block = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        text = zlib.decompress(row[0]).decode('utf-8')
+        self._cache[key] = text
+        if len(self._cache) > BLOCK_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return text
+
+    def _forget(self, source, stale):
+        for key in [key for key in self._cache if key[0] == source and stale(key[1])]:
+            del self._cache[key]
@@ -1,109 +1,433 @@
 # utils/file_loader.py
 
 import os
-import glob
+import csv
 import json
-import pandas as pd
-import pdfplumber
+import mmap
+import re
+from fnmatch import fnmatch
+from utils.tracing import span
 
-def _process_json(file_path):
+SEGMENT_CHARS = 1 << 20     # Text files: ~1M chars per segment
+SEGMENT_RECORDS = 5000      # CSV rows / JSON records per segment
+MMAP_THRESHOLD = 8 << 20    # Text files from 8 MB up are memory-mapped instead of buffered
+
+TEXT_EXTENSIONS = ('.txt', '.md', '.py', '.log')
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS + ('.json', '.jsonl', '.csv', '.pdf')
+# Never worth descending into / reading (matched against each name and relative path)
+DEFAULT_EXCLUDE = ('.*', '__pycache__', 'node_modules')
+
+def _count_lines(file_path):
+    """Counts non-empty lines in constant memory (binary block reads)."""
+    count = 0
+    with open(file_path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                count += 1
+    return count
+
+def _count_csv_rows(file_path):
+    """
+    Counts CSV data rows in constant memory, as records rather than lines: a
+    quoted cell spanning several lines is still one row (blank lines skipped,
+    like pandas does).
+    """
+    with open(file_path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        rows = sum(1 for row in csv.reader(f) if row)
+    return max(rows - 1, 0)  # Minus header
+
+def iter_jsonl_records(file_path):
+    """Yields parsed records of a JSON Lines file, one line at a time."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Tolerate the odd truncated/garbled log line
+
+def _iter_record_batches(records, batch_size=SEGMENT_RECORDS, on_rows=None):
+    """Groups records into JSONL text segments (on_rows gets each batch of records)."""
+    batch, lines = [], []
+    for record in records:
+        batch.append(record)
+        # ensure_ascii=False keeps special characters readable
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) >= batch_size:
+            if on_rows:
+                on_rows(batch)
+            yield "\n".join(lines) + "\n"
+            batch, lines = [], []
+    if lines:
+        if on_rows:
+            on_rows(batch)
+        yield "\n".join(lines) + "\n"
+
+def _iter_jsonl_segments(file_path, on_rows=None):
+    """
+    True line-by-line JSONL path: memory scales with SEGMENT_RECORDS, not file size.
+    """
+    record_count = _count_lines(file_path)
+    records = iter_jsonl_records(file_path)
+    first = next(records, None)
+    keys = list(first.keys()) if isinstance(first, dict) else "Unknown"
+
+    yield (
+        f"Metadata:\n"
+        f"- Type: NoSQL Collection (JSON)\n"
+        f"- Total Records: {record_count}\n"
+        f"- Schema Fields: {keys}\n\n"
+        f"Records:\n"
+    )
+    if first is not None:
+        yield from _iter_record_batches(_prepend(first, records), on_rows=on_rows)
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+_JSON_WS = re.compile(r"[ \t\r\n]*")
+
+def _json_layout(file_path):
+    """
+    "lines" (JSON Lines with a .json name: the first line is a complete value
+    and more follow), "array" (top-level [...]) or "value" (anything else).
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        first = f.readline(SEGMENT_CHARS)
+        while first.endswith("\n") and not first.strip():
+            first = f.readline(SEGMENT_CHARS)
+        if first.endswith("\n"):
+            try:
+                json.loads(first)
+            except json.JSONDecodeError:
+                pass
+            else:
+                if any(line.strip() for line in f):
+                    return "lines"
+        return "array" if first.lstrip().startswith("[") else "value"
+
+def _iter_json_array(file_path):
+    """
+    Yields the items of a top-level JSON array one at a time. The file is
+    read in blocks and decoded item by item, so memory scales with the
+    largest item, not with the file.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buf, pos = "", 0
+
+        def next_char():
+            # Next non-whitespace character, reading on as needed ('' at the end)
+            nonlocal buf, pos
+            while True:
+                pos = _JSON_WS.match(buf, pos).end()
+                if pos < len(buf):
+                    return buf[pos]
+                buf, pos = f.read(SEGMENT_CHARS), 0
+                if not buf:
+                    return ""
+
+        if next_char() != "[":
+            raise ValueError("Invalid JSON format.")
+        pos += 1
+        if next_char() == "]":
+            pos += 1
+        else:
+            while True:
+                next_char()
+                while True:
+                    try:
+                        item, end = decoder.raw_decode(buf, pos)
+                        # Complete only if followed by a delimiter: '12' may be the start of '123'
+                        if _JSON_WS.match(buf, end).end() < len(buf):
+                            break
+                    except json.JSONDecodeError:
+                        end = None
+                    more = f.read(max(SEGMENT_CHARS, len(buf) - pos))  # Doubles for very large items
+                    if not more:
+                        if end is None:
+                            raise ValueError("Invalid JSON format.")
+                        break
+                    buf, pos = buf[pos:] + more, 0
+                yield item
+                pos = end
+                delimiter = next_char()
+                pos += 1
+                if delimiter == "]":
+                    break
+                if delimiter != ",":
+                    raise ValueError("Invalid JSON format.")
+        if next_char():
+            raise ValueError("Invalid JSON format.")  # Data after the array
+
+def iter_json_records(file_path):
+    """
+    Yields the records of a .json / .jsonl collection in constant memory
+    (nothing for a file holding a single object or value).
+    """
+    if file_path.endswith('.jsonl'):
+        return iter_jsonl_records(file_path)
+    layout = _json_layout(file_path)
+    if layout == "lines":
+        return iter_jsonl_records(file_path)
+    if layout == "array":
+        return _iter_json_array(file_path)
+    return iter(())
+
+def _iter_json_segments(file_path, on_rows=None):
     """
     Smart JSON Parser for NoSQL Data.
     Converts list-based JSON into line-delimited text (JSONL) for better RAG chunking.
+
+    Arrays are streamed item by item (one pass to count them for the
+    header, one to convert them). A file holding a single object is still
+    parsed whole, then pretty-printed segment by segment.
     """
+    layout = "lines" if file_path.endswith('.jsonl') else _json_layout(file_path)
+    if layout == "lines":
+        # Several top-level values: it is really JSON Lines with a .json name
+        yield from _iter_jsonl_segments(file_path, on_rows)
+        return
+
+    # Case A: List of Records (e.g., MongoDB dump, Logs)
+    if layout == "array":
+        record_count, keys = 0, "Unknown"
+        for record in _iter_json_array(file_path):
+            if record_count == 0 and isinstance(record, dict):
+                keys = list(record.keys())  # Peek at first record keys
+            record_count += 1
+
+        yield (
+            f"Metadata:\n"
+            f"- Type: NoSQL Collection (JSON)\n"
+            f"- Total Records: {record_count}\n"
+            f"- Schema Fields: {keys}\n\n"
+            f"Records:\n"
+        )
+        # Convert to JSON Lines (one record per line), batch by batch
+        yield from _iter_record_batches(_iter_json_array(file_path), on_rows=on_rows)
+        return
+
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
-        
-        # Case A: List of Records (e.g., MongoDB dump, Logs)
-        if isinstance(data, list):
-            record_count = len(data)
-            # Peek at first record keys if available
-            keys = list(data[0].keys()) if record_count > 0 and isinstance(data[0], dict) else "Unknown"
-            
-            # Convert to JSON Lines (one record per line)
-            # ensure_ascii=False keeps special characters readable
-            jsonl_text = "\n".join([json.dumps(record, ensure_ascii=False) for record in data])
-            
-            return (
-                f"Metadata:\n"
-                f"- Type: NoSQL Collection (JSON)\n"
-                f"- Total Records: {record_count}\n"
-                f"- Schema Fields: {keys}\n\n"
-                f"Records:\n"
-                f"{jsonl_text}"
-            )
-
-        # Case B: Single Huge Object (e.g., Configuration, Nested Profile)
-        elif isinstance(data, dict):
-            # Pretty print with indentation so semantic chunkers usually split at logical brackets
-            pretty_text = json.dumps(data, indent=2, ensure_ascii=False)
-            keys = list(data.keys())
-            return (
-                f"Metadata:\n"
-                f"- Type: NoSQL Document (Single Object)\n"
-                f"- Root Keys: {keys}\n\n"
-                f"Content:\n"
-                f"{pretty_text}"
-            )
-            
-        else:
-            return str(data)
-
     except json.JSONDecodeError:
-        return "Error: Invalid JSON format."
-    except Exception as e:
-        return f"Error parsing JSON: {e}"
+        raise ValueError("Invalid JSON format.")
+
+    # Case B: Single Huge Object (e.g., Configuration, Nested Profile)
+    if isinstance(data, dict):
+        keys = list(data.keys())
+        yield (
+            f"Metadata:\n"
+            f"- Type: NoSQL Document (Single Object)\n"
+            f"- Root Keys: {keys}\n\n"
+            f"Content:\n"
+        )
+        # Pretty print with indentation so semantic chunkers usually split at logical brackets
+        parts, size = [], 0
+        for part in json.JSONEncoder(indent=2, ensure_ascii=False).iterencode(data):
+            parts.append(part)
+            size += len(part)
+            if size >= SEGMENT_CHARS:
+                yield "".join(parts)
+                parts, size = [], 0
+        if parts:
+            yield "".join(parts)
+
+    else:
+        yield str(data)
+
+def _iter_csv_segments(file_path, on_rows=None):
+    """
+    Reads the CSV in row batches; each batch becomes its own Markdown table
+    (with the header row repeated, so every chunk keeps its column names).
+    """
+    import pandas as pd  # Heavy: imported on first use, not at startup
+
+    row_count = _count_csv_rows(file_path)
+    batches = pd.read_csv(file_path, chunksize=SEGMENT_RECORDS)
+    first = next(batches, None)
+    if first is None:
+        return
+    columns = ", ".join(first.columns.tolist())
+    yield f"Metadata:\n- Type: CSV Data\n- Total Rows: {row_count}\n- Columns: {columns}\n\nData Table:\n"
+    if on_rows:
+        on_rows(first)
+    yield first.to_markdown(index=False)
+    for df in batches:
+        if on_rows:
+            on_rows(df)
+        yield "\n" + df.to_markdown(index=False)
+
+def _iter_text_segments(file_path):
+    if os.path.getsize(file_path) >= MMAP_THRESHOLD:
+        yield from _iter_mmap_segments(file_path)
+        return
+    with open(file_path, 'r', encoding='utf-8') as f:
+        while True:
+            # Whole lines up to ~SEGMENT_CHARS, so words are never cut in half
+            lines = f.readlines(SEGMENT_CHARS)
+            if not lines:
+                break
+            yield "".join(lines)
+
+def _iter_mmap_segments(file_path):
+    """
+    Large text files: slices of ~SEGMENT_CHARS bytes ending on a newline, decoded
+    straight from the page cache (no read buffers, no per-line objects).
+    """
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        start = 0
+        while start < size:
+            end = min(start + SEGMENT_CHARS, size)
+            if end < size:
+                newline = mm.find(b"\n", end)
+                end = size if newline == -1 else newline + 1
+            # Cut on a newline, so a multi-byte character is never split; same newlines as text mode
+            yield mm[start:end].decode('utf-8').replace("\r\n", "\n")
+            start = end
+
+def _iter_pdf_segments(file_path):
+    import pdfplumber
+
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages:
+            extracted = page.extract_text()
+            if extracted:
+                yield extracted + "\n"
+            page.flush_cache()  # Release the page's parsed objects
+
+def iter_file_segments(file_path, on_rows=None):
+    """
+    Streams a file as text segments (pages, row batches, record batches),
+    so large inputs never have to be held as one string.
+    Raises on read/parse errors. Unsupported types yield nothing.
+
+    on_rows: Optional callable(batch) for CSV / JSON record collections,
+             called with each batch (DataFrame / list of records) as it is
+             read, so a table can be built from the same single parse.
+    """
+    filename = os.path.basename(file_path).lower()
+
+    if filename.endswith(TEXT_EXTENSIONS):
+        return _iter_text_segments(file_path)
+
+    # UPDATED: Specialized JSON Handler
+    elif filename.endswith(('.json', '.jsonl')):
+        return _iter_json_segments(file_path, on_rows)
+
+    elif filename.endswith('.csv'):
+        return _iter_csv_segments(file_path, on_rows)
+
+    elif filename.endswith('.pdf'):
+        return _iter_pdf_segments(file_path)
+
+    return iter(())
 
 def read_file_content(file_path):
     """
     Helper to read a single file based on extension.
     """
-    filename = os.path.basename(file_path)
-    content = ""
-    
-    try:
-        if filename.endswith(('.txt', '.md', '.py', '.log')):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-        
-        # UPDATED: Specialized JSON Handler
-        elif filename.endswith(('.json', '.jsonl')):
-            content = _process_json(file_path)
-
-        elif filename.endswith('.csv'):
-            df = pd.read_csv(file_path)
-            row_count = len(df)
-            columns = ", ".join(df.columns.tolist())
-            table_text = df.to_markdown(index=False)
-            content = f"Metadata:\n- Type: CSV Data\n- Total Rows: {row_count}\n- Columns: {columns}\n\nData Table:\n{table_text}"
-
-        elif filename.endswith('.pdf'):
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    extracted = page.extract_text()
-                    if extracted:
-                        content += extracted + "\n"
-        
+    with span("load.read_file", file=os.path.basename(file_path)) as s:
+        try:
+            content = "".join(iter_file_segments(file_path))
+        except Exception as e:
+            return f"Error reading file: {e}"
+        s.set(bytes=os.path.getsize(file_path), chars=len(content))
         return content
-    except Exception as e:
-        return f"Error reading file: {e}"
 
-def load_files_raw(directory_path):
+def _matches(name, rel_path, patterns):
+    return any(fnmatch(name, p) or fnmatch(rel_path, p) for p in patterns)
+
+def iter_directory(directory_path, include=None, exclude=DEFAULT_EXCLUDE, max_size=None, recursive=True):
+    """
+    Walks a directory tree with os.scandir and yields (file_id, file_path, stat)
+    for each candidate file, in a stable (sorted) order.
+
+    file_id is the path relative to directory_path with '/' separators
+    ('reports/2024/q1.pdf'): unique across folders and the same on every run,
+    so it is safe as the RAM key, manifest key and chunk id prefix.
+
+    Everything is decided from directory entries, before any file is opened:
+        include:   Glob patterns; if given, only matching files are kept.
+        exclude:   Glob patterns for files AND folders to skip (folders are not entered).
+        max_size:  Skip files larger than this many bytes.
+        Files with an unsupported extension are skipped.
+    Names and relative paths are both matched ('*.log', 'drafts/*').
+    Symlinked folders are followed, but each folder is entered only once
+    (a link back up the tree, e.g. 'a/loop -> ..', would never end).
+    """
+    include = tuple(include or ())
+    exclude = tuple(exclude or ())
+    try:
+        root = os.stat(directory_path)
+        visited = {(root.st_dev, root.st_ino)}
+    except OSError:
+        visited = set()
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(directory_path, rel_dir)) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue  # Unreadable folder (permissions, removed while scanning)
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if exclude and _matches(entry.name, rel_path, exclude):
+                continue
+            try:
+                if entry.is_dir():
+                    if recursive:
+                        st = entry.stat()
+                        if (st.st_dev, st.st_ino) not in visited:
+                            visited.add((st.st_dev, st.st_ino))
+                            subdirs.append(rel_path)
+                    continue
+                if not entry.is_file() or not entry.name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    continue
+                if include and not _matches(entry.name, rel_path, include):
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue  # Broken symlink, or removed while scanning
+            if max_size is not None and st.st_size > max_size:
+                continue
+            yield rel_path, entry.path, st
+        stack.extend(reversed(subdirs))  # Depth-first, in name order
+
+def scan_directory(directory_path, **scan_options):
+    """
+    Lists the candidate files of a directory tree as (file_id, file_path) pairs.
+    scan_options: include, exclude, max_size, recursive (see iter_directory).
+    """
+    return [(file_id, file_path) for file_id, file_path, _ in iter_directory(directory_path, **scan_options)]
+
+def load_files_raw(directory_path, skip=None, **scan_options):
     """
     Scans directory and uses read_file_content for each file.
+    skip: Optional callable(filename, file_path) -> bool. Files it accepts are
+          not read at all (e.g. unchanged files already in the persistent index).
+    scan_options: include, exclude, max_size, recursive (see iter_directory).
     """
-    files = glob.glob(os.path.join(directory_path, "*"))
     print(f"📂 Scanning {directory_path}...")
     
     loaded_files = []
 
-    for file_path in files:
-        filename = os.path.basename(file_path)
-        content = read_file_content(file_path)
-        if content and not content.startswith("Error"):
-            loaded_files.append((filename, content))
-        else:
-            print(f"   ❌ Skipped {filename}")
+    with span("load.files_raw") as s:
+        for filename, file_path in scan_directory(directory_path, **scan_options):
+            if skip and skip(filename, file_path):
+                continue
+            content = read_file_content(file_path)
+            if content and not content.startswith("Error"):
+                loaded_files.append((filename, content))
+            else:
+                print(f"   ❌ Skipped {filename}")
+        s.set(files=len(loaded_files), chars=sum(len(c) for _, c in loaded_files))
 
     return loaded_files
\ No newline at end of file
@@ -0,0 +1,87 @@
+# utils/file_router.py
+
+import os
+import pickle
+import threading
+import numpy as np
+
+SECTION_CHUNKS = 32     # Chunks averaged into one section vector (~20k chars of text)
+PROFILE_CHARS = 2000    # Leading text embedded with the file name (metadata header, title, intro)
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class FileRouter:
+    """
+    File-level index for two-stage retrieval: a few embeddings per file
+
+        profile   name + leading text (CSV/JSON "Metadata:" block, title, intro)
+        sections  mean of each run of SECTION_CHUNKS chunk embeddings
+
+    A global question is matched against these first; the chunk search then
+    only looks inside the best files. A file scores its best vector, so a
+    long file is not diluted into one average of unrelated sections.
+    """
+    def __init__(self):
+        self.files = {}             # {source: float32 [vectors x dim], normalized}
+        self._lock = threading.Lock()
+        self._stacked = None        # (matrix, first row of each file, names), rebuilt after changes
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, source):
+        return source in self.files
+
+    def set(self, source, vectors):
+        with self._lock:
+            self.files[source] = _normalize(vectors)
+            self._stacked = None
+
+    def remove(self, source):
+        with self._lock:
+            if self.files.pop(source, None) is not None:
+                self._stacked = None
+
+    def route(self, query_vectors, n_files):
+        """Top n_files sources for each query vector, best first."""
+        with self._lock:
+            if self._stacked is None and self.files:
+                names = list(self.files)
+                blocks = [self.files[name] for name in names]
+                starts = np.cumsum([0] + [len(b) for b in blocks[:-1]])
+                self._stacked = (np.vstack(blocks), starts, names)
+            stacked = self._stacked
+        if stacked is None:
+            return [[] for _ in query_vectors]
+        matrix, starts, names = stacked
+
+        scores = _normalize(np.vstack(query_vectors)) @ matrix.T
+        per_file = np.maximum.reduceat(scores, starts, axis=1)   # Best vector of each file
+        k = min(n_files, len(names))
+        top = np.argpartition(-per_file, k - 1, axis=1)[:, :k] if len(names) > k else np.tile(np.arange(len(names)), (len(per_file), 1))
+        order = np.argsort(-np.take_along_axis(per_file, top, axis=1), axis=1)
+        return [[names[i] for i in row] for row in np.take_along_axis(top, order, axis=1)]
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with self._lock, open(tmp_path, 'wb') as f:
+            pickle.dump(self.files, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        router = cls()
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    router.files = pickle.load(f)
+            except Exception as e:
+                print(f"   ⚠️ Warning: File routing index unreadable ({e}). Rebuilding.")
+                router.files = {}
+        return router
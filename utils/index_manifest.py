@@ -0,0 +1,101 @@
+# utils/index_manifest.py
+
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = "manifest.json"
+
+def hash_file(file_path, block_size=1 << 20):
+    """
+    SHA-256 of the raw file bytes (read in blocks, never fully in memory).
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_state(file_path):
+    """
+    {size, mtime, sha256} of a file as it is now. Take it BEFORE reading the
+    file for indexing: if the file changes while it is read, the manifest then
+    describes the older version and the next run re-indexes it.
+    """
+    st = os.stat(file_path)
+    return {"size": st.st_size, "mtime": st.st_mtime, "sha256": hash_file(file_path)}
+
+class IndexManifest:
+    """
+    Remembers what is already stored in the persistent vector DB.
+
+    One entry per file:
+        {filename: {path, size, mtime, sha256, chunk_size, chunk_overlap,
+                    embedding_model, tier, chunk_count}}
+
+    A file is reused on restart only if its bytes AND the indexing
+    parameters (chunker settings + embedding model) are unchanged.
+    """
+    def __init__(self, db_path, params):
+        self.path = os.path.join(db_path, MANIFEST_NAME)
+        self.params = params    # {chunk_size, chunk_overlap, embedding_model}
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                print("   ⚠️ Warning: Index manifest unreadable. Rebuilding index.")
+                self.entries = {}
+
+    def get(self, filename):
+        return self.entries.get(filename)
+
+    def is_fresh(self, filename, file_path):
+        """
+        True if the stored entry still describes this file on disk.
+        Cheap path: size + mtime. If only the mtime moved, fall back to the hash.
+        """
+        entry = self.entries.get(filename)
+        if not entry or not file_path or not os.path.exists(file_path):
+            return False
+        if any(entry.get(k) != v for k, v in self.params.items()):
+            return False
+
+        st = os.stat(file_path)
+        if st.st_size != entry["size"]:
+            return False
+        if st.st_mtime == entry["mtime"]:
+            return True
+
+        # Touched but maybe not modified (git checkout, copy, etc.)
+        if hash_file(file_path) == entry["sha256"]:
+            entry["mtime"] = st.st_mtime
+            return True
+        return False
+
+    def record(self, filename, file_path, tier, chunk_count=0, state=None):
+        """state: file_state taken before the file was read (else taken now)."""
+        if not file_path:
+            return
+        if state is None:
+            if not os.path.exists(file_path):
+                return
+            state = file_state(file_path)
+        self.entries[filename] = {
+            "path": os.path.abspath(file_path),
+            **state,
+            **self.params,
+            "tier": tier,
+            "chunk_count": chunk_count,
+        }
+
+    def remove(self, filename):
+        return self.entries.pop(filename, None)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
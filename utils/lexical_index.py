@@ -0,0 +1,192 @@
+# utils/lexical_index.py
+
+import heapq
+import math
+import os
+import pickle
+import re
+from collections import Counter
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Identifier-friendly tokens: "ORD-10293", "ERR_TIMEOUT", "v2.4.1", "0x1F" stay whole
+TOKEN_RE = re.compile(r"[a-z0-9_]+(?:[-./:][a-z0-9_]+)*")
+
+def tokenize(text):
+    """
+    Lowercased word/identifier tokens. Compound identifiers are indexed whole
+    AND by their parts, so both "ord-10293" and "10293" match.
+    """
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(p for p in re.split(r"[-./:_]", token) if p)
+    return tokens
+
+class BM25Index:
+    """
+    In-process BM25 inverted index over chunks.
+
+    postings: {term: {doc_id: term_frequency}}
+    Only documents sharing at least one query term are scored, so lookups
+    stay fast however many chunks are indexed. The same counts are kept per
+    file (source_postings), so whole files can be ranked too (search_sources).
+    """
+    def __init__(self):
+        self.postings = {}
+        self.doc_lengths = {}    # {doc_id: token count}
+        self.doc_sources = {}    # {doc_id: filename}
+        self.doc_terms = {}      # {doc_id: [unique terms]} (needed to delete)
+        self.total_length = 0
+        self.source_docs = {}        # {filename: set of doc_ids}
+        self.source_postings = {}    # {term: {filename: term_frequency}}
+        self.source_lengths = {}     # {filename: token count}
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_id, source, text):
+        if doc_id in self.doc_lengths:
+            self.remove([doc_id])
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        length = sum(counts.values())
+        self.doc_lengths[doc_id] = length
+        self.doc_sources[doc_id] = source
+        self.doc_terms[doc_id] = list(counts)
+        self.total_length += length
+        self.source_docs.setdefault(source, set()).add(doc_id)
+        for term, tf in counts.items():
+            by_source = self.source_postings.setdefault(term, {})
+            by_source[source] = by_source.get(source, 0) + tf
+        self.source_lengths[source] = self.source_lengths.get(source, 0) + length
+
+    def remove(self, doc_ids):
+        for doc_id in doc_ids:
+            if doc_id not in self.doc_lengths:
+                continue
+            source = self.doc_sources.pop(doc_id)
+            for term in self.doc_terms.pop(doc_id):
+                docs = self.postings.get(term)
+                if docs is not None:
+                    tf = docs.pop(doc_id, 0)
+                    if not docs:
+                        del self.postings[term]
+                    by_source = self.source_postings.get(term, {})
+                    if source in by_source:
+                        by_source[source] -= tf
+                        if by_source[source] <= 0:
+                            del by_source[source]
+                            if not by_source:
+                                del self.source_postings[term]
+            length = self.doc_lengths.pop(doc_id)
+            self.total_length -= length
+            self.source_lengths[source] -= length
+            self.source_docs[source].discard(doc_id)
+            if not self.source_docs[source]:
+                del self.source_docs[source]
+                del self.source_lengths[source]
+
+    def search(self, query, n_results=5, source=None):
+        """
+        Returns [(doc_id, score)] best first, optionally restricted to one
+        file (source=filename) or to several (a collection of filenames).
+        """
+        n_docs = len(self.doc_lengths)
+        if n_docs == 0:
+            return []
+        avg_length = self.total_length / n_docs
+
+        allowed = None
+        if source is not None:
+            sources = [source] if isinstance(source, str) else source
+            allowed = set().union(*(self.source_docs.get(s, ()) for s in sources))
+
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            if allowed is None:
+                matches = docs.items()
+            elif len(allowed) < len(docs):
+                # Few chunks in the selected files: look them up instead of scanning the postings
+                matches = [(doc_id, docs[doc_id]) for doc_id in allowed if doc_id in docs]
+            else:
+                matches = [(doc_id, tf) for doc_id, tf in docs.items() if doc_id in allowed]
+            for doc_id, tf in matches:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+    def search_sources(self, query, n_results=5):
+        """
+        Ranks whole files: BM25 with all chunks of a file counted as one
+        document. Only the files containing a query term are scored.
+        Returns [(filename, score)] best first.
+        """
+        n_sources = len(self.source_lengths)
+        if n_sources == 0:
+            return []
+        avg_length = sum(self.source_lengths.values()) / n_sources
+
+        scores = {}
+        for term in set(tokenize(query)):
+            sources = self.source_postings.get(term)
+            if not sources:
+                continue
+            idf = math.log(1 + (n_sources - len(sources) + 0.5) / (len(sources) + 0.5))
+            for source, tf in sources.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.source_lengths[source] / avg_length)
+                scores[source] = scores.get(source, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    state = pickle.load(f)
+                # An index saved by an older version lacks fields: left empty, so it is rebuilt
+                if state.keys() == index.__dict__.keys():
+                    index.__dict__.update(state)
+            except Exception as e:
+                print(f"   ⚠️ Warning: Lexical index unreadable ({e}). Rebuilding.")
+                index = cls()
+        return index
+
+def reciprocal_rank_fusion(rankings, weights, k=60):
+    """
+    Merges several ranked id lists: score(id) = sum(weight / (k + rank)).
+    Returns ids best first.
+    """
+    return [doc_id for doc_id, _ in reciprocal_rank_scores(rankings, weights, k)]
+
+def reciprocal_rank_scores(rankings, weights, k=60):
+    """
+    Same fusion as reciprocal_rank_fusion, as [(id, score)] best first, with
+    scores scaled to 0-1: ranked first by any one list (e.g. the exact id
+    only BM25 finds) scores 1, and so does anything above it.
+    """
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        if not weight:
+            continue
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank)
+    top = max(weights) / (k + 1)
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return [(doc_id, min(score / top, 1.0)) for doc_id, score in ranked]
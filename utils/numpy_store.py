@@ -0,0 +1,315 @@
+# utils/numpy_store.py
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import numpy as np
+
+NUMPY_STORE_DIR = "numpy_store"     # Inside DB_PATH
+NUMPY_DTYPES = ("float16", "int8")
+INITIAL_CAPACITY = 4096             # Rows; the vector file doubles when full
+SEARCH_BLOCK_ROWS = 1024            # Rows widened to float32 per matrix multiply (stays in CPU cache)
+SPAN_KEYS = ("rev", "start", "end")   # Optional metadata of chunks stored as spans
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def _where_sources(where):
+    """Files selected by a Chroma-style filter: {"source": name} or {"source": {"$in": [names]}}."""
+    source = where["source"]
+    return list(source["$in"]) if isinstance(source, dict) else [source]
+
+class NumpyCollection:
+    """
+    Compact exact-search vector store: a drop-in for the subset of the Chroma
+    collection API that VectorEngine uses (count, upsert, delete, get, query).
+
+        vectors_N.npy memory-mapped [N x dim] array of normalized embeddings,
+                      float16 (2 bytes/dim) or int8 (1 byte/dim + one
+                      float32 scale per row in scales_N.npy)
+        chunks.db     SQLite: row -> (id, source, chunk_index, document,
+                      span_rev, span_start, span_end); the last three are set for chunks
+                      stored as a span of their file's text (utils/document_store.py)
+
+    In memory there is only the id -> row map and a per-file row table, so
+    focused searches score just that file's rows. Search is brute force:
+    block-wise matrix multiply + argpartition, so results are exact (up to
+    the storage precision) and there is no graph index to build or load.
+    Deleted rows are zeroed and reused by later inserts.
+    """
+    def __init__(self, path, dtype="int8"):
+        if dtype not in NUMPY_DTYPES:
+            raise ValueError(f"Unsupported vector dtype '{dtype}' (use one of {', '.join(NUMPY_DTYPES)}).")
+        self.path = path
+        self.dtype = dtype
+        self._lock = threading.RLock()
+        self._meta_path = os.path.join(path, "meta.json")
+
+        meta = self._read_meta()
+        if meta and meta.get("dtype") != dtype:
+            # Vectors cannot be re-quantized without the originals: start over
+            # (the embedding cache makes re-indexing cheap)
+            print(f"   ⚠️ Vector store was built with {meta.get('dtype')}, not {dtype}: rebuilding it.")
+            shutil.rmtree(path, ignore_errors=True)
+            meta = None
+        os.makedirs(path, exist_ok=True)
+
+        self._db = sqlite3.connect(os.path.join(path, "chunks.db"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, source TEXT NOT NULL,"
+            " chunk_index INTEGER NOT NULL, document TEXT NOT NULL,"
+            " span_rev INTEGER, span_start INTEGER, span_end INTEGER)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(chunks)")}
+        for key in SPAN_KEYS:
+            if f"span_{key}" not in columns:  # Store written before chunks could be spans
+                self._db.execute(f"ALTER TABLE chunks ADD COLUMN span_{key} INTEGER")
+        self._db.commit()
+
+        self.dim = meta["dim"] if meta else None
+        self.capacity = meta["capacity"] if meta else 0
+        self.vectors = None
+        self.scales = None
+        if self.dim:
+            self._open_arrays("r+")
+
+        # Row bookkeeping (rebuilt from SQLite: it is the source of truth)
+        self.rows = {}          # {id: row}
+        self.row_ids = {}       # {row: id}
+        self.file_rows = {}     # {source: set of rows}
+        self.alive = np.zeros(self.capacity, dtype=bool)
+        for row, doc_id, source in self._db.execute("SELECT row, id, source FROM chunks"):
+            self.rows[doc_id] = row
+            self.row_ids[row] = doc_id
+            self.file_rows.setdefault(source, set()).add(row)
+            self.alive[row] = True
+        self.free_rows = sorted(set(range(self.capacity)) - set(self.rows.values()), reverse=True)
+
+    # --- Storage ---
+
+    def _read_meta(self):
+        try:
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self):
+        with open(self._meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype, "capacity": self.capacity}, f)
+
+    def _array_paths(self, capacity):
+        return (os.path.join(self.path, f"vectors_{capacity}.npy"),
+                os.path.join(self.path, f"scales_{capacity}.npy"))
+
+    def _open_arrays(self, mode):
+        vectors_path, scales_path = self._array_paths(self.capacity)
+        self.vectors = np.lib.format.open_memmap(
+            vectors_path, mode=mode,
+            dtype=np.dtype(self.dtype), shape=(self.capacity, self.dim) if mode == "w+" else None,
+        )
+        if self.dtype == "int8":
+            self.scales = np.lib.format.open_memmap(
+                scales_path, mode=mode,
+                dtype=np.float32, shape=(self.capacity,) if mode == "w+" else None,
+            )
+
+    def _grow(self, needed):
+        """
+        Makes room for `needed` more rows (doubling). The bigger arrays go to
+        new files, so searches still scanning the old mapping are unaffected.
+        """
+        capacity = max(self.capacity, INITIAL_CAPACITY)
+        while capacity - len(self.rows) < needed:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+        old_vectors, old_scales, old_capacity = self.vectors, self.scales, self.capacity
+        self.capacity = capacity
+        self._open_arrays("w+")
+        if old_vectors is not None:
+            self.vectors[:old_capacity] = old_vectors
+            if old_scales is not None:
+                self.scales[:old_capacity] = old_scales
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:old_capacity] = self.alive
+        self.alive = alive
+        self.free_rows = list(range(capacity - 1, old_capacity - 1, -1)) + self.free_rows
+        self._write_meta()
+        if old_vectors is not None:
+            for old_path in self._array_paths(old_capacity):
+                try:
+                    os.remove(old_path)  # Still mapped by running searches: POSIX keeps the data
+                except OSError:
+                    pass  # Missing (float16), or Windows refuses while mapped
+
+    def _store_vectors(self, rows, vectors):
+        if self.dtype == "int8":
+            # Symmetric per-row quantization: v ~= q * scale, q in [-127, 127]
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self.vectors[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self.scales[rows] = scales
+        else:
+            self.vectors[rows] = vectors.astype(np.float16)
+
+    def flush(self):
+        with self._lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+            if self.scales is not None:
+                self.scales.flush()
+
+    # --- Chroma-compatible API ---
+
+    def count(self):
+        return len(self.rows)
+
+    def upsert(self, documents, embeddings, ids, metadatas):
+        vectors = _normalize(embeddings)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            new = sum(1 for doc_id in dict.fromkeys(ids) if doc_id not in self.rows)
+            if len(self.free_rows) < new:
+                self._grow(new)
+            rows = []
+            for doc_id, meta in zip(ids, metadatas):
+                row = self.rows.get(doc_id)
+                if row is None:
+                    row = self.free_rows.pop()
+                    self.rows[doc_id] = row
+                    self.row_ids[row] = doc_id
+                    self.file_rows.setdefault(meta["source"], set()).add(row)
+                rows.append(row)
+            self._store_vectors(np.array(rows), vectors)
+            self.alive[rows] = True
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(row, doc_id, meta["source"], meta["chunk_index"], doc, *(meta.get(key) for key in SPAN_KEYS))
+                 for row, doc_id, meta, doc in zip(rows, ids, metadatas, documents)],
+            )
+            self._db.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            rows = [self.rows.pop(doc_id) for doc_id in ids if doc_id in self.rows]
+            if not rows:
+                return
+            for row in rows:
+                del self.row_ids[row]
+            for source_rows in self.file_rows.values():
+                source_rows.difference_update(rows)
+            self.file_rows = {s: r for s, r in self.file_rows.items() if r}
+            self.alive[rows] = False
+            self.vectors[rows] = 0
+            self.free_rows.extend(rows)
+            self._db.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in rows])
+            self._db.commit()
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas")):
+        query = "SELECT id, source, chunk_index, document, span_rev, span_start, span_end FROM chunks"
+        with self._lock:
+            if ids is not None:
+                rows = []
+                for i in range(0, len(ids), 500):
+                    part = ids[i:i + 500]
+                    rows += self._db.execute(f"{query} WHERE id IN ({','.join('?' * len(part))})", part).fetchall()
+            elif where:
+                sources = _where_sources(where)
+                rows = self._db.execute(f"{query} WHERE source IN ({','.join('?' * len(sources))})", sources).fetchall()
+            else:
+                rows = self._db.execute(query).fetchall()
+        result = {"ids": [r[0] for r in rows]}
+        if "documents" in include:
+            result["documents"] = [r[3] for r in rows]
+        if "metadatas" in include:
+            result["metadatas"] = []
+            for r in rows:
+                meta = {"source": r[1], "chunk_index": r[2]}
+                if r[4] is not None:
+                    meta.update(zip(SPAN_KEYS, r[4:]))
+                result["metadatas"].append(meta)
+        return result
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "distances")):
+        """
+        Exact top-n by cosine similarity for each query vector.
+        Returns Chroma's shape: {"ids": [[...]], "documents": [[...]], "distances": [[...]]}
+        (documents only if included: they are the one part read from SQLite).
+        """
+        queries = _normalize(query_embeddings)
+        with self._lock:
+            # Snapshot: inserts/growth after this point do not affect the scan
+            vectors, scales, alive = self.vectors, self.scales, self.alive
+            if where:
+                rows = set().union(*(self.file_rows.get(source, ()) for source in _where_sources(where)))
+                candidates = np.array(sorted(rows), dtype=np.int64)
+            else:
+                candidates = None
+        result = {"ids": [], "distances": []}
+        if "documents" in include:
+            result["documents"] = []
+        if vectors is None or not self.rows or (candidates is not None and not len(candidates)):
+            return {key: [[] for _ in queries] for key in result}
+
+        best_rows, best_scores = self._top_k(queries, vectors, scales, alive, candidates, n_results)
+
+        with self._lock:
+            row_ids = {int(r): self.row_ids.get(int(r)) for rows in best_rows for r in rows}
+            documents = {}
+            if "documents" in include:
+                all_rows = sorted(row_ids)
+                for i in range(0, len(all_rows), 500):
+                    part = all_rows[i:i + 500]
+                    documents.update(self._db.execute(
+                        f"SELECT row, document FROM chunks WHERE row IN ({','.join('?' * len(part))})", part))
+        for rows, scores in zip(best_rows, best_scores):
+            # Rows deleted since the scan are dropped
+            hits = [(int(r), s) for r, s in zip(rows, scores) if row_ids[int(r)] is not None]
+            result["ids"].append([row_ids[r] for r, _ in hits])
+            result["distances"].append([float(1.0 - s) for _, s in hits])
+            if "documents" in include:
+                result["documents"].append([documents.get(r, "") for r, _ in hits])
+        return result
+
+    def _top_k(self, queries, vectors, scales, alive, candidates, k):
+        """
+        Scores all (or the candidate) rows block by block, then one argpartition.
+        Each block is widened to float32 in a reused, cache-sized buffer.
+        """
+        if candidates is None:
+            rows = np.flatnonzero(alive)
+            total = rows[-1] + 1 if len(rows) else 0   # Rows are reused lowest-first: skip the free tail
+        else:
+            rows = candidates
+            total = len(candidates)
+        scores = np.empty((len(queries), total), dtype=np.float32)
+        buffer = np.empty((min(SEARCH_BLOCK_ROWS, total), vectors.shape[1]), dtype=np.float32)
+        for start in range(0, total, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, total)
+            # Whole rows: a contiguous slice of the mapping (no gather); one file: its rows
+            block = vectors[start:end] if candidates is None else vectors[candidates[start:end]]
+            widened = buffer[:end - start]
+            np.copyto(widened, block)
+            np.matmul(queries, widened.T, out=scores[:, start:end])
+        if candidates is None and len(rows) < total:
+            scores = scores[:, rows]   # Free rows are not results
+        if scales is not None:
+            scores *= scales[rows]
+
+        k = min(k, len(rows))
+        if not k:
+            return [[] for _ in queries], [[] for _ in queries]
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k] if len(rows) > k else np.tile(np.arange(len(rows)), (len(queries), 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take(rows, np.take_along_axis(top, order, axis=1)), np.take_along_axis(top_scores, order, axis=1)
@@ -0,0 +1,304 @@
+# utils/tabular_store.py
+
+import os
+import re
+from utils.file_loader import iter_json_records
+
+TABULAR_EXTENSIONS = ('.csv', '.json', '.jsonl')
+CATEGORY_MAX_UNIQUE = 1000     # Text columns with fewer distinct values become 'category'
+MAX_RESULT_ROWS = 20           # Rows of a grouped result shown in the prompt
+MIN_NAME_CHARS = 3             # Shorter column names / values are only matched when named exactly
+
+# sum/mean/max/min only apply when the question also names a numeric column
+AGGREGATE_WORDS = {
+    "sum": ("total", "sum", "overall"),
+    "mean": ("average", "avg", "mean"),
+    "count": ("how many", "count of", "number of"),
+    "max": ("maximum", "max", "highest", "largest", "most", "top"),
+    "min": ("minimum", "min", "lowest", "smallest", "least"),
+}
+
+def _records_frame(records, batch_size=5000):
+    """Flattens JSON records (nested keys -> 'a.b' columns) batch by batch."""
+    import pandas as pd  # Heavy: imported on first use, not at startup
+
+    frames, batch = [], []
+    for record in records:
+        if isinstance(record, dict):
+            batch.append(record)
+        if len(batch) >= batch_size:
+            frames.append(pd.json_normalize(batch))
+            batch = []
+    if batch:
+        frames.append(pd.json_normalize(batch))
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+def load_table(file_path):
+    """
+    Loads a CSV / JSON collection / JSONL file as a compact DataFrame.
+    Returns None for files that are not record collections.
+    """
+    import pandas as pd
+
+    if file_path.endswith('.csv'):
+        df = pd.read_csv(file_path)
+    elif file_path.endswith(('.json', '.jsonl')):
+        df = _records_frame(iter_json_records(file_path))
+    else:
+        return None
+
+    return _compact(df)
+
+def batch_frame(batch):
+    """A batch from iter_file_segments(on_rows=...) as a DataFrame (None if it holds no records)."""
+    if isinstance(batch, list):
+        return _records_frame(batch)
+    return batch
+
+def table_from_batches(frames):
+    """Builds the table of a file from its streamed row batches (None if empty)."""
+    import pandas as pd
+
+    frames = [df for df in frames if df is not None]
+    return _compact(pd.concat(frames, ignore_index=True)) if frames else None
+
+def _compact(df):
+    import pandas as pd
+
+    if df is None or df.empty:
+        return None
+
+    # Low-cardinality text -> category: smaller in RAM and faster to filter/group
+    for col in df.columns:
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
+            try:
+                if df[col].nunique() <= CATEGORY_MAX_UNIQUE:
+                    df[col] = df[col].astype("category")
+            except TypeError:
+                df[col] = df[col].astype(str)  # Unhashable cells (lists/dicts)
+    return df
+
+def column_stats(df):
+    """Per-column statistics computed once at ingestion."""
+    import pandas as pd
+
+    stats = {}
+    for col in df.columns:
+        series = df[col]
+        entry = {"non_null": int(series.notna().sum())}
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            entry.update({
+                "type": "number",
+                "sum": float(series.sum()),
+                "mean": float(series.mean()) if entry["non_null"] else None,
+                "min": float(series.min()) if entry["non_null"] else None,
+                "max": float(series.max()) if entry["non_null"] else None,
+            })
+        else:
+            counts = series.value_counts()
+            entry.update({
+                "type": "category" if isinstance(series.dtype, pd.CategoricalDtype) else "text",
+                "unique": int(series.nunique()),
+                "top": {str(k): int(v) for k, v in counts.head(5).items()},
+            })
+        stats[col] = entry
+    return stats
+
+def _fmt(value):
+    if isinstance(value, float):
+        return f"{value:,.2f}".rstrip("0").rstrip(".")
+    return f"{value:,}" if isinstance(value, int) else str(value)
+
+def _normalize(name):
+    return re.sub(r"[\W_]+", " ", str(name).lower()).strip()
+
+class TabularStore:
+    """
+    Columnar copies of CSV / JSON collections for exact analytics.
+
+    Aggregate questions ("total revenue by region", "how many records have
+    status=failed") are answered with vectorized pandas operations over the
+    whole table, and only the small computed result goes into the prompt.
+    """
+    def __init__(self):
+        self.tables = {}   # {filename: DataFrame}
+        self.stats = {}    # {filename: {column: stats}}
+
+    def __contains__(self, filename):
+        return filename in self.tables
+
+    def add(self, filename, df):
+        self.tables[filename] = df
+        self.stats[filename] = column_stats(df)
+
+    def remove(self, filename):
+        self.tables.pop(filename, None)
+        self.stats.pop(filename, None)
+
+    def relevant_tables(self, user_query):
+        """Tables named in the query, else tables whose columns the query mentions."""
+        norm_query = f" {_normalize(user_query)} "
+        named = [
+            f for f in list(self.tables)
+            if f.lower() in user_query.lower()
+            or f" {_normalize(os.path.splitext(os.path.basename(f))[0])} " in norm_query
+        ]
+        if named:
+            return named
+        return [
+            f for f, df in list(self.tables.items())
+            if any(f" {_normalize(c)} " in norm_query for c in df.columns)
+        ]
+
+    # --- Query planning ---
+
+    def _mentioned_columns(self, df, norm_query):
+        return [c for c in df.columns if f" {_normalize(c)} " in norm_query]
+
+    def _filters(self, df, user_query):
+        """
+        Equality filters: explicit 'col=value' / 'col is value', or a known
+        category value of at least MIN_NAME_CHARS characters appearing as a
+        whole word in the query ("failed", not the "a" in "a table").
+        """
+        import pandas as pd
+
+        filters = {}
+        for col in df.columns:
+            # "is" only as a word: "analysis" is not "analys is ..."
+            pattern = rf"\b{re.escape(str(col))}(?:\s*(?:==|=|:)\s*|\s+is\s+)['\"]?([\w\-.@]+)"
+            match = re.search(pattern, user_query, flags=re.IGNORECASE)
+            if match:
+                filters[col] = match.group(1)
+                continue
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                for value in df[col].cat.categories:
+                    text = str(value)
+                    if len(text) >= MIN_NAME_CHARS and re.search(rf"(?<!\w){re.escape(text)}(?!\w)", user_query,
+                                                                 flags=re.IGNORECASE):
+                        filters[col] = text
+                        break
+        return filters
+
+    def _apply_filters(self, df, filters):
+        import pandas as pd
+
+        mask = pd.Series(True, index=df.index)
+        for col, value in filters.items():
+            series = df[col]
+            if pd.api.types.is_numeric_dtype(series):
+                try:
+                    mask &= series == float(value)
+                    continue
+                except ValueError:
+                    pass
+            wanted = str(value).lower()
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                # Compare against the few categories, not every row
+                matches = [c for c in series.cat.categories if str(c).lower() == wanted]
+                mask &= series.isin(matches)
+            else:
+                mask &= series.astype(str).str.lower() == wanted
+        return df[mask]
+
+    def _aggregates(self, user_query):
+        query = f" {_normalize(user_query)} "
+        return [func for func, words in AGGREGATE_WORDS.items() if any(f" {w} " in query for w in words)]
+
+    def _group_column(self, df, user_query):
+        # Only "by <column>": "sent by mail" is not a grouping
+        for match in re.finditer(r"\b(?:by|per|for each|each)\s+([\w\-. ]+)", user_query, flags=re.IGNORECASE):
+            wanted = _normalize(match.group(1))
+            # The whole phrase, or its first words ("by region and year"); a short
+            # name ("a", "id") only as the whole phrase, never as a word prefix
+            named = [
+                col for col in df.columns
+                if wanted == _normalize(col)
+                or (len(_normalize(col)) >= MIN_NAME_CHARS and wanted.startswith(_normalize(col) + " "))
+            ]
+            if named:
+                return max(named, key=lambda col: len(_normalize(col)))  # "order date" over "order"
+        return None
+
+    def _plan(self, filename, user_query):
+        """
+        (filters, group column, func, metric) the question asks of a table, or
+        None if it asks for no computation: no grouping by one of its columns,
+        no count, no sum/mean/max/min of one of its numeric columns.
+        """
+        import pandas as pd
+
+        df = self.tables[filename]
+        norm_query = f" {_normalize(user_query)} "
+        filters = self._filters(df, user_query)
+        group_col = self._group_column(df, user_query)
+        filters.pop(group_col, None)  # "revenue by region" is a grouping, not a filter
+
+        funcs = self._aggregates(user_query)
+        numeric = [
+            c for c in self._mentioned_columns(df, norm_query)
+            if c != group_col and c not in filters and pd.api.types.is_numeric_dtype(df[c])
+        ]
+        metric_funcs = [func for func in funcs if func != "count"]
+        if metric_funcs and numeric:
+            return filters, group_col, metric_funcs[0], numeric[0]
+        if "count" in funcs or group_col is not None:
+            return filters, group_col, "count", None
+        return None
+
+    def is_analytic(self, filename, user_query):
+        """True if the question asks for an aggregate / group-by over this table."""
+        return self._plan(filename, user_query) is not None
+
+    def describe(self, filename):
+        """Compact schema + precomputed per-column statistics."""
+        df = self.tables[filename]
+        lines = [f"Table: {filename} ({len(df):,} rows × {len(df.columns)} columns)"]
+        for col, s in self.stats[filename].items():
+            if s["type"] == "number":
+                lines.append(
+                    f"- {col} (number): sum={_fmt(s['sum'])}, mean={_fmt(s['mean'])}, "
+                    f"min={_fmt(s['min'])}, max={_fmt(s['max'])}"
+                )
+            else:
+                top = ", ".join(f"{k} ({v})" for k, v in s["top"].items())
+                lines.append(f"- {col} ({s['type']}, {s['unique']} unique): top values {top}")
+        return "\n".join(lines)
+
+    def answer(self, filename, user_query):
+        """
+        Runs the filter/aggregate the question asks for over the full table.
+        Returns a compact text block (schema stats + computed result), or
+        None if the question asks for no computation (see is_analytic).
+        """
+        plan = self._plan(filename, user_query)
+        if plan is None:
+            return None
+        filters, group_col, func, metric = plan
+
+        df = self.tables[filename]
+        parts = [self.describe(filename)]
+        view = self._apply_filters(df, filters) if filters else df
+        if filters:
+            desc = " AND ".join(f"{c} = {v}" for c, v in filters.items())
+            parts.append(f"\nFilter: {desc} → {len(view):,} of {len(df):,} rows match")
+
+        label = f"{func}({metric})" if metric else "count(rows)"
+        if group_col is not None:
+            grouped = view.groupby(group_col, observed=True)
+            result = grouped.size() if metric is None else grouped[metric].agg(func)
+            result = result.sort_values(ascending=func == "min")  # Lowest first for "min"
+            parts.append(f"\nResult: {label} by {group_col} (computed over all matching rows)")
+            parts.append(f"| {group_col} | {label} |\n|---|---|")
+            for key, value in result.head(MAX_RESULT_ROWS).items():
+                parts.append(f"| {key} | {_fmt(value.item() if hasattr(value, 'item') else value)} |")
+            if len(result) > MAX_RESULT_ROWS:
+                parts.append(f"(… {len(result) - MAX_RESULT_ROWS} more groups)")
+        else:
+            value = len(view) if metric is None else view[metric].agg(func)
+            value = value.item() if hasattr(value, "item") else value
+            parts.append(f"\nResult: {label} = {_fmt(value)} (computed over all matching rows)")
+        return "\n".join(parts)
+
+def is_tabular(filename):
+    return os.path.basename(filename).lower().endswith(TABULAR_EXTENSIONS)
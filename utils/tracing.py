@@ -0,0 +1,157 @@
+# utils/tracing.py
+
+import json
+import threading
+import time
+from collections import deque
+
+MAX_SAMPLES = 10_000    # Durations kept per span name (oldest dropped first)
+
+class _NoopSpan:
+    """Returned while tracing is off: entering/leaving it does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NOOP = _NoopSpan()
+
+class Span:
+    __slots__ = ("tracer", "name", "attrs", "start")
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self.name, time.perf_counter() - self.start, self.attrs)
+        return False
+
+    def set(self, **attrs):
+        """Attaches sizes known only after the work (chars, chunks, tokens...)."""
+        self.attrs.update(attrs)
+
+class Tracer:
+    """
+    Lightweight timing spans for the pipeline hot paths.
+
+        with TRACER.span("search", n_results=5) as s:
+            ...
+            s.set(results=len(docs))
+
+    Disabled by default: span() then returns a shared no-op object, so the
+    instrumented code pays one attribute check per call. When enabled, each
+    span keeps its duration + numeric attributes in memory (for :stats) and
+    is optionally appended to a JSONL trace file.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._durations = {}    # {name: deque of seconds}
+        self._counts = {}       # {name: total calls}
+        self._totals = {}       # {name: {attr: sum}}
+        self._trace_file = None
+
+    def enable(self, trace_path=None):
+        """Starts recording. trace_path: Optional JSONL file (appended to)."""
+        if trace_path:
+            self._trace_file = open(trace_path, "a", encoding="utf-8")
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if self._trace_file:
+            self._trace_file.close()
+            self._trace_file = None
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+            self._totals.clear()
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return _NOOP
+        return Span(self, name, attrs)
+
+    def record(self, name, seconds, attrs):
+        with self._lock:
+            if name not in self._durations:
+                self._durations[name] = deque(maxlen=MAX_SAMPLES)
+                self._counts[name] = 0
+                self._totals[name] = {}
+            self._durations[name].append(seconds)
+            self._counts[name] += 1
+            totals = self._totals[name]
+            for key, value in attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+            if self._trace_file:
+                entry = {"ts": round(time.time(), 6), "span": name, "ms": round(seconds * 1000, 3), **attrs}
+                self._trace_file.write(json.dumps(entry, default=str) + "\n")
+                self._trace_file.flush()
+
+    def stats(self):
+        """{name: {count, p50_ms, p95_ms, p99_ms, max_ms, total_ms, attrs: {attr: sum}}}"""
+        with self._lock:
+            snapshot = {name: sorted(samples) for name, samples in self._durations.items()}
+            counts = dict(self._counts)
+            totals = {name: dict(t) for name, t in self._totals.items()}
+
+        def pct(ordered, p):
+            return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+        return {
+            name: {
+                "count": counts[name],
+                "p50_ms": pct(ordered, 50),
+                "p95_ms": pct(ordered, 95),
+                "p99_ms": pct(ordered, 99),
+                "max_ms": ordered[-1] * 1000,
+                "total_ms": sum(ordered) * 1000,
+                "attrs": totals[name],
+            }
+            for name, ordered in snapshot.items()
+        }
+
+# Process-wide tracer used by all instrumented modules
+TRACER = Tracer()
+
+def span(name, **attrs):
+    return TRACER.span(name, **attrs)
+
+def _fmt_avg(value):
+    return f"{value:,.0f}" if abs(value) >= 100 else f"{value:.3g}"
+
+def format_stats(stats):
+    """Renders Tracer.stats() as a table (one row per span, slowest total first)."""
+    if not stats:
+        return "📊 No spans recorded yet."
+    lines = [
+        "📊 Stage timings (ms):",
+        f"   {'span':<24}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'total':>11}",
+    ]
+    for name, s in sorted(stats.items(), key=lambda item: -item[1]["total_ms"]):
+        lines.append(
+            f"   {name:<24}{s['count']:>7}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+            f"{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}{s['total_ms']:>11.1f}"
+        )
+        if s["attrs"]:
+            # Per-call averages: e.g. chars, chunks, prompt_tokens
+            averages = ", ".join(f"{k}≈{_fmt_avg(v / s['count'])}" for k, v in sorted(s["attrs"].items()))
+            lines.append(f"   {'':<24}avg {averages}")
+    return "\n".join(lines)
@@ -1,14 +1,61 @@
 # utils/vector_store.py
 
-import chromadb
-from chromadb.utils import embedding_functions
+import hashlib
+import numpy as np
 import os
 import shutil
+import sqlite3
 import stat
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.document_store import DocumentStore
+from utils.file_router import FileRouter, SECTION_CHUNKS, PROFILE_CHARS
+from utils.lexical_index import BM25Index, reciprocal_rank_scores
+from utils.tracing import span
 
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 DB_PATH = "./database_store"
+# Lives OUTSIDE DB_PATH so it survives the reset_db wipe
+EMBED_CACHE_PATH = "./embedding_cache.sqlite3"
+EMBED_CACHE_MAX_ENTRIES = 500_000   # ~0.8 GB of float32 MiniLM vectors
+LEXICAL_INDEX_PATH = os.path.join(DB_PATH, "bm25_index.pkl")
+# Text of the vector-tier files; chunks are (rev, start, end) spans into it
+DOCUMENT_STORE_PATH = os.path.join(DB_PATH, "documents.sqlite3")
+FILE_ROUTER_PATH = os.path.join(DB_PATH, "file_router.pkl")
+
+# Dense storage: "chroma" (HNSW + SQLite) or "numpy" (exact search over a
+# memory-mapped float16/int8 array, see utils/numpy_store.py)
+VECTOR_BACKENDS = ("chroma", "numpy")
+VECTOR_BACKEND = "chroma"
+# Each file's chunks live in exactly one of VECTOR_PARTITIONS collections (stable
+# hash of the filename): focused searches query one small partition, global
+# searches query all of them in parallel and merge the top-k. The fan-out adds a
+# fixed cost to every global search, so a single collection is the default and
+# more partitions (--partitions) only pay off on large indexes with many @file
+# questions (benchmarks: --only search)
+VECTOR_PARTITIONS = 1
+SUGGESTED_PARTITIONS = 8
+PARTITION_PREFIX = "docs_"
+NUMPY_DTYPE = "int8"          # Fastest to scan; "float16" keeps ~2% more top-10 recall
+
+# Hybrid retrieval: Reciprocal Rank Fusion of dense (embedding) + lexical (BM25) ranks
+DENSE_WEIGHT = 1.0
+LEXICAL_WEIGHT = 1.0     # 0 disables the BM25 leg (pure dense search)
+RRF_K = 60
+# BM25 hits scoring below this fraction of the best hit are noise (e.g. matched
+# only a common word) and would otherwise push real dense results out of the fusion
+LEXICAL_MIN_SCORE_RATIO = 0.1
+
+# Two-stage global search (opt-in): first pick the N files whose profile /
+# section embeddings match best (utils/file_router.py) plus the N / 2 best files
+# by BM25, then search chunks inside those only. Much faster on large folders,
+# but it returns only about half the flat top 5 (benchmarks: --only routing), so
+# it is off unless asked for. With few files a flat search costs no more, so
+# routing starts above ROUTE_MIN_FILES files.
+ROUTE_FILES = 0          # 0 = always search every chunk
+SUGGESTED_ROUTE_FILES = 8
+ROUTE_MIN_FILES = 32
 
 def force_delete_readonly(func, path, excinfo):
     """
@@ -17,12 +64,151 @@ def force_delete_readonly(func, path, excinfo):
     os.chmod(path, stat.S_IWRITE)
     func(path)
 
+def partition_names(count):
+    """Collection names of a layout; the count is part of the name, so layouts never mix."""
+    return [f"{PARTITION_PREFIX}{i:02d}_of_{count:02d}" for i in range(count)]
+
+def partition_index(filename, count):
+    """Router: the partition a file belongs to (stable across runs and processes)."""
+    return int(hashlib.blake2b(filename.encode('utf-8'), digest_size=4).hexdigest(), 16) % count
+
+def chunk_records(filename, chunk_count, start=0, spans=None, revision=None):
+    """
+    Deterministic ids + metadata for a file's chunks: '{filename}_{i}'.
+    spans: Optional (start, end) per chunk in revision `revision` of the
+           file's text (DocumentStore); such chunks get rev/start/end metadata
+           and are stored without their own copy of the text.
+    """
+    indexes = range(start, start + chunk_count)
+    ids = [f"{filename}_{i}" for i in indexes]
+    metadatas = [{"source": filename, "chunk_index": i} for i in indexes]
+    if spans is not None and revision is not None:
+        for meta, (span_start, span_end) in zip(metadatas, spans):
+            if span_start is not None:  # Not found verbatim: the chunk keeps its text
+                meta.update(rev=revision, start=span_start, end=span_end)
+    return ids, metadatas
+
+def parse_chunk_id(doc_id):
+    """
+    Inverse of chunk_records: '{filename}_{i}' -> (filename, i).
+    """
+    filename, _, index = doc_id.rpartition("_")
+    return filename, int(index)
+
+class EmbeddingCache:
+    """
+    Content-addressed, on-disk embedding cache (SQLite).
+
+    Key:   (sha256(text), model_name)
+    Value: float32 vector bytes
+    Bounded: Least-recently-used rows are evicted above max_entries.
+    """
+    def __init__(self, path=EMBED_CACHE_PATH, model_name=EMBEDDING_MODEL,
+                 max_entries=EMBED_CACHE_MAX_ENTRIES):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT NOT NULL, model TEXT NOT NULL, vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL, PRIMARY KEY (key, model))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings (last_used)")
+        self._db.commit()
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, texts):
+        """Returns a list aligned with texts: vector (np.float32) or None on a miss."""
+        keys = [self.key(t) for t in texts]
+        found = {}
+        with self._lock:
+            # SQLite limits bound parameters per statement, so look up in slices
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({marks})",
+                    [self.model_name, *part],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ? AND model = ?",
+                    [(now, k, self.model_name) for k in found],
+                )
+                self._db.commit()
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return [np.frombuffer(found[k], dtype=np.float32) if k in found else None for k in keys]
+
+    def put_many(self, texts, vectors):
+        now = time.time()
+        rows = [
+            (self.key(t), self.model_name, np.asarray(v, dtype=np.float32).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+
+    def stats(self):
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+def _add_to_section(sections, chunk_index, vector):
+    """Sums a chunk's unit vector into its section of {section: summed vector}."""
+    section = chunk_index // SECTION_CHUNKS
+    vector = np.asarray(vector, dtype=np.float32)
+    vector = vector / (np.linalg.norm(vector) or 1.0)
+    sections[section] = sections[section] + vector if section in sections else vector
+
 class VectorEngine:
-    def __init__(self, reset_db=True):
+    def __init__(self, reset_db=True, dense_weight=DENSE_WEIGHT, lexical_weight=LEXICAL_WEIGHT,
+                 embedding_fn=None, backend=VECTOR_BACKEND, numpy_dtype=NUMPY_DTYPE,
+                 partitions=VECTOR_PARTITIONS, route_files=ROUTE_FILES):
         """
         Initializes the Vector DB.
         Safe for Windows: Handles file locking issues during reset.
+        dense_weight / lexical_weight: RRF weights of the two retrieval legs.
+        embedding_fn: Optional Chroma-compatible embedding function replacing
+                      the default SentenceTransformer model (benchmarks, tests).
+        backend: "chroma" or "numpy" (see VECTOR_BACKENDS); numpy_dtype: "float16" or "int8".
+        partitions: Number of collections the chunks are spread over (by file).
+        route_files: Files a global search is narrowed to (0 = flat search).
         """
+        if backend not in VECTOR_BACKENDS:
+            raise ValueError(f"Unknown vector backend '{backend}' (use one of {', '.join(VECTOR_BACKENDS)}).")
+        # Heavy (Chroma + torch via sentence-transformers): imported only when
+        # the engine is built, so the REPL can start before they are loaded
+        import chromadb
+        from chromadb.utils import embedding_functions
+
         if reset_db and os.path.exists(DB_PATH):
             print("   🧹 Cleaning up old database...", end=" ")
             try:
@@ -38,52 +224,496 @@ class VectorEngine:
                     print(f"\n   ⚠️ Warning: Could not fully delete DB ({e}). Trying to proceed.")
             print("Done.")
 
-        self.client = chromadb.PersistentClient(path=DB_PATH)
-        
         # Uses HuggingFace model locally (downloads once, then runs offline)
-        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
+        self.embedding_fn = embedding_fn or embedding_functions.SentenceTransformerEmbeddingFunction(
             model_name=EMBEDDING_MODEL
         )
-        
-        self.collection = self.client.get_or_create_collection(
-            name="active_session_docs",
-            embedding_function=self.embedding_fn
-        )
 
-    def add_document(self, filename, text_chunks):
+        self.backend = backend
+        names = partition_names(max(1, partitions))
+        if backend == "numpy":
+            from utils.numpy_store import NumpyCollection, NUMPY_STORE_DIR
+            self.client = None
+            store_dir = os.path.join(DB_PATH, NUMPY_STORE_DIR)
+            # Anything else in the store is from another layout (or the old single store)
+            for entry in os.listdir(store_dir) if os.path.isdir(store_dir) else []:
+                if entry not in names:
+                    stale = os.path.join(store_dir, entry)
+                    if os.path.isdir(stale):
+                        shutil.rmtree(stale, ignore_errors=True)
+                    else:
+                        os.remove(stale)
+            self.partitions = [NumpyCollection(os.path.join(store_dir, name), dtype=numpy_dtype) for name in names]
+        else:
+            # Absolute: Chroma caches clients by path string for the whole process
+            self.client = chromadb.PersistentClient(path=os.path.abspath(DB_PATH))
+            for collection in self.client.list_collections():
+                name = getattr(collection, "name", collection)
+                if name not in names:
+                    self.client.delete_collection(name)  # Other layout, or the old single collection
+            self.partitions = [
+                self.client.get_or_create_collection(name=name, embedding_function=self.embedding_fn)
+                for name in names
+            ]
+        # Chunks per partition, kept in memory: asking every collection would cost more than a small search
+        self._partition_counts = [p.count() for p in self.partitions]
+        # Global searches query every non-empty partition at once
+        self._search_pool = ThreadPoolExecutor(max_workers=min(len(self.partitions), os.cpu_count() or 4))
+
+        # Embeddings are computed here (not inside Chroma) so they can be cached
+        # Cache entries are tied to the model that produced them
+        model_name = getattr(embedding_fn, "model_name", type(embedding_fn).__name__) if embedding_fn else EMBEDDING_MODEL
+        self.embedding_cache = EmbeddingCache(model_name=model_name)
+
+        os.makedirs(DB_PATH, exist_ok=True)
+        self.documents = DocumentStore(DOCUMENT_STORE_PATH)
+
+        # BM25 over the same chunks: catches exact ids / codes that embeddings miss
+        self.dense_weight = dense_weight
+        self.lexical_weight = lexical_weight
+        # Indexing may run in a background thread while questions are answered
+        self._lexical_lock = threading.Lock()
+        self.lexical_index = BM25Index.load(LEXICAL_INDEX_PATH)
+        if len(self.lexical_index) != self.count():
+            self._rebuild_lexical_index()
+
+        # File-level routing vectors; chunk embeddings are summed per section
+        # until finish_document turns them into the file's entry. Routing is
+        # opt-in: the router is loaded and kept up to date only once a routed
+        # search needs it (see _routing_index), so flat setups pay nothing
+        self.route_files = route_files
+        self._sections = {}     # {source: {section: summed unit vectors}}
+        self.file_router = None
+        self._router_outdated = set()   # Files changed while the router was not loaded
+        self._router_lock = threading.Lock()
+        if route_files:
+            self._routing_index()
+
+    def partition(self, filename):
+        """The collection holding this file's chunks."""
+        return self.partitions[partition_index(filename, len(self.partitions))]
+
+    def count(self):
+        return sum(self._partition_counts)
+
+    def _recount(self, index):
+        self._partition_counts[index] = self.partitions[index].count()
+
+    def _rebuild_lexical_index(self):
+        """Re-derives the BM25 index from the chunks stored in the vector DB."""
+        self.lexical_index = BM25Index()
+        for partition in self.partitions:
+            stored = partition.get(include=["documents", "metadatas"])
+            texts = self._materialize(stored)
+            for doc_id, meta in zip(stored['ids'], stored['metadatas']):
+                if doc_id in texts:
+                    self.lexical_index.add(doc_id, meta["source"], texts[doc_id][0])
+
+    def _routing_index(self):
+        """
+        The FileRouter, loaded on first use and brought in line with the stored
+        files (files changed since it was saved, or an index saved before it existed).
+        """
+        with self._router_lock:
+            if self.file_router is None:
+                router = FileRouter.load(FILE_ROUTER_PATH)
+                for source in self._router_outdated:
+                    router.remove(source)
+                self._router_outdated.clear()
+                self.file_router = router
+                self._sync_file_router()
+        return self.file_router
+
+    def _sync_file_router(self):
+        """Adds / removes router entries so it covers exactly the stored files."""
+        with self._lexical_lock:
+            sources = set(self.lexical_index.doc_sources.values())
+        for source in [s for s in self.file_router.files if s not in sources]:
+            self.file_router.remove(source)
+        for source in sorted(sources):
+            if source not in self.file_router:
+                self._profile_file(source)
+
+    def _collect_sections(self, metadatas, vectors):
+        if self.file_router is None:
+            return  # Routing not in use
+        with self._lexical_lock:
+            for meta, vector in zip(metadatas, vectors):
+                if meta["chunk_index"] == 0:
+                    self._sections[meta["source"]] = {}  # The file is (re-)indexed from the start
+                sections = self._sections.get(meta["source"])
+                if sections is None:
+                    continue  # Started before the router was loaded: profiled from its stored chunks
+                _add_to_section(sections, meta["chunk_index"], vector)
+
+    def _profile_file(self, filename):
+        """Routing vectors of a stored file: name + leading text, then one per section."""
+        with self._lexical_lock:
+            sections = self._sections.pop(filename, None)
+        if sections is None:
+            # Sections not collected while indexing: sum them from the stored chunks
+            stored = self.partition(filename).get(where={"source": filename}, include=["documents", "metadatas"])
+            texts = self._materialize(stored)
+            rows = sorted((meta["chunk_index"], doc_id) for doc_id, meta in zip(stored['ids'], stored['metadatas'])
+                          if doc_id in texts)
+            sections = {}
+            for (chunk_index, _), vector in zip(rows, self.embed([texts[doc_id][0] for _, doc_id in rows])):
+                _add_to_section(sections, chunk_index, vector)
+        head = self.documents.read_head(filename, PROFILE_CHARS)
+        if head is None:  # Text not stored: the first chunk is the next best thing
+            first = self._materialize(self.partition(filename).get(ids=[f"{filename}_0"], include=["documents", "metadatas"]))
+            head = next(iter(first.values()), ("", None))[0][:PROFILE_CHARS]
+        vectors = self.embed([f"{filename}\n{head}"]) + [sections[s] for s in sorted(sections)]
+        self.file_router.set(filename, vectors)
+
+    def _materialize(self, stored):
+        """
+        Text of fetched chunks (a get() result with documents + metadatas):
+        {id: (text, span)}, span = (rev, start, end) or None for a chunk stored
+        with its own text. Chunks whose revision is gone (file re-indexed
+        meanwhile) are left out.
+        """
+        texts = {}
+        for doc_id, doc, meta in zip(stored['ids'], stored['documents'], stored['metadatas']):
+            if "rev" not in meta:
+                texts[doc_id] = (doc, None)
+                continue
+            text = self.documents.read(meta["source"], meta["rev"], meta["start"], meta["end"])
+            if text is not None:
+                texts[doc_id] = (text, (meta["rev"], meta["start"], meta["end"]))
+        return texts
+
+    def read_span(self, source, rev, start, end):
+        """Exact text between two offsets of a stored file (e.g. several adjacent chunks)."""
+        return self.documents.read(source, rev, start, end)
+
+    def get_document_text(self, filename):
+        """The file's stored text, or None (not indexed, or indexed before text was stored)."""
+        return self.documents.read_document(filename)
+
+    def save(self):
+        """Persists the lexical index next to the Chroma files (and flushes the numpy store)."""
+        os.makedirs(DB_PATH, exist_ok=True)
+        if self.backend == "numpy":
+            for partition in self.partitions:
+                partition.flush()
+        with self._lexical_lock:
+            self.lexical_index.save(LEXICAL_INDEX_PATH)
+        with self._router_lock:
+            if self.file_router is not None:
+                self.file_router.save(FILE_ROUTER_PATH)
+            elif self._router_outdated and os.path.exists(FILE_ROUTER_PATH):
+                # Not loaded this run: only drop the entries that went stale
+                router = FileRouter.load(FILE_ROUTER_PATH)
+                for source in self._router_outdated:
+                    router.remove(source)
+                router.save(FILE_ROUTER_PATH)
+                self._router_outdated.clear()
+
+    def embed(self, texts):
+        """
+        Embeds texts, running the model only on text not seen before.
+        Identical texts inside one batch are embedded once.
+        """
+        with span("vector.embed", texts=len(texts)) as s:
+            vectors = self.embedding_cache.get_many(texts)
+            missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+            if missing:
+                new_vectors = self.embedding_fn(missing)
+                self.embedding_cache.put_many(missing, new_vectors)
+                fresh = {t: np.asarray(v, dtype=np.float32) for t, v in zip(missing, new_vectors)}
+                vectors = [fresh[t] if v is None else v for t, v in zip(texts, vectors)]
+            s.set(computed=len(missing), chars=sum(len(t) for t in missing))
+        return vectors
+
+    def add_document(self, filename, text_chunks, spans=None, text=None):
         """
         Adds chunks to the vector index with metadata.
+        spans + text: (start, end) of each chunk in text; the text is then
+        stored once and the chunks as spans of it (see finish_document).
+        Returns the new text revision, or None.
         """
         if not text_chunks:
+            return None
+
+        with span("vector.add_document", chunks=len(text_chunks)):
+            revision = None
+            if spans is not None and text is not None:
+                revision = self.documents.begin(filename)
+                self.documents.append(filename, revision, text)
+            ids, metadatas = chunk_records(filename, len(text_chunks), spans=spans, revision=revision)
+            self.add_chunks(ids, text_chunks, metadatas)
+        return revision
+
+    def finish_document(self, filename, revision=None):
+        """
+        All chunks of the file are stored: older revisions of its text go,
+        and its routing vectors are (re)computed if routing is in use.
+        """
+        if revision is not None:
+            self.documents.finish(filename, revision)
+        self._update_router(filename, self._profile_file)
+
+    def _update_router(self, filename, update):
+        """Applies update(filename) to the router, or remembers the file is outdated in the saved one."""
+        with self._router_lock:
+            if self.file_router is None:
+                self._router_outdated.add(filename)
+                return
+        update(filename)
+
+    def add_chunks(self, ids, text_chunks, metadatas):
+        """
+        Adds a ready-made batch of chunks. The batch may mix chunks of several
+        files (used by the ingestion pipeline to embed in large batches).
+        """
+        if not ids:
             return
 
-        ids = [f"{filename}_{i}" for i in range(len(text_chunks))]
-        metadatas = [{"source": filename, "chunk_index": i} for i in range(len(text_chunks))]
-        
-        self.collection.add(
-            documents=text_chunks,
-            ids=ids,
-            metadatas=metadatas
-        )
+        with span("vector.add_chunks", chunks=len(ids), chars=sum(len(t) for t in text_chunks)):
+            embeddings = self.embed(text_chunks)
+            # A batch may span files, hence partitions: one upsert per partition
+            groups = {}
+            for i, meta in enumerate(metadatas):
+                groups.setdefault(partition_index(meta["source"], len(self.partitions)), []).append(i)
+            for index, rows in groups.items():
+                # upsert: Re-adding a file into a persistent DB must not fail on existing ids
+                self.partitions[index].upsert(
+                    # Span chunks: the text lives once in self.documents
+                    documents=["" if "rev" in metadatas[i] else text_chunks[i] for i in rows],
+                    embeddings=[embeddings[i] for i in rows],
+                    ids=[ids[i] for i in rows],
+                    metadatas=[metadatas[i] for i in rows],
+                )
+                self._recount(index)
+            with self._lexical_lock:
+                for doc_id, text, meta in zip(ids, text_chunks, metadatas):
+                    self.lexical_index.add(doc_id, meta["source"], text)
+            self._collect_sections(metadatas, embeddings)
+
+    def delete_document(self, filename, chunk_count, start=0):
+        """
+        Removes a file's chunks using their deterministic '{filename}_{i}' ids.
+        start: First chunk index to remove (> 0 trims the tail of a shrunk file;
+               0 also removes the file's stored text).
+        """
+        if start == 0:
+            self.documents.delete(filename)
+            self._update_router(filename, lambda source: self.file_router.remove(source))
+            with self._lexical_lock:
+                self._sections.pop(filename, None)
+        if chunk_count <= start:
+            return
+        ids = [f"{filename}_{i}" for i in range(start, chunk_count)]
+        index = partition_index(filename, len(self.partitions))
+        self.partitions[index].delete(ids=ids)
+        self._recount(index)
+        with self._lexical_lock:
+            self.lexical_index.remove(ids)
+
+    def get_document_chunks(self, filename):
+        """
+        Returns all stored chunks of a file, ordered by chunk_index.
+        """
+        results = self.partition(filename).get(where={"source": filename}, include=["documents", "metadatas"])
+        texts = self._materialize(results)
+        pairs = sorted((meta["chunk_index"], texts[doc_id][0])
+                       for doc_id, meta in zip(results['ids'], results['metadatas']) if doc_id in texts)
+        return [doc for _, doc in pairs]
 
     def search(self, query, n_results=5, file_filter=None):
         """
-        Search with optional file filtering.
+        Hybrid search with optional file filtering (one filename, or a list).
+        Dense and BM25 candidates are merged with Reciprocal Rank Fusion.
+        Without a filter, large corpora are searched in two stages (see ROUTE_FILES).
         """
-        if self.collection.count() == 0:
-            return []
+        return [hit[1] for hit in self._traced_search([query], n_results, file_filter)[0]]
 
-        # Prepare filter query if a specific file is requested
-        where_clause = {"source": file_filter} if file_filter else None
+    def search_chunks(self, query, n_results=5, file_filter=None):
+        """
+        Same as search, but each hit is a dict {"id", "source", "chunk_index", "text",
+        "score", "lexical_rank"} so callers can tell which chunks are neighbours in
+        the same file. score: fused relevance, 0-1 (see reciprocal_rank_scores);
+        lexical_rank: 0-based BM25 rank, None if BM25 did not find it.
+        Chunks stored as spans also carry "rev", "start" and "end" (see read_span).
+        """
+        return self.search_chunks_many([query], n_results, file_filter)[0]
 
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results,
-            where=where_clause  # <--- This forces the DB to look at the specific file
-        )
-        
-        # Check if we got results
-        if not results['documents']:
+    def search_chunks_many(self, queries, n_results=5, file_filter=None):
+        """
+        search_chunks for several queries at once: one embedding batch and one
+        multi-query call per partition instead of one round per query.
+        Returns one hit list per query.
+        """
+        results = []
+        for hits in self._traced_search(queries, n_results, file_filter):
+            chunks = []
+            for doc_id, doc, location, score, lexical_rank in hits:
+                source, chunk_index = parse_chunk_id(doc_id)
+                chunk = {"id": doc_id, "source": source, "chunk_index": chunk_index, "text": doc,
+                         "score": score, "lexical_rank": lexical_rank}
+                if location:
+                    chunk.update(zip(("rev", "start", "end"), location))
+                chunks.append(chunk)
+            results.append(chunks)
+        return results
+
+    def _traced_search(self, queries, n_results, file_filter):
+        with span("vector.search", n_results=n_results, focused=file_filter is not None, queries=len(queries)) as s:
+            results = self._search(queries, n_results, file_filter)
+            s.set(results=sum(len(hits) for hits in results),
+                  chars=sum(len(hit[1]) for hits in results for hit in hits))
+        return results
+
+    def dense_search(self, query_vector, n_results, file_filter=None):
+        """
+        Top-n chunks by embedding distance as [(id, document, distance)].
+        Focused: only the file's partition. Global: all non-empty partitions
+        in parallel, each returning its own top-n (ids + distances only),
+        merged by distance; documents are then fetched for the winners only.
+        """
+        return self.dense_search_many([query_vector], n_results, file_filter)[0]
+
+    def dense_search_many(self, query_vectors, n_results, file_filter=None):
+        """dense_search for several query vectors, one query call per partition."""
+        all_hits, texts = self._dense_hits(query_vectors, n_results, file_filter)
+        return [
+            [(doc_id, texts[doc_id][0], distance) for doc_id, distance in hits if doc_id in texts]
+            for hits in all_hits
+        ]
+
+    def _dense_hits(self, query_vectors, n_results, file_filter):
+        """-> per query [(id, distance)], and {id: (text, span)} for all of them."""
+        wheres = {}
+        if file_filter:
+            files = {}
+            for filename in [file_filter] if isinstance(file_filter, str) else file_filter:
+                files.setdefault(partition_index(filename, len(self.partitions)), []).append(filename)
+            # The partitions may hold other files too
+            for index, names in files.items():
+                wheres[index] = {"source": names[0]} if len(names) == 1 else {"source": {"$in": names}}
+            targets = sorted(wheres)
+        else:
+            targets = [i for i, count in enumerate(self._partition_counts) if count]
+
+        def query(index):
+            results = self.partitions[index].query(
+                query_embeddings=list(query_vectors), n_results=n_results, where=wheres.get(index), include=["distances"],
+            )
+            if not results['ids']:
+                return [[] for _ in query_vectors]
+            return [
+                [(doc_id, index, distance) for doc_id, distance in zip(ids, distances)]
+                for ids, distances in zip(results['ids'], results['distances'])
+            ]
+
+        with span("vector.search.dense", partitions=len(targets), queries=len(query_vectors)):
+            if len(targets) > 1:
+                per_partition = list(self._search_pool.map(query, targets))
+            else:
+                per_partition = [query(index) for index in targets]
+            all_hits = []
+            for i in range(len(query_vectors)):
+                hits = [hit for part in per_partition for hit in part[i]]
+                hits.sort(key=lambda hit: hit[2])
+                all_hits.append(hits[:n_results])
+
+            by_partition = {}
+            for hits in all_hits:
+                for doc_id, index, _ in hits:
+                    by_partition.setdefault(index, set()).add(doc_id)
+            texts = {}
+            for index, doc_ids in by_partition.items():
+                fetched = self.partitions[index].get(ids=sorted(doc_ids), include=["documents", "metadatas"])
+                texts.update(self._materialize(fetched))
+        return [[(doc_id, distance) for doc_id, _, distance in hits] for hits in all_hits], texts
+
+    def _search(self, queries, n_results, file_filter):
+        if self.count() == 0:
+            return [[] for _ in queries]
+
+        # Each leg ranks a deeper pool than requested, so fusion has room to reorder
+        pool_size = max(n_results * 3, 20)
+
+        query_vectors = self.embed(queries)
+        if file_filter is None and self.route_files and len(self._routing_index()) > ROUTE_MIN_FILES:
+            return self._routed_search(queries, query_vectors, n_results, pool_size)
+        return self._search_vectors(queries, query_vectors, n_results, pool_size, file_filter)
+
+    def _routed_search(self, queries, query_vectors, n_results, pool_size):
+        """
+        Global search in two stages: each query's candidate files first, then
+        its chunks inside them. Queries that picked the same files share a search.
+        """
+        with span("vector.route", files=len(self.file_router), queries=len(queries)) as s:
+            routes = self.file_router.route(query_vectors, self.route_files)
+            with self._lexical_lock:
+                # Chunks stored but no routing vectors yet (still being indexed): always searched
+                unprofiled = list(self._sections)
+                if self.lexical_weight:
+                    # Files holding an exact id / code from the query, which file vectors cannot know about
+                    for query, files in zip(queries, routes):
+                        hits = self.lexical_index.search_sources(query, max(1, self.route_files // 2))
+                        files += [source for source, score in hits if score >= hits[0][1] * LEXICAL_MIN_SCORE_RATIO]
+            routes = [tuple(sorted(set(files).union(unprofiled))) for files in routes]
+            s.set(picked=round(sum(len(files) for files in routes) / len(routes), 1))
+
+        groups = {}
+        for i, files in enumerate(routes):
+            groups.setdefault(files, []).append(i)
+        results = [[] for _ in queries]
+        for files, indexes in groups.items():
+            found = self._search_vectors(
+                [queries[i] for i in indexes], [query_vectors[i] for i in indexes], n_results, pool_size, list(files),
+            )
+            for i, hits in zip(indexes, found):
+                results[i] = hits
+        return results
+
+    def _search_vectors(self, queries, query_vectors, n_results, pool_size, file_filter):
+        all_hits, texts = self._dense_hits(query_vectors, pool_size if self.lexical_weight else n_results, file_filter)
+        all_hits = [[doc_id for doc_id, _ in hits if doc_id in texts] for hits in all_hits]
+        if not self.lexical_weight:
+            return [
+                [(doc_id, *texts[doc_id], score, None) for doc_id, score in reciprocal_rank_scores([hits], [1.0], k=RRF_K)]
+                for hits in all_hits
+            ]
+        return [self._fuse(query, hits, texts, n_results, pool_size, file_filter) for query, hits in zip(queries, all_hits)]
+
+    def _fuse(self, query, hits, texts, n_results, pool_size, file_filter):
+        """
+        Merges one query's dense hits (ids) with its BM25 hits (RRF)
+        -> [(id, document, span, fused score, BM25 rank or None)].
+        texts: {id: (text, span)}, shared by the queries.
+        Either leg may come back empty (e.g. no dense hit inside the filter):
+        the other one is used alone.
+        """
+        with span("vector.search.lexical"), self._lexical_lock:
+            lexical_hits = self.lexical_index.search(query, pool_size, source=file_filter)
+        lexical_ids = [
+            doc_id for doc_id, score in lexical_hits
+            if score >= lexical_hits[0][1] * LEXICAL_MIN_SCORE_RATIO
+        ]
+        if not hits and not lexical_ids:
             return []
-            
-        return results['documents'][0]
\ No newline at end of file
+        fused = reciprocal_rank_scores(
+            [hits, lexical_ids],
+            [self.dense_weight, self.lexical_weight],
+            k=RRF_K,
+        )[:n_results]
+        fused_ids = [doc_id for doc_id, _ in fused]
+
+        # Lexical-only hits are not in the dense result set yet
+        missing = [doc_id for doc_id in fused_ids if doc_id not in texts]
+        if missing:
+            by_source = {}
+            with self._lexical_lock:
+                for doc_id in missing:
+                    by_source.setdefault(self.lexical_index.doc_sources.get(doc_id), []).append(doc_id)
+            for source, doc_ids in by_source.items():
+                if source is None:
+                    continue  # Deleted since the lexical search
+                fetched = self.partition(source).get(ids=doc_ids, include=["documents", "metadatas"])
+                texts.update(self._materialize(fetched))
+        lexical_ranks = {doc_id: rank for rank, doc_id in enumerate(lexical_ids)}
+        return [(doc_id, *texts[doc_id], score, lexical_ranks.get(doc_id)) for doc_id, score in fused if doc_id in texts]